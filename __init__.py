@@ -204,6 +204,7 @@ classes = (
     weight_reaction_diffusion.TISSUE_PT_reaction_diffusion_cache,
     weight_reaction_diffusion.reset_reaction_diffusion_weight,
     weight_tools.formula_prop,
+    weight_tools.edges_deformation_prop,
     weight_reaction_diffusion.reaction_diffusion_prop,
     weight_tools.weight_formula,
     weight_tools.update_weight_formula,
@@ -243,7 +244,10 @@ classes = (
     texture_reaction_diffusion.tex_reaction_diffusion_prop,
     texture_reaction_diffusion.start_tex_reaction_diffusion,
     texture_reaction_diffusion.reset_tex_reaction_diffusion,
+    texture_reaction_diffusion.bake_tex_reaction_diffusion,
+    texture_reaction_diffusion.tex_reaction_diffusion_free_data,
     texture_reaction_diffusion.TISSUE_PT_tex_reaction_diffusion,
+    texture_reaction_diffusion.TISSUE_PT_tex_reaction_diffusion_cache,
     texture_reaction_diffusion.TISSUE_PT_tex_reaction_diffusion_images
 )
 
@@ -270,6 +274,9 @@ def register():
     bpy.types.Object.formula_settings = CollectionProperty(
                                             type=weight_tools.formula_prop
                                             )
+    bpy.types.Object.edges_deformation_settings = PointerProperty(
+                                            type=weight_tools.edges_deformation_prop
+                                            )
     bpy.types.Object.reaction_diffusion_settings = PointerProperty(
                         type=weight_reaction_diffusion.reaction_diffusion_prop
                         )
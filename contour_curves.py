@@ -2,7 +2,7 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
-import bpy, bmesh, os
+import bpy, os
 import numpy as np
 import math, timeit, time
 from math import pi
@@ -208,6 +208,7 @@ class tissue_contour_curves_prop(PropertyGroup):
             ('WEIGHT', "Weight", "Contour based on a Vertex Group"),
             ('ATTRIBUTE', "Attribute", "Contour based on an Attribute (Vertex > Float)"),
             ('GEODESIC', "Geodesic Distance", "Contour based on the geodesic distance from the chosen vertices"),
+            ('HEAT', "Heat Distance", "Contour based on the geodesic distance from the chosen vertices, computed with the Heat Method. Smooth, and fast for repeated updates"),
             ('TOPOLOGY', "Topology Distance", "Contour based on the topology distance from the chosen vertices")
             ),
         default='VECTOR',
@@ -433,6 +434,7 @@ class tissue_weight_contour_curves_pattern(Operator):
             ('WEIGHT', "Weight", "Contour based on a Vertex Group"),
             ('ATTRIBUTE', "Attribute", "Contour based on an Attribute (Vertex > Float)"),
             ('GEODESIC', "Geodesic Distance", "Contour based on the geodesic distance from the chosen vertices"),
+            ('HEAT', "Heat Distance", "Contour based on the geodesic distance from the chosen vertices, computed with the Heat Method. Smooth, and fast for repeated updates"),
             ('TOPOLOGY', "Topology Distance", "Contour based on the topology distance from the chosen vertices")
             ),
         default='VECTOR',
@@ -524,7 +526,7 @@ class tissue_weight_contour_curves_pattern(Operator):
                 is_attribute = False
             if not is_attribute:
                  col.label(text="Please select a (Vertex > Float) Attribute for contouring.", icon='ERROR')
-        elif self.contour_mode in ('TOPOLOGY','GEODESIC'):
+        elif self.contour_mode in ('TOPOLOGY','GEODESIC','HEAT'):
             col.prop(self, "seeds_mode", text="Seeds")
             if self.seeds_mode == 'WEIGHT':
                 col.prop_search(self, 'vertex_group_seed', ob, "vertex_groups", text='Group')
@@ -535,7 +537,7 @@ class tissue_weight_contour_curves_pattern(Operator):
         if self.contour_mode == 'OBJECT':
             col.prop(self,'contour_offset')
             col.prop(self,'n_curves', text='Max Curves')
-        elif self.contour_mode in ('VECTOR', 'GEODESIC', 'ATTRIBUTE'):
+        elif self.contour_mode in ('VECTOR', 'GEODESIC', 'HEAT', 'ATTRIBUTE'):
             col.prop(self,'contour_offset')
             row = col.row(align=True)
             row.prop(self,'min_value')
@@ -688,6 +690,12 @@ class tissue_update_contour_curves(Operator):
     bl_description = ("Update a previously generated Contour Curves object")
     bl_options = {'REGISTER', 'UNDO'}
 
+    use_cache : BoolProperty(
+        name="Use Cache", default=True,
+        description="Reuse the values of the previous update if the source geometry didn't change",
+        options={'SKIP_SAVE'}
+        )
+
     def execute(self, context):
         ob = context.object
         props = ob.tissue_contour_curves
@@ -697,144 +705,135 @@ class tissue_update_contour_curves(Operator):
         tt1 = time.time()
         tissue_time(None,'Tissue: Contour Curves of "{}"...'.format(ob.name), levels=0)
 
-        ob0 = convert_object_to_mesh(_ob0, apply_modifiers=props.use_modifiers)
-        ob0.name = "_tissue_tmp_ob0"
-        me0 = ob0.data
-
-        # generate new bmesh
-        bm = bmesh.new()
-        bm.from_mesh(me0)
-        n_verts = len(bm.verts)
-        vertices, normals = get_vertices_and_normals_numpy(me0)
+        # reuse the scalar field if only the contour parameters changed
+        fingerprint, group_weights = None, None
+        if self.use_cache:
+            depsgraph = context.evaluated_depsgraph_get()
+            fingerprint, group_weights = contour_curves_fingerprint(_ob0, props, depsgraph)
+        field_key = contour_curves_field_key(_ob0, props)
+        cache = contour_curves_cache.get(ob.name)
+        if fingerprint and cache and cache['fingerprint'] == fingerprint and cache['field'] == field_key:
+            vertices, normals, edges, loops_edge, loops_face, weight, pattern_weight, \
+                bevel_weight, weight_bevel = cache['values']
+            tt1 = tissue_time(tt1, "Load cached values", levels=1)
+        else:
+            ob0 = convert_object_to_mesh(_ob0, apply_modifiers=props.use_modifiers)
+            ob0.name = "_tissue_tmp_ob0"
+            me0 = ob0.data
+            n_verts = len(me0.vertices)
+            if group_weights is None or any(len(w) != n_verts for w in group_weights.values()):
+                group_weights = get_contour_curves_weights(ob0, props)
+            vertices, normals = get_vertices_and_normals_numpy(me0)
+
+            if props.contour_mode == 'OBJECT':
+                try:
+                    vec_ob = props.contour_vector_object
+                    vec_ob_name = vec_ob.name
+                except:
+                    bpy.data.objects.remove(ob0)
+                    self.report({'ERROR'}, "Please select an target Object")
+                    return {'CANCELLED'}
 
-        if props.contour_mode == 'OBJECT':
-            try:
-                vec_ob = props.contour_vector_object
-                vec_ob_name = vec_ob.name
-            except:
-                bm.free()
-                bpy.data.objects.remove(ob0)
-                self.report({'ERROR'}, "Please select an target Object")
-                return {'CANCELLED'}
-
-        tt1 = tissue_time(tt1, "Load objects", levels=1)
-
-        # store weight values
-        if props.contour_mode in ('VECTOR','OBJECT'):
-            ob0_matrix = np.matrix(ob0.matrix_world.to_3x3().transposed())
-            global_verts = np.matmul(vertices,ob0_matrix)
-            global_verts += np.array(ob0.matrix_world.translation)
-            if props.contour_mode == 'OBJECT' and props.contour_vector_object:
-                vec_ob = props.contour_vector_object
-                global_verts -= np.array(vec_ob.matrix_world.translation)
-                vec_ob_matrix = np.matrix(vec_ob.matrix_world.to_3x3().inverted().transposed())
-                global_verts = np.matmul(global_verts,vec_ob_matrix)
-                weight = global_verts[:,2].A1
-            elif props.contour_mode == 'VECTOR':
-                vec = np.array(props.contour_vector)
-                vec_len = np.linalg.norm(vec)
-                if vec_len == 0:
-                    vec = np.array((0,0,1))
-                    vec_len = 1
-                else:
-                    vec /= vec_len
-                    vec_len = 1
-                global_verts = global_verts.A
-                projected_verts = global_verts * vec
-                projected_verts = np.sum(projected_verts,axis=1)[:,np.newaxis]
-                weight = projected_verts.reshape((-1))
-        elif props.contour_mode == 'WEIGHT':
-            try:
-                weight = get_weight_numpy(ob0.vertex_groups[props.vertex_group_contour], len(me0.vertices))
-            except:
-                bm.free()
-                bpy.data.objects.remove(ob0)
-                self.report({'ERROR'}, "Please select a Vertex Group for contouring")
-                return {'CANCELLED'}
-        elif props.contour_mode == 'ATTRIBUTE':
-            if props.contour_attribute in me0.attributes:
-                weight = [0]*n_verts
-                me0.attributes[props.contour_attribute].data.foreach_get('value',weight)
-                weight = np.array(weight)
-            else:
-                bm.free()
-                bpy.data.objects.remove(ob0)
-                self.report({'ERROR'}, "Please select a (Vertex > Float) Attribute for contouring")
-                return {'CANCELLED'}
-        elif props.contour_mode in ('GEODESIC','TOPOLOGY'):
-            cancel = False
-            weight = [None]*n_verts
-            seed_verts = []
-            bm.verts.ensure_lookup_table()
-            if props.seeds_mode == 'BOUND':
-                for v in bm.verts:
-                    if v.is_boundary:
-                        seed_verts.append(v)
-                        weight[v.index] = 0
-            if props.seeds_mode == 'SHARP':
-                for e, bme in zip(me0.edges, bm.edges):
-                    if e.use_edge_sharp:
-                        seed_verts.append(bme.verts[0])
-                        seed_verts.append(bme.verts[1])
-                seed_verts = list(set(seed_verts))
-                if len(seed_verts) == 0: cancel = True
-                for i in [v.index for v in seed_verts]:
-                    weight[i] = 0
-            if props.seeds_mode == 'WEIGHT':
+            tt1 = tissue_time(tt1, "Load objects", levels=1)
+
+            # store weight values
+            if props.contour_mode in ('VECTOR','OBJECT'):
+                ob0_matrix = np.matrix(ob0.matrix_world.to_3x3().transposed())
+                global_verts = np.matmul(vertices,ob0_matrix)
+                global_verts += np.array(ob0.matrix_world.translation)
+                if props.contour_mode == 'OBJECT' and props.contour_vector_object:
+                    vec_ob = props.contour_vector_object
+                    global_verts -= np.array(vec_ob.matrix_world.translation)
+                    vec_ob_matrix = np.matrix(vec_ob.matrix_world.to_3x3().inverted().transposed())
+                    global_verts = np.matmul(global_verts,vec_ob_matrix)
+                    weight = global_verts[:,2].A1
+                elif props.contour_mode == 'VECTOR':
+                    vec = np.array(props.contour_vector)
+                    vec_len = np.linalg.norm(vec)
+                    if vec_len == 0:
+                        vec = np.array((0,0,1))
+                        vec_len = 1
+                    else:
+                        vec /= vec_len
+                        vec_len = 1
+                    global_verts = global_verts.A
+                    projected_verts = global_verts * vec
+                    projected_verts = np.sum(projected_verts,axis=1)[:,np.newaxis]
+                    weight = projected_verts.reshape((-1))
+            elif props.contour_mode == 'WEIGHT':
                 try:
-                    seeds = get_weight_numpy(ob0.vertex_groups[props.vertex_group_seed], len(me0.vertices))
+                    weight = group_weights[props.vertex_group_contour]
                 except:
-                    bm.free()
                     bpy.data.objects.remove(ob0)
-                    self.report({'ERROR'}, "Please select a Vertex Group as seed")
+                    self.report({'ERROR'}, "Please select a Vertex Group for contouring")
+                    return {'CANCELLED'}
+            elif props.contour_mode == 'ATTRIBUTE':
+                if props.contour_attribute in me0.attributes:
+                    weight = [0]*n_verts
+                    me0.attributes[props.contour_attribute].data.foreach_get('value',weight)
+                    weight = np.array(weight)
+                else:
+                    bpy.data.objects.remove(ob0)
+                    self.report({'ERROR'}, "Please select a (Vertex > Float) Attribute for contouring")
+                    return {'CANCELLED'}
+            elif props.contour_mode in ('GEODESIC','HEAT','TOPOLOGY'):
+                if props.seeds_mode == 'BOUND':
+                    # vertices of the edges with a single polygon
+                    loops_edge, loops_face = get_loops_faces_numpy(me0)
+                    edges = get_edges_numpy(me0)
+                    n_link_faces = np.bincount(loops_edge, minlength=len(edges))
+                    seed_verts = np.unique(edges[n_link_faces == 1])
+                if props.seeds_mode == 'SHARP':
+                    edges = get_edges_numpy(me0)
+                    sharp = get_attribute_numpy(me0.edges, 'use_edge_sharp').astype('bool')
+                    seed_verts = np.unique(edges[sharp])
+                if props.seeds_mode == 'WEIGHT':
+                    try:
+                        seeds = group_weights[props.vertex_group_seed]
+                    except:
+                        bpy.data.objects.remove(ob0)
+                        self.report({'ERROR'}, "Please select a Vertex Group as seed")
+                        return {'CANCELLED'}
+                    seed_verts = np.flatnonzero(seeds > 0.999999)
+                if len(seed_verts)==0:
+                    bpy.data.objects.remove(ob0)
+                    self.report({'ERROR'}, "No seed vertices found")
                     return {'CANCELLED'}
-                for i,v in enumerate(bm.verts):
-                    if seeds[i]>0.999999:
-                        seed_verts.append(v)
-                        weight[i] = 0
-            if cancel or len(seed_verts)==0:
-                bm.free()
-                bpy.data.objects.remove(ob0)
-                self.report({'ERROR'}, "No seed vertices found")
-                return {'CANCELLED'}
-
-            weight = fill_neighbors_attribute(seed_verts, weight, props.contour_mode)
-            weight = np.array(weight)
-            print(weight[weight==None])
-            weight[weight==None] = 0
-            print(weight[weight==None])
 
-        try:
-            pattern_weight = get_weight_numpy(ob0.vertex_groups[props.vertex_group_pattern], len(me0.vertices))
-        except:
-            #self.report({'WARNING'}, "There is no Vertex Group assigned to the pattern displace")
-            pattern_weight = np.zeros(len(me0.vertices))
+                weight = geodesic_distance(me0, seed_verts, props.contour_mode, vertices)
+                weight[weight == inf] = 0
 
-        weight_bevel = False
-        if props.variable_bevel:
             try:
-                bevel_weight = get_weight_numpy(ob0.vertex_groups[props.vertex_group_bevel], len(me0.vertices))
-                weight_bevel = True
+                pattern_weight = group_weights[props.vertex_group_pattern]
             except:
-                bevel_weight = np.ones(len(me0.vertices))
-        else:
-            bevel_weight = np.ones(len(me0.vertices))
+                #self.report({'WARNING'}, "There is no Vertex Group assigned to the pattern displace")
+                pattern_weight = np.zeros(len(me0.vertices))
 
-        total_verts = np.zeros((0,3))
-        total_radii = np.zeros((0,1))
-        total_edges_index = np.zeros((0)).astype('int')
-        total_segments = []# np.array([])
-        radius = []
-
-        tt1 = tissue_time(tt1, "Compute values", levels=1)
+            weight_bevel = False
+            if props.variable_bevel:
+                try:
+                    bevel_weight = group_weights[props.vertex_group_bevel]
+                    weight_bevel = True
+                except:
+                    bevel_weight = np.ones(len(me0.vertices))
+            else:
+                bevel_weight = np.ones(len(me0.vertices))
 
-        # start iterate contours levels
-        filtered_edges = get_edges_id_numpy(me0)
+            edges = get_edges_numpy(me0)
+            loops_edge, loops_face = get_loops_faces_numpy(me0)
+            if fingerprint:
+                contour_curves_cache[ob.name] = {
+                    'fingerprint' : fingerprint,
+                    'field' : field_key,
+                    'values' : (vertices, normals, edges, loops_edge, loops_face,
+                        weight, pattern_weight, bevel_weight, weight_bevel)
+                    }
+            tt1 = tissue_time(tt1, "Compute values", levels=1)
 
         min_value = props.min_value
         max_value = props.min_value + props.range_value
 
-        if props.contour_mode in ('VECTOR','OBJECT','GEODESIC','ATTRIBUTE'):
+        if props.contour_mode in ('VECTOR','OBJECT','GEODESIC','HEAT','ATTRIBUTE'):
             delta_iso = props.contour_offset
             n_curves = min(int((np.max(weight)-props.min_value)/delta_iso)+1, props.n_curves)
         else:
@@ -845,94 +844,19 @@ class tissue_update_contour_curves(Operator):
         if props.contour_mode == 'TOPOLOGY':
             weight = weight/np.max(weight)
 
-        if False:
-            edges_verts = get_attribute_numpy(me0.edges,"vertices",mult=2).astype('int')
-            edges_vec = vertices[edges_verts[:,0]]-vertices[edges_verts[:,1]]
-            #edges_vec = global_verts[edges_verts[:,0]]-global_verts[edges_verts[:,1]]
-            edges_length = np.linalg.norm(edges_vec,axis=1)
-            edges_vec /= edges_length[:,np.newaxis]
-            edges_dw = np.abs(weight[edges_verts[:,0]]-weight[edges_verts[:,1]])
-            edges_bevel = delta_iso*edges_length/edges_dw/2*0 + 1
-
-        '''
-        # numpy method
-        faces_n_verts = get_attribute_numpy(me0.polygons, attribute='loop_total').astype('int')
-        faces_verts = get_attribute_numpy(me0.polygons, attribute='vertices', size=np.sum(faces_n_verts)).astype('int')
-        faces_weight = weight[faces_verts]
-        faces_weight = np.split(faces_weight, np.cumsum(faces_n_verts)[:-1])
-        '''
-        faces_weight = [np.array([weight[v] for v in p.vertices]) for p in me0.polygons]
-        try:
-            fw_min = np.min(faces_weight, axis=1)
-            fw_max = np.max(faces_weight, axis=1)
-        except:
-            # necessary for irregular meshes
-            fw_min = np.array([min(fw) for fw in faces_weight])
-            fw_max = np.array([max(fw) for fw in faces_weight])
-        bm_faces = np.array(bm.faces)
-
-        tt1 = tissue_time(tt1, "Compute face values", levels=1)
-        for c in range(n_curves):
-            if delta_iso:
-                iso_val = c*delta_iso + min_value
-            else:
-                iso_val = min_value + range_value/2
-            if iso_val > max_value: break
-
-            # remove passed faces
-            bool_mask = iso_val <= fw_max
-            bm_faces = bm_faces[bool_mask]
-            fw_min = fw_min[bool_mask]
-            fw_max = fw_max[bool_mask]
-
-            # mask faces
-            bool_mask = fw_min <= iso_val
-            faces_mask = bm_faces[bool_mask]
-
-            count = len(total_verts)
-
-            if not weight_bevel and props.variable_bevel:
-                bevel_weight = np.full(n_verts, c/n_curves)
-            new_filtered_edges, edges_index, verts, bevel = contour_edges_pattern(props, c, len(total_verts), iso_val, vertices, normals, filtered_edges, weight, pattern_weight, bevel_weight)
-            #bevel = edges_bevel[edges_index][:,np.newaxis]
-
-            if len(edges_index) > 0:
-                if props.variable_bevel and props.max_bevel_depth != props.min_bevel_depth and False:
-                    #min_radius = min(props.min_bevel_depth, props.max_bevel_depth)
-                    #max_radius = max(props.min_bevel_depth, props.max_bevel_depth)
-                    min_radius = props.min_bevel_depth
-                    max_radius = props.max_bevel_depth
-                    min_radius = min_radius / max(0.0001,max_radius)
-                    radii = min_radius + bevel*(1 - min_radius)
-                else:
-                    radii = bevel
-            else:
-                continue
-
-            if verts[0,0] == None: continue
-            else: filtered_edges = new_filtered_edges
-            edges_id = {}
-            for i, id in enumerate(edges_index): edges_id[id] = i + count
-
-            if len(verts) == 0: continue
-
-            # finding segments
-            segments = []
-            for f in faces_mask:
-                seg = []
-                for e in f.edges:
-                    try:
-                        #seg.append(new_ids[np.where(edges_index == e.index)[0][0]])
-                        seg.append(edges_id[e.index])
-                        if len(seg) == 2:
-                            segments.append(seg)
-                            seg = []
-                    except: pass
-
-            total_segments = total_segments + segments
-            total_verts = np.concatenate((total_verts, verts))
-            total_radii = np.concatenate((total_radii, radii))
-            total_edges_index = np.concatenate((total_edges_index, edges_index))
+        if delta_iso:
+            iso_values = np.arange(n_curves)*delta_iso + min_value
+        else:
+            iso_values = np.array((min_value + props.range_value/2,))
+        iso_values = iso_values[iso_values <= max_value]
+
+        # compute all contour levels at once
+        total_edges_index, levels, param, total_segments = contour_edges_levels(
+            weight, edges, iso_values, loops_edge, loops_face)
+        total_verts, total_radii = contour_edges_pattern(props, edges, total_edges_index,
+            levels, param, vertices, normals, pattern_weight, bevel_weight)
+        if not weight_bevel and props.variable_bevel:
+            total_radii = (levels/n_curves)[:,np.newaxis]
         tt1 = tissue_time(tt1, "Compute curves", levels=1)
 
         if len(total_segments) > 0:
@@ -950,7 +874,7 @@ class tissue_update_contour_curves(Operator):
             ob.data.splines.clear()
             if props.variable_bevel:# and not weight_bevel:
                 total_radii = np.interp(total_radii, (total_radii.min(), total_radii.max()), (props.min_bevel_depth, props.max_bevel_depth))
-            ob.data = curve_from_pydata(total_verts, total_radii, ordered_points, ob0.name + '_ContourCurves', props.remove_open_curves, merge_distance=props.clean_distance, only_data=True, curve=ob.data, spline_type=props.spline_type)
+            ob.data = curve_from_pydata(total_verts, total_radii, ordered_points, _ob0.name + '_ContourCurves', props.remove_open_curves, merge_distance=props.clean_distance, only_data=True, curve=ob.data, spline_type=props.spline_type)
             #context.view_layer.objects.active = crv
             if props.variable_bevel:
                 if not weight_bevel:
@@ -961,7 +885,6 @@ class tissue_update_contour_curves(Operator):
         else:
             ob.data.splines.clear()
             pass
-        bm.free()
         for o in bpy.data.objects:
             if '_tissue_tmp_' in o.name:
                 bpy.data.objects.remove(o)
@@ -1037,7 +960,7 @@ class TISSUE_PT_contour_curves(Panel):
                 is_attribute = False
             if not is_attribute:
                  col.label(text="Please select a (Vertex > Float) Attribute for contouring.", icon='ERROR')
-        elif props.contour_mode in ('TOPOLOGY','GEODESIC'):
+        elif props.contour_mode in ('TOPOLOGY','GEODESIC','HEAT'):
             col.prop(props, "seeds_mode", text="Seeds")
             if props.seeds_mode == 'WEIGHT':
                 col.prop_search(props, 'vertex_group_seed', ob0, "vertex_groups", text='Group')
@@ -1048,7 +971,7 @@ class TISSUE_PT_contour_curves(Panel):
         if props.contour_mode == 'OBJECT':
             col.prop(props,'contour_offset')
             col.prop(props,'n_curves', text='Max Curves')
-        elif props.contour_mode in ('VECTOR','GEODESIC','ATTRIBUTE'):
+        elif props.contour_mode in ('VECTOR','GEODESIC','HEAT','ATTRIBUTE'):
             col.prop(props,'contour_offset')
             row = col.row(align=True)
             row.prop(props,'min_value')
@@ -1095,48 +1018,98 @@ class TISSUE_PT_contour_curves(Panel):
         col.prop(props,'clean_distance')
         col.prop(props,'remove_open_curves')
 
-def contour_edges_pattern(operator, c, verts_count, iso_val, vertices, normals, filtered_edges, weight, pattern_weight, bevel_weight):
+contour_curves_cache = {}
+
+def get_contour_curves_weights(ob, props):
+    '''
+    Weights of the Vertex Groups used by the Contour Curves, read at once
+    and stored by name.
+    '''
+    names = (props.vertex_group_contour, props.vertex_group_seed,
+        props.vertex_group_pattern, props.vertex_group_bevel)
+    names = [name for name in dict.fromkeys(names) if name in ob.vertex_groups]
+    if len(names) == 0: return {}
+    weights = get_weights_numpy(ob, [ob.vertex_groups[name].index for name in names])
+    return dict(zip(names, weights))
+
+def contour_curves_fingerprint(ob, props, depsgraph):
+    '''
+    Fingerprint of the source geometry, used for detecting when the cached
+    values of the Contour Curves are outdated. It is read from the evaluated
+    mesh (or from the original one if the modifiers are not used) without
+    converting the object, and it includes the sharp edges and the weights
+    of the Vertex Groups used by the Contour Curves.
+    Returns the fingerprint and the weights stored by name.
+    '''
+    ob_eval = ob.evaluated_get(depsgraph) if props.use_modifiers else ob
+    if ob.type == 'MESH':
+        me = ob_eval.data
+        group_weights = get_contour_curves_weights(ob_eval, props)
+    else:
+        me = ob_eval.to_mesh()
+        group_weights = {}
+    vertices = get_vertices_numpy(me)
+    edges = get_edges_numpy(me)
+    sharp = get_attribute_numpy(me.edges, 'use_edge_sharp').astype('bool')
+    fingerprint = [len(me.polygons), hash(vertices.tobytes()), hash(edges.tobytes()),
+        hash(sharp.tobytes())]
+    if props.contour_mode == 'ATTRIBUTE' and props.contour_attribute in me.attributes:
+        attribute = me.attributes[props.contour_attribute]
+        values = [0]*len(attribute.data)
+        attribute.data.foreach_get('value', values)
+        fingerprint.append(hash(tuple(values)))
+    for name in sorted(group_weights):
+        fingerprint.append(hash(group_weights[name].tobytes()))
+    if ob.type != 'MESH': ob_eval.to_mesh_clear()
+    return tuple(fingerprint), group_weights
+
+def contour_curves_field_key(ob, props):
+    '''
+    Settings and transformations that define the values used for contouring.
+    '''
+    key = [ob.name, props.contour_mode, props.use_modifiers,
+        props.vertex_group_pattern, props.variable_bevel, props.vertex_group_bevel]
+    if props.contour_mode in ('VECTOR','OBJECT'):
+        key.append(tuple(np.array(ob.matrix_world).flatten()))
+        if props.contour_mode == 'VECTOR':
+            key.append(tuple(props.contour_vector))
+        elif props.contour_vector_object:
+            vec_ob = props.contour_vector_object
+            key.append(vec_ob.name)
+            key.append(tuple(np.array(vec_ob.matrix_world).flatten()))
+    elif props.contour_mode == 'WEIGHT':
+        key.append(props.vertex_group_contour)
+    elif props.contour_mode == 'ATTRIBUTE':
+        key.append(props.contour_attribute)
+    else:
+        key.append(props.seeds_mode)
+        key.append(props.vertex_group_seed)
+    return tuple(key)
+
+def contour_edges_pattern(operator, edges, edges_index, levels, param, vertices, normals, pattern_weight, bevel_weight):
     # vertices indexes
-    id0 = filtered_edges[:,0]
-    id1 = filtered_edges[:,1]
-    # vertices weight
-    w0 = weight[id0]
-    w1 = weight[id1]
-    # weight condition
-    bool_w0 = w0 <= iso_val
-    bool_w1 = w1 <= iso_val
-
-    # mask all edges that have one weight value below the iso value
-    mask_new_verts = np.logical_xor(bool_w0, bool_w1)
-    if not mask_new_verts.any():
-        return np.array([[None]]), {}, np.array([[None]]), np.array([[None]])
-
-    id0 = id0[mask_new_verts]
-    id1 = id1[mask_new_verts]
+    id0 = edges[edges_index,0]
+    id1 = edges[edges_index,1]
     # filter arrays
     v0 = vertices[id0]
     v1 = vertices[id1]
     n0 = normals[id0]
     n1 = normals[id1]
-    w0 = w0[mask_new_verts]
-    w1 = w1[mask_new_verts]
     pattern0 = pattern_weight[id0]
     pattern1 = pattern_weight[id1]
-    try:
-        bevel0 = bevel_weight[id0]
-        bevel1 = bevel_weight[id1]
-    except: pass
-
-    param = (iso_val - w0)/(w1-w0)
-    if c%(operator.in_steps + operator.out_steps) < operator.in_steps:
-        mult = operator.in_displace
+    bevel0 = bevel_weight[id0]
+    bevel1 = bevel_weight[id1]
+
+    # alternate inwards and outwards displacement according to the level
+    n_steps = operator.in_steps + operator.out_steps
+    if n_steps > 0:
+        mask_in = levels%n_steps < operator.in_steps
     else:
-        mult = operator.out_displace
+        mask_in = np.zeros(len(levels), dtype='bool')
+    mult = np.where(mask_in, operator.in_displace, operator.out_displace)
     pattern_value = pattern0 + (pattern1-pattern0)*param
-    try:
-        bevel_value = bevel0 + (bevel1-bevel0)*param
-        bevel_value = np.expand_dims(bevel_value,axis=1)
-    except: bevel_value = None
+    bevel_value = bevel0 + (bevel1-bevel0)*param
+    bevel_value = np.expand_dims(bevel_value,axis=1)
     disp = pattern_value * mult
 
     param = np.expand_dims(param,axis=1)
@@ -1146,11 +1119,4 @@ def contour_edges_pattern(operator, c, verts_count, iso_val, vertices, normals,
     axis = np.array((operator.displace_x, operator.displace_y, operator.displace_z))
     norm[:] *= axis
     verts = verts + norm*disp
-
-    # indexes of edges with new vertices
-    edges_index = filtered_edges[mask_new_verts][:,2]
-
-    # remove all edges completely below the iso value
-    #mask_edges = np.logical_not(np.logical_and(bool_w0, bool_w1))
-    #filtered_edges = filtered_edges[mask_edges]
-    return filtered_edges.astype("int"), edges_index, verts, bevel_value
+    return verts, bevel_value
@@ -12,6 +12,49 @@ import bmesh
 from .utils import *
 
 
+quad_methods = {
+    'BEAUTY' : 'BEAUTY',
+    'FIXED' : 'FIXED',
+    'FIXED_ALTERNATE' : 'ALTERNATE',
+    'SHORTEST_DIAGONAL' : 'SHORT_EDGE'
+    }
+polygon_methods = {
+    'BEAUTY' : 'BEAUTY',
+    'CLIP' : 'EAR_CLIP'
+    }
+
+def dual_mesh_from_mesh(me, name, quad_method='FIXED', polygon_method='BEAUTY', preserve_borders=True):
+    """
+    Create the dual of a mesh, after splitting its faces into triangles.
+    It doesn't need any context, so it can run in background.
+    :arg me: Mesh data.
+    :type me: :class:'bpy.types.Mesh'
+    :arg name: Name of the new mesh.
+    :type name: str
+    :arg quad_method: Method for splitting the quads (see dual_mesh).
+    :type quad_method: str
+    :arg polygon_method: Method for splitting the N-gons (see dual_mesh).
+    :type polygon_method: str
+    :arg preserve_borders: Keep the polygons of the boundary vertices.
+    :type preserve_borders: bool
+    :return: Mesh data of the dual.
+    :rtype: :class:'bpy.types.Mesh'
+    """
+    bm = bmesh.new()
+    bm.from_mesh(me)
+    bmesh.ops.triangulate(bm, faces=bm.faces[:],
+        quad_method=quad_methods[quad_method],
+        ngon_method=polygon_methods[polygon_method])
+    tris = np.array([[v.index for v in f.verts] for f in bm.faces], dtype='int')
+    bm.free()
+    verts, loops_vert, loop_total = dual_mesh_numpy(get_vertices_numpy(me),
+        tris, preserve_borders)
+    new_me = mesh_from_loops_numpy(name, verts, loops_vert, loop_total)
+    for mat in me.materials:
+        new_me.materials.append(mat)
+    return new_me
+
+
 class dual_mesh_tessellated(Operator):
     bl_idname = "object.dual_mesh_tessellated"
     bl_label = "Dual Mesh"
@@ -74,12 +117,15 @@ class dual_mesh_tessellated(Operator):
                 if abs(a-b) > 0.0001:
                     raise ValueError
         except:
-            me = bpy.data.meshes.new("Dual-Mesh")  # add a new mesh
-            me.from_pydata(verts, edges, faces)
-            me.update(calc_edges=True, calc_edges_loose=True)
-            if self.source_faces == 'QUAD': seams = (0,1,2,3,4,5,6,7)
-            else: seams = (0,1,2,3,4,5,6)
-            for i in seams: me.edges[i].use_seam = True
+            me = mesh_from_loops_numpy("Dual-Mesh", verts,
+                [i for f in faces for i in f], [len(f) for f in faces])
+            # the boundary edges are listed first
+            if self.source_faces == 'QUAD': seams = np.array(edges[:8])
+            else: seams = np.array(edges[:7])
+            edges_keys = np.sort(get_edges_numpy(me), axis=1)
+            seams = np.sort(seams, axis=1)
+            use_seam = np.any(np.all(edges_keys[:,None] == seams[None,:], axis=2), axis=1)
+            me.edges.foreach_set('use_seam', use_seam)
             ob1 = bpy.data.objects.new(name1, me)
             # fix visualization issue
             if self.link_component:
@@ -163,157 +209,27 @@ class dual_mesh(Operator):
             sel = context.selected_objects
         doneMeshes = []
 
-        for ob0 in sel:
-            if ob0.type != 'MESH':
+        for ob in sel:
+            if ob.type != 'MESH':
                 continue
-            if ob0.data.name in doneMeshes:
+            me0 = ob.data
+            if me0 in doneMeshes:
                 continue
-            ob = ob0
-            mesh_name = ob0.data.name
-
-            # store linked objects
-            clones = []
-            n_users = ob0.data.users
-            count = 0
-            for o in bpy.data.objects:
-                if o.type != 'MESH':
-                    continue
-                if o.data.name == mesh_name:
-                    count += 1
-                    clones.append(o)
-                if count == n_users:
-                    break
-
+            mesh_name = me0.name
             if self.apply_modifiers:
-                bpy.ops.object.convert(target='MESH')
-            ob.data = ob.data.copy()
-            bpy.ops.object.select_all(action='DESELECT')
-            ob.select_set(True)
-            context.view_layer.objects.active = ob0
-            bpy.ops.object.mode_set(mode='EDIT')
-
-            # prevent borders erosion
-            bpy.ops.mesh.select_mode(
-                    use_extend=False, use_expand=False, type='EDGE'
-                    )
-            bpy.ops.mesh.select_non_manifold(
-                    extend=False, use_wire=False, use_boundary=True,
-                    use_multi_face=False, use_non_contiguous=False,
-                    use_verts=False
-                    )
-            bpy.ops.mesh.extrude_region_move(
-                    MESH_OT_extrude_region={"mirror": False},
-                    TRANSFORM_OT_translate={"value": (0, 0, 0)}
-                    )
-
-            bpy.ops.mesh.select_mode(
-                    use_extend=False, use_expand=False, type='VERT',
-                    action='TOGGLE'
-                    )
-            bpy.ops.mesh.select_all(action='SELECT')
-            bpy.ops.mesh.quads_convert_to_tris(
-                    quad_method=self.quad_method, ngon_method=self.polygon_method
-                    )
-            bpy.ops.mesh.select_all(action='DESELECT')
-            bpy.ops.object.mode_set(mode='OBJECT')
-            bpy.ops.object.modifier_add(type='SUBSURF')
-            ob.modifiers[-1].name = "dual_mesh_subsurf"
-            while True:
-                bpy.ops.object.modifier_move_up(modifier="dual_mesh_subsurf")
-                if ob.modifiers[0].name == "dual_mesh_subsurf":
-                    break
-
-            bpy.ops.object.modifier_apply(modifier='dual_mesh_subsurf')
-
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_all(action='DESELECT')
-
-            verts = ob.data.vertices
-
-            bpy.ops.object.mode_set(mode='OBJECT')
-            verts[-1].select = True
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_more(use_face_step=False)
-
-            bpy.ops.mesh.select_similar(
-                type='VERT_EDGES', compare='EQUAL', threshold=0.01)
-            bpy.ops.mesh.select_all(action='INVERT')
-
-            bpy.ops.mesh.dissolve_verts()
-            bpy.ops.mesh.select_all(action='DESELECT')
-
-            bpy.ops.mesh.select_non_manifold(
-                extend=False, use_wire=False, use_boundary=True,
-                use_multi_face=False, use_non_contiguous=False, use_verts=False)
-            bpy.ops.mesh.select_more()
-
-            # find boundaries
-            bpy.ops.object.mode_set(mode='OBJECT')
-            bound_v = [v.index for v in ob.data.vertices if v.select]
-            bound_e = [e.index for e in ob.data.edges if e.select]
-            bound_p = [p.index for p in ob.data.polygons if p.select]
-            bpy.ops.object.mode_set(mode='EDIT')
-
-            # select quad faces
-            context.tool_settings.mesh_select_mode = (False, False, True)
-            bpy.ops.mesh.select_face_by_sides(number=4, extend=False)
-
-            # deselect boundaries
-            bpy.ops.object.mode_set(mode='OBJECT')
-            for i in bound_v:
-                context.active_object.data.vertices[i].select = False
-            for i in bound_e:
-                context.active_object.data.edges[i].select = False
-            for i in bound_p:
-                context.active_object.data.polygons[i].select = False
-
-            bpy.ops.object.mode_set(mode='EDIT')
-
-            context.tool_settings.mesh_select_mode = (False, False, True)
-            bpy.ops.mesh.edge_face_add()
-            context.tool_settings.mesh_select_mode = (True, False, False)
-            bpy.ops.mesh.select_all(action='DESELECT')
-
-            # delete boundaries
-            bpy.ops.mesh.select_non_manifold(
-                    extend=False, use_wire=True, use_boundary=True,
-                    use_multi_face=False, use_non_contiguous=False, use_verts=True
-                    )
-            bpy.ops.mesh.delete(type='VERT')
-
-            # remove middle vertices
-            bm = bmesh.from_edit_mesh(ob.data)
-            for v in bm.verts:
-                if len(v.link_edges) == 2 and len(v.link_faces) < 3:
-                    v.select = True
-
-            # dissolve
-            bpy.ops.mesh.dissolve_verts()
-            bpy.ops.mesh.select_all(action='DESELECT')
-
-            # remove border faces
-            if not self.preserve_borders:
-                bpy.ops.mesh.select_non_manifold(
-                    extend=False, use_wire=False, use_boundary=True,
-                    use_multi_face=False, use_non_contiguous=False, use_verts=False
-                    )
-                bpy.ops.mesh.select_more()
-                bpy.ops.mesh.delete(type='FACE')
-
-            # clean wires
-            bpy.ops.mesh.select_non_manifold(
-                    extend=False, use_wire=True, use_boundary=False,
-                    use_multi_face=False, use_non_contiguous=False, use_verts=False
-                    )
-            bpy.ops.mesh.delete(type='EDGE')
-
-            bpy.ops.object.mode_set(mode='OBJECT')
-            ob0.data.name = mesh_name
-            doneMeshes.append(mesh_name)
-
-            for o in clones:
-                o.data = ob.data
-            bm.free()
+                me = simple_to_mesh(ob)
+                ob.modifiers.clear()
+            else:
+                me = me0
+            new_me = dual_mesh_from_mesh(me, mesh_name, self.quad_method,
+                self.polygon_method, self.preserve_borders)
+            if me != me0: bpy.data.meshes.remove(me)
+
+            # linked objects use the new mesh as well
+            me0.user_remap(new_me)
+            bpy.data.meshes.remove(me0)
+            new_me.name = mesh_name
+            doneMeshes.append(new_me)
 
         for o in sel:
             o.select_set(True)
@@ -3,7 +3,6 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import bpy
-import bmesh
 from bpy.types import Operator
 from bpy.props import (BoolProperty, StringProperty, FloatProperty)
 from mathutils import Vector
@@ -11,119 +10,104 @@ from mathutils import Vector
 from .utils import *
 
 
-def not_in(element, grid):
-    output = True
-    for loop in grid:
-        if element in loop:
-            output = False
-            break
-    return output
-
-
 def grid_from_mesh(mesh, swap_uv):
-    bm = bmesh.new()
-    bm.from_mesh(mesh)
-    verts_grid = []
-    edges_grid = []
-    faces_grid = []
-
-    running_grid = True
-    while running_grid:
-        verts_loop = []
-        edges_loop = []
-        faces_loop = []
-
-        # storing first point
-        verts_candidates = []
-        if len(faces_grid) == 0:
-            # for first loop check all vertices
-            verts_candidates = bm.verts
-        else:
-            # for other loops start form the vertices of the first face
-            # the last loop, skipping already used vertices
-            verts_candidates = [v for v in bm.faces[faces_grid[-1][0]].verts if not_in(v.index, verts_grid)]
-
-        # check for last loop
-        is_last = False
-        for vert in verts_candidates:
-            if len(vert.link_faces) == 1:   # check if corner vertex
-                vert.select = True
-                verts_loop.append(vert.index)
-                is_last = True
+    """
+    Read the structure of a quad grid, walking it row by row from a corner.
+    The first row is walked along the boundary, then every new row is found
+    stepping across the quads of the previous row.
+    :arg mesh: Mesh data, made only by quads.
+    :type mesh: :class:'bpy.types.Mesh'
+    :arg swap_uv: Walk the first row along the second edge of the corner.
+    :type swap_uv: bool
+    :return: Vertex indexes of the grid with shape (rows, cols), or None if
+        the mesh is not a quad grid.
+    :rtype: :class:'numpy.ndarray'
+    """
+    n_verts = len(mesh.vertices)
+    n_faces = len(mesh.polygons)
+    if n_faces == 0: return None
+    loop_total = get_attribute_numpy(mesh.polygons, 'loop_total').astype('int')
+    if np.any(loop_total != 4): return None
+    quads = get_attribute_numpy(mesh.loops, 'vertex_index').astype('int')
+    quads = quads.reshape((n_faces,4))
+    loops_edge, loops_face = get_loops_faces_numpy(mesh)
+    quads_edge = loops_edge.reshape((n_faces,4))
+    edges = get_edges_numpy(mesh)
+    n_edges = len(edges)
+
+    # edge -> faces incidence (-1 for boundary edges)
+    edge_count = np.bincount(loops_edge, minlength=n_edges)
+    if np.any(edge_count > 2): return None
+    order = np.argsort(loops_edge, kind='stable')
+    sorted_edge = loops_edge[order]
+    edge_start = np.cumsum(edge_count) - edge_count
+    edge_faces = np.full((n_edges,2), -1, dtype='int')
+    edge_faces[sorted_edge, np.arange(len(order)) - edge_start[sorted_edge]] = loops_face[order]
+
+    # vertex -> edges incidence, with edges sorted by index
+    edges_vert = edges.T.reshape((-1))
+    edges_id = np.tile(np.arange(n_edges), 2)
+    order = np.lexsort((edges_id, edges_vert))
+    adj_edges = edges_id[order]
+    adj_offset = np.zeros(n_verts+1, dtype='int')
+    np.cumsum(np.bincount(edges_vert, minlength=n_verts), out=adj_offset[1:])
+
+    # start from a corner vertex
+    faces_count = np.bincount(quads.reshape((-1)), minlength=n_verts)
+    corners = np.flatnonzero(faces_count == 1)
+    if len(corners) == 0: return None
+    corner = corners[0]
+    corner_edges = adj_edges[adj_offset[corner]:adj_offset[corner+1]]
+    if len(corner_edges) != 2: return None
+
+    visited_verts = np.zeros(n_verts, dtype='bool')
+    visited_faces = np.zeros(n_faces, dtype='bool')
+
+    # first row, along the boundary
+    row = [corner]
+    row_edges = []
+    visited_verts[corner] = True
+    edge = corner_edges[int(swap_uv)]
+    while edge > -1:
+        vert = edges[edge,0] + edges[edge,1] - row[-1]
+        face = edge_faces[edge,0]
+        row.append(vert)
+        row_edges.append(edge)
+        visited_verts[vert] = True
+        edge = -1
+        # continue straight, avoiding the face of the last edge
+        for e in adj_edges[adj_offset[vert]:adj_offset[vert+1]]:
+            next_vert = edges[e,0] + edges[e,1] - vert
+            if not visited_verts[next_vert] and next_vert not in quads[face]:
+                edge = e
                 break
-
-        if not is_last:
-            for vert in verts_candidates:
-                new_link_faces = [f for f in vert.link_faces if not_in(f.index, faces_grid)]
-                if len(new_link_faces) < 2:  # check if corner vertex
-                    vert.select = True
-                    verts_loop.append(vert.index)
-                    break
-
-        running_loop = len(verts_loop) > 0
-
-        while running_loop:
-            bm.verts.ensure_lookup_table()
-            id = verts_loop[-1]
-            link_edges = bm.verts[id].link_edges
-            # storing second point
-            if len(verts_loop) == 1:            # only one vertex stored in the loop
-                if len(faces_grid) == 0:        # first loop #
-                    edge = link_edges[swap_uv]  # chose direction
-                    for vert in edge.verts:
-                        if vert.index != id:
-                            vert.select = True
-                            verts_loop.append(vert.index)                # new vertex
-                            edges_loop.append(edge.index)                # chosen edge
-                            faces_loop.append(edge.link_faces[0].index)  # only one face
-                            # edge.link_faces[0].select = True
-                else:  # other loops #
-                    # start from the edges of the first face of the last loop
-                    for edge in bm.faces[faces_grid[-1][0]].edges:
-                        # chose an edge starting from the first vertex that is not returning back
-                        if bm.verts[verts_loop[0]] in edge.verts and \
-                                bm.verts[verts_grid[-1][0]] not in edge.verts:
-                            for vert in edge.verts:
-                                if vert.index != id:
-                                    vert.select = True
-                                    verts_loop.append(vert.index)
-                            edges_loop.append(edge.index)
-
-                            for face in edge.link_faces:
-                                if not_in(face.index, faces_grid):
-                                    faces_loop.append(face.index)
-            # continuing the loop
-            else:
-                for edge in link_edges:
-                    for vert in edge.verts:
-                        store_data = False
-                        if not_in(vert.index, verts_grid) and vert.index not in verts_loop:
-                            if len(faces_loop) > 0:
-                                bm.faces.ensure_lookup_table()
-                                if vert not in bm.faces[faces_loop[-1]].verts:
-                                    store_data = True
-                            else:
-                                store_data = True
-                            if store_data:
-                                vert.select = True
-                                verts_loop.append(vert.index)
-                                edges_loop.append(edge.index)
-                                for face in edge.link_faces:
-                                    if not_in(face.index, faces_grid):
-                                        faces_loop.append(face.index)
-                                break
-            # ending condition
-            if verts_loop[-1] == id or verts_loop[-1] == verts_loop[0]:
-                running_loop = False
-
-        verts_grid.append(verts_loop)
-        edges_grid.append(edges_loop)
-        faces_grid.append(faces_loop)
-
-        if len(faces_loop) == 0:
-            running_grid = False
-    bm.free()
-    return verts_grid, edges_grid, faces_grid
+    row = np.array(row)
+    row_edges = np.array(row_edges)
+    grid = [row]
+
+    # other rows, across the quads of the last row
+    while True:
+        faces = edge_faces[row_edges]
+        free = faces > -1
+        free[free] = ~visited_faces[faces[free]]
+        n_free = np.sum(free, axis=1)
+        if not np.any(n_free): break
+        if np.any(n_free != 1): return None
+        faces = faces[free]
+        visited_faces[faces] = True
+        faces_verts = quads[faces]
+        id0 = np.argmax(faces_verts == row[:-1,None], axis=1)
+        id1 = np.argmax(faces_verts == row[1:,None], axis=1)
+        forward = (id1 - id0) % 4 == 1
+        next0 = faces_verts[np.arange(len(faces)), (id0 + np.where(forward, 3, 1)) % 4]
+        next1 = faces_verts[np.arange(len(faces)), (id1 + np.where(forward, 1, 3)) % 4]
+        if np.any(next0[1:] != next1[:-1]): return None
+        row = np.append(next0, next1[-1])
+        if np.any(visited_verts[row]): return None
+        visited_verts[row] = True
+        row_edges = quads_edge[faces, (np.where(forward, id0, id1) + 2) % 4]
+        grid.append(row)
+    return np.array(grid)
 
 
 class lattice_along_surface(Operator):
@@ -373,50 +357,38 @@ class lattice_along_surface(Operator):
                 bpy.ops.object.parent_set(type='OBJECT', keep_transform=False)
 
         # reading grid structure
-        verts_grid, edges_grid, faces_grid = grid_from_mesh(
-                                                grid_mesh,
-                                                swap_uv=self.swapUV
-                                                )
-        nu = len(verts_grid)
-        nv = len(verts_grid[0])
+        verts_grid = grid_from_mesh(grid_mesh, swap_uv=self.swapUV)
+        nu = nv = 0
         nw = 2
         scale_normal = self.thickness
 
         try:
+            nu, nv = verts_grid.shape
             lattice.data.points_u = nu
             lattice.data.points_v = nv
             lattice.data.points_w = nw
+            n_verts = len(grid_mesh.vertices)
             if self.use_groups:
                 vg = temp_grid_obj.vertex_groups.active
+                if vg is None: weight_influence = np.zeros(n_verts)
+                else: weight_influence = get_weight_numpy(vg, n_verts)
                 weight_factor = self.weight_factor
-            for i in range(nu):
-                for j in range(nv):
-                    for w in range(nw):
-                        if self.use_groups:
-                            try:
-                                weight_influence = vg.weight(verts_grid[i][j])
-                            except:
-                                weight_influence = 0
-                            weight_influence = weight_influence * (1 - weight_factor) + weight_factor
-                            displace = weight_influence * scale_normal * bb.z
-                        else:
-                            displace = scale_normal * bb.z
-                        target_point = (grid_mesh.vertices[verts_grid[i][j]].co +
-                                        grid_mesh.vertices[verts_grid[i][j]].normal *
-                                        (w + self.displace / 2 - 0.5) * displace) - lattice.location
-                        if self.flipW:
-                            w = 1 - w
-                        if self.flipU:
-                            i = nu - i - 1
-                        if self.flipV:
-                            j = nv - j - 1
-
-                        lattice.data.points[i + j * nu + w * nu * nv].co_deform.x = \
-                                target_point.x / bpy.data.objects[lattice.name].scale.x
-                        lattice.data.points[i + j * nu + w * nu * nv].co_deform.y = \
-                                target_point.y / bpy.data.objects[lattice.name].scale.y
-                        lattice.data.points[i + j * nu + w * nu * nv].co_deform.z = \
-                                target_point.z / bpy.data.objects[lattice.name].scale.z
+                weight_influence = weight_influence * (1 - weight_factor) + weight_factor
+                displace = weight_influence[verts_grid] * scale_normal * bb.z
+            else:
+                displace = np.full((nu, nv), scale_normal * bb.z)
+            verts = get_vertices_numpy(grid_mesh)[verts_grid]
+            normals = get_normals_numpy(grid_mesh)[verts_grid]
+            w = np.arange(nw)[:,None,None,None]
+            # target points with shape (nw, nu, nv, 3)
+            target_points = verts + normals * (w + self.displace / 2 - 0.5) * \
+                            displace[:,:,None] - np.array(lattice.location)
+            if self.flipW: target_points = target_points[::-1]
+            if self.flipU: target_points = target_points[:,::-1]
+            if self.flipV: target_points = target_points[:,:,::-1]
+            # lattice points are ordered along U, then V, then W
+            target_points = target_points.transpose((0,2,1,3)) / np.array(lattice.scale)
+            lattice.data.points.foreach_set('co_deform', target_points.reshape((-1)))
 
         except:
             bpy.ops.object.mode_set(mode='OBJECT')
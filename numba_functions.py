@@ -469,6 +469,65 @@ if bool_numba:
         return co2
 
 
+    @njit
+    def numba_normalize3(x, y, z):
+        length = np.sqrt(x*x + y*y + z*z)
+        if length == 0: length = 1.0
+        return x/length, y/length, z/length
+
+    @njit(parallel=True)
+    def numba_frame_vertices(vertices, normals, loops_vert, loop_start, loop_total, loops_thickness, batch_start, frame_co):
+        # same as get_frame_vertices_numpy(), every batch of faces in parallel
+        for b in prange(len(batch_start)-1):
+            for f in range(batch_start[b], batch_start[b+1]):
+                s = loop_start[f]
+                n = loop_total[f]
+                nx = normals[f,0]
+                ny = normals[f,1]
+                nz = normals[f,2]
+                for k in range(n):
+                    i = loops_vert[s+k]
+                    i0 = loops_vert[s+(k-1)%n]
+                    i1 = loops_vert[s+(k+1)%n]
+                    cx = vertices[i,0]
+                    cy = vertices[i,1]
+                    cz = vertices[i,2]
+                    px, py, pz = numba_normalize3(vertices[i0,0]-cx, vertices[i0,1]-cy, vertices[i0,2]-cz)
+                    qx, qy, qz = numba_normalize3(cx-vertices[i1,0], cy-vertices[i1,1], cz-vertices[i1,2])
+                    dx = px + qx
+                    dy = py + qy
+                    dz = pz + qz
+                    rx = py*qz - pz*qy
+                    ry = pz*qx - px*qz
+                    rz = px*qy - py*qx
+                    # concave corners
+                    if rx*nx + ry*ny + rz*nz < 0:
+                        rx = -rx
+                        ry = -ry
+                        rz = -rz
+                    eps = 1.1920929e-06
+                    if abs(px-qx) <= eps and abs(py-qy) <= eps and abs(pz-qz) <= eps:
+                        tx = dy*nz - dz*ny
+                        ty = dz*nx - dx*nz
+                        tz = dx*ny - dy*nx
+                    else:
+                        tx = dy*rz - dz*ry
+                        ty = dz*rx - dx*rz
+                        tz = dx*ry - dy*rx
+                    tx, ty, tz = numba_normalize3(tx, ty, tz)
+                    # project on the plane of the face
+                    ax = ty*nz - tz*ny
+                    ay = tz*nx - tx*nz
+                    az = tx*ny - ty*nx
+                    tx, ty, tz = numba_normalize3(ny*az - nz*ay, nz*ax - nx*az, nx*ay - ny*ax)
+                    cos_angle = min(max(-(px*qx + py*qy + pz*qz), -1.0), 1.0)
+                    sin_angle = np.sin(np.arccos(cos_angle)/2)
+                    if abs(sin_angle) < 1e-6: sin_angle = 1e-6 # Prevent division by zero
+                    t = loops_thickness[s+k]/sin_angle
+                    frame_co[s+k,0] = cx + tx*t
+                    frame_co[s+k,1] = cy + ty*t
+                    frame_co[s+k,2] = cz + tz*t
+
 #except:
 #    print("Tissue: Numba cannot be installed. Try to restart Blender.")
 #    pass
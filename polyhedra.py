@@ -16,7 +16,6 @@ from bpy.props import (
     StringProperty,
     PointerProperty
     )
-from mathutils import Vector
 import numpy as np
 import time
 import bmesh
@@ -24,12 +23,15 @@ from .utils import (
     tissue_time,
     simple_to_mesh,
     bmesh_get_weight_numpy,
-    round_angle_with_axis,
     remove_temp_objects,
     auto_layer_collection,
-    convert_object_to_mesh
+    convert_object_to_mesh,
+    get_next_loops_numpy,
+    mesh_from_loops_numpy
 )
-from math import sin
+from .numba_functions import bool_numba
+try: from .numba_functions import numba_frame_vertices
+except: pass
 
 def anim_polyhedra_active(self, context):
     ob = context.object
@@ -408,14 +410,20 @@ class tissue_update_polyhedra(Operator):
 
         bm = bmesh.new()
         bm.from_mesh(me)
-        nodes_dict = dict(zip([tuple(v.co) for v in bm.verts], range(len(bm.verts))))
+        # original index of the vertices
+        node_layer = bm.verts.layers.int.new('tissue_node_index')
+        for v in bm.verts: v[node_layer] = v.index
         edges_dict = {
             tuple(sorted((v.index for v in edge.verts))): edge.index
             for edge in bm.edges
         }
 
         pre_processing(bm)
+        nodes_verts = set(bm.verts)
         polyhedral_subdivide_edges(bm, subs, props.proportional_segments)
+        bm.verts.index_update()
+        # original index of the vertices, -1 for the subdivisions
+        nodes = np.array([v[node_layer] if v in nodes_verts else -1 for v in bm.verts], dtype='int')
         tissue_time(start_time,'Subdivide edges',levels=1)
         start_time = time.time()
 
@@ -433,7 +441,6 @@ class tissue_update_polyhedra(Operator):
             if fact > 0:
                 thickness_weight = thickness_weight*(1-fact) + fact
             thickness *= thickness_weight
-        thickness_dict = dict(zip([tuple(v.co) for v in bm.verts],thickness))
 
         bm1 = get_double_faces_bmesh(bm)
         polyhedra = get_decomposed_polyhedra(bm)
@@ -443,7 +450,7 @@ class tissue_update_polyhedra(Operator):
             self.report({'ERROR'}, polyhedra)
             return {'CANCELLED'}
 
-        selective_dict = None
+        selective_weight = None
         accurate = False
         filter_faces = False
         area_threshold = 0
@@ -470,7 +477,6 @@ class tissue_update_polyhedra(Operator):
                     selective_weight = selective_weight <= thresh
                 else:
                     selective_weight = selective_weight >= thresh
-                selective_dict = dict(zip([tuple(v.co) for v in bm.verts],selective_weight))
 
         bm.free()
 
@@ -483,6 +489,7 @@ class tissue_update_polyhedra(Operator):
         bm1, all_faces_dict, polyhedra_faces_id, polyhedra_faces_id_neg = combine_polyhedra_faces(bm1, polyhedra)
 
         if props.mode == 'POLYHEDRA':
+            bm1.verts.layers.int.remove(bm1.verts.layers.int['tissue_vert_id'])
             poly_me = me.copy()
             bm1.to_mesh(poly_me)
             poly_me.update()
@@ -502,9 +509,9 @@ class tissue_update_polyhedra(Operator):
             polyhedra_faces_id,
             polyhedra_faces_id_neg,
             all_faces_dict,
-            selective_dict,
+            selective_weight,
             filter_faces,
-            thickness_dict,
+            thickness,
             area_threshold,
             accurate
         )
@@ -513,106 +520,52 @@ class tissue_update_polyhedra(Operator):
         start_time = time.time()
 
         ############# FRAME #############
-        new_faces, outer_wireframe_faces, att_node_index, att_edge_index = create_frame_faces(
+        vertices, loops_vert, loop_total, face_attributes = create_frame_faces(
             bm1,
             wireframe_faces,
             wireframe_faces_id,
             polyhedra_faces_id_neg,
-            thickness_dict,
+            thickness,
             outer_faces,
-            nodes_dict,
+            delete_faces,
+            nodes,
             edges_dict
         )
+        bm1.free()
 
-        faces_to_delete = wireframe_faces + delete_faces
-        outer_wireframe_faces += [f for f in outer_faces if f not in faces_to_delete]
-
-        bmesh.ops.delete(bm1, geom=faces_to_delete, context='FACES')
-
-        bm1.verts.ensure_lookup_table()
-        bm1.edges.ensure_lookup_table()
-        bm1.faces.ensure_lookup_table()
-        bm1.verts.index_update()
+        frame_me = mesh_from_loops_numpy(me.name, vertices, loops_vert, loop_total)
+        loop_start = np.cumsum(loop_total) - loop_total
 
         ### Store attributes ###
-        wireframe_indexes = [f.index for f in new_faces]
-        outer_indexes = [f.index for f in outer_wireframe_faces]
-
-        layer_is_wireframe = bm1.faces.layers.int.new('tissue_is_wireframe')
-        layer_node_index = bm1.faces.layers.int.new('tissue_node_index')
-        layer_edge_index = bm1.faces.layers.int.new('tissue_edge_index')
-        layer_is_outer = bm1.faces.layers.int.new('tissue_is_outer')
-        count = 0
-        for id in wireframe_indexes:
-            face = bm1.faces[id] 
-            face[layer_is_wireframe] = 1
-            face[layer_node_index] = att_node_index[count]
-            face[layer_edge_index] = att_edge_index[count]
-            count+=1
-        for id in outer_indexes:
-            bm1.faces[id][layer_is_outer] = 1
-        
+        for name, values in face_attributes.items():
+            frame_me.attributes.new(name, 'INT', 'FACE').data.foreach_set('value', values.astype('int32'))
+
         if props.crease > 0 and props.dissolve != 'INNER':
-            edges_to_crease = [f.edges[2].index for f in new_faces]
-            crease_layer = bm1.edges.layers.float.new('crease_edge')
-            bm1.edges.index_update()
-            for edge_index in edges_to_crease:
-                bm1.edges[edge_index][crease_layer] = props.crease
+            # third edge of every frame, between the inner vertices
+            loops_edge = np.zeros(len(loops_vert), dtype='int32')
+            frame_me.loops.foreach_get('edge_index', loops_edge)
+            crease = np.zeros(len(frame_me.edges), dtype='float32')
+            crease[loops_edge[loop_start[face_attributes['tissue_is_wireframe'] == 1] + 2]] = props.crease
+            frame_me.attributes.new('crease_edge', 'FLOAT', 'EDGE').data.foreach_set('value', crease)
 
         tissue_time(start_time,'Generate frames',levels=1)
         start_time = time.time()
 
-        ### Displace vertices ###
-        corners = [[] for _ in range(len(bm1.verts))]
-        normals = [0]*len(bm1.verts)
-        vertices = [0]*len(bm1.verts)
-        for v in bm1.verts:
-            v.normal_update
-        # Define vectors direction
-        for f in bm1.faces:
-            v0 = f.verts[0]
-            v1 = f.verts[1]
-            v_id = v0.index
-            corners[v_id].append((v1.co - v0.co).normalized())
-            normals[v_id] = v0.normal.copy()
-            vertices[v_id] = v0
-        # Displace vertices
-        for i, vecs in enumerate(corners):
-            if len(vecs) > 0:
-                v = vertices[i]
-                nor = normals[i]
-                ang = 0
-                for vec in vecs:
-                    if nor == Vector((0,0,0)): continue
-                    ang += nor.angle(vec)
-                ang /= len(vecs)
-                div = sin(ang)
-                if div < 1e-6: div = 1
-                v.co += nor*thickness_dict[tuple(v.co)]/div
-
-        tissue_time(start_time,'Corners displace',levels=1)
-        start_time = time.time()
-
+        bm1 = bmesh.new()
+        bm1.from_mesh(frame_me)
+        bpy.data.meshes.remove(frame_me)
         if props.dissolve != 'NONE':
             if props.dissolve == 'INNER': dissolve_id = 2
             if props.dissolve == 'OUTER': dissolve_id = 0
-            bm1.edges.index_update()
-            dissolve_edges = []
-            for f in bm1.faces:
-                e = f.edges[dissolve_id]
-                if e not in dissolve_edges:
-                    dissolve_edges.append(e)
+            dissolve_edges = list(dict.fromkeys(f.edges[dissolve_id] for f in bm1.faces))
             bmesh.ops.dissolve_edges(bm1, edges=dissolve_edges, use_verts=True, use_face_split=False)
 
-        for v in bm1.verts: v.select_set(False)
-        for f in bm1.faces: f.select_set(False)
-
         dissolve_verts = [v for v in bm1.verts if len(v.link_edges) < 3]
         bmesh.ops.dissolve_verts(bm1, verts=dissolve_verts, use_face_split=False, use_boundary_tear=False)
 
         # clean meshes
+        for f in bm1.faces: f.smooth = props.bool_smooth
         bm1.to_mesh(me)
-        if props.bool_smooth: me.shade_smooth()
         me.update()
         old_me = ob.data
         ob.data = me
@@ -637,63 +590,115 @@ def get_wireframe_faces_from_polyhedral_complex(
     polyhedra_faces_id,
     polyhedra_faces_id_neg,
     all_faces_dict,
-    selective_dict,
+    selective_weight,
     filter_faces,
-    thickness_dict,
+    thickness,
     area_threshold,
     accurate
 ):
-    delete_faces = set({})
-    wireframe_faces = []
-    not_wireframe_faces = []
     outer_faces = get_outer_faces(bm)
-    for faces_id in polyhedra_faces_id:
-        delete_faces_poly = []
-        wireframe_faces_poly = []
-        for id in faces_id:
-            if id in delete_faces: continue
-            delete = False
-            if filter_faces:
-                f = all_faces_dict[id]
-                if selective_dict:
-                    for v in f.verts:
-                        if selective_dict[tuple(v.co)]:
-                            delete = True
-                            break
-                elif accurate:
-                    cen = f.calc_center_median()
-                    for e in f.edges:
-                        v0 = e.verts[0]
-                        v1 = e.verts[1]
-                        mid = (v0.co + v1.co)/2
-                        vec1 = v0.co - v1.co
-                        vec2 = mid - cen
-                        ang = Vector.angle(vec1,vec2)
-                        length = vec2.length
-                        length = sin(ang)*length
-                        thick0 = thickness_dict[tuple(v0.co)]
-                        thick1 = thickness_dict[tuple(v1.co)]
-                        thick = (thick0 + thick1)/4
-                        if length < thick*props.thickness_threshold_correction:
-                            delete = True
-                            break
-                else:
-                    delete = f.calc_area() < area_threshold
-            if delete:
-                if props.thicken_all:
-                    delete_faces_poly.append(id)
-            else:
-                wireframe_faces_poly.append(id)
-        if len(wireframe_faces_poly) <= 2:
-            delete_faces.update(set(faces_id))
-            not_wireframe_faces += [polyhedra_faces_id_neg[id] for id in faces_id]
+    bm.verts.index_update()
+    bm.faces.index_update()
+    loops_vert, loop_total = get_faces_loops_numpy(bm.faces)
+    loops_face = np.repeat(np.arange(len(loop_total)), loop_total)
+    delete = np.zeros(len(loop_total), dtype='bool')
+    if filter_faces:
+        id_layer = bm.verts.layers.int['tissue_vert_id']
+        verts_id = np.array([v[id_layer] for v in bm.verts], dtype='int')
+        loops_next = get_loops_next_numpy(loops_vert, loop_total)
+        if selective_weight is not None:
+            delete = np.bincount(loops_face, weights=selective_weight[verts_id[loops_vert]],
+                minlength=len(loop_total)) > 0
         else:
-            wireframe_faces += wireframe_faces_poly
-    wireframe_faces_id = [i for i in wireframe_faces if i not in not_wireframe_faces]
+            vertices = np.array([v.co for v in bm.verts]).reshape((-1,3))
+            co0 = vertices[loops_vert]
+            co1 = vertices[loops_next]
+            if accurate:
+                # distance between the center and the edges of the faces
+                cen = np.zeros((len(loop_total),3))
+                for i in range(3):
+                    cen[:,i] = np.bincount(loops_face, weights=co0[:,i], minlength=len(loop_total))
+                cen /= loop_total[:,None]
+                vec1 = co0 - co1
+                vec2 = (co0 + co1)/2 - cen[loops_face]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    length = np.linalg.norm(np.cross(vec1, vec2), axis=1)/np.linalg.norm(vec1, axis=1)
+                thick = (thickness[verts_id[loops_vert]] + thickness[verts_id[loops_next]])/4
+                too_thin = np.nan_to_num(length) < thick*props.thickness_threshold_correction
+                delete = np.bincount(loops_face, weights=too_thin, minlength=len(loop_total)) > 0
+            else:
+                area = np.zeros((len(loop_total),3))
+                cross = np.cross(co0, co1)
+                for i in range(3):
+                    area[:,i] = np.bincount(loops_face, weights=cross[:,i], minlength=len(loop_total))
+                delete = np.linalg.norm(area, axis=1)/2 < area_threshold
+
+    # polyhedra with less than three wireframe faces are removed
+    faces_id = [id for p in polyhedra_faces_id for id in p]
+    faces_poly = np.repeat(np.arange(len(polyhedra_faces_id)), [len(p) for p in polyhedra_faces_id])
+    faces_index = np.array([all_faces_dict[id].index for id in faces_id], dtype='int')
+    keep = ~delete[faces_index]
+    remove_poly = np.bincount(faces_poly, weights=keep, minlength=len(polyhedra_faces_id)) <= 2
+    remove = remove_poly[faces_poly]
+    not_wireframe_faces = set(polyhedra_faces_id_neg[id] for id, r in zip(faces_id, remove.tolist()) if r)
+    wireframe_faces_id = [id for id, k, r in zip(faces_id, keep.tolist(), remove.tolist())
+        if k and not r and id not in not_wireframe_faces]
     wireframe_faces = [all_faces_dict[i] for i in wireframe_faces_id]
-    delete_faces = [all_faces_dict[i] for i in delete_faces if all_faces_dict[i] not in outer_faces]
+    outer_set = set(outer_faces)
+    delete_faces = [all_faces_dict[id] for id, r in zip(faces_id, remove.tolist())
+        if r and all_faces_dict[id] not in outer_set]
     return wireframe_faces, wireframe_faces_id, delete_faces, outer_faces
 
+def get_faces_loops_numpy(faces):
+    '''
+    Vertex index of each loop and number of loops of the given BMFaces.
+    '''
+    faces_verts = [[v.index for v in f.verts] for f in faces]
+    loop_total = np.array([len(verts) for verts in faces_verts], dtype='int')
+    loops_vert = np.array([i for verts in faces_verts for i in verts], dtype='int')
+    return loops_vert, loop_total
+
+def get_loops_next_numpy(loops_vert, loop_total):
+    loops_face = np.repeat(np.arange(len(loop_total)), loop_total)
+    loop_start = np.cumsum(loop_total) - loop_total
+    loops_pos = np.arange(len(loops_vert)) - loop_start[loops_face]
+    return loops_vert[loop_start[loops_face] + (loops_pos+1) % loop_total[loops_face]]
+
+def get_loops_prev_numpy(loops_vert, loop_total):
+    loops_face = np.repeat(np.arange(len(loop_total)), loop_total)
+    loop_start = np.cumsum(loop_total) - loop_total
+    loops_pos = np.arange(len(loops_vert)) - loop_start[loops_face]
+    return loops_vert[loop_start[loops_face] + (loops_pos-1) % loop_total[loops_face]]
+
+def get_frame_vertices_numpy(vertices, normals, loops_vert, loop_total, loops_thickness):
+    '''
+    Coordinates of the inner vertices of the frames, for all the loops of
+    the faces at once. Tangents follow BMLoop.calc_tangent(), projected on
+    the plane of the face.
+    '''
+    def normalize(vecs):
+        length = np.linalg.norm(vecs, axis=1)
+        length[length == 0] = 1
+        return vecs/length[:,None]
+
+    loops_face = np.repeat(np.arange(len(loop_total)), loop_total)
+    co = vertices[loops_vert]
+    co_prev = vertices[get_loops_prev_numpy(loops_vert, loop_total)]
+    co_next = vertices[get_loops_next_numpy(loops_vert, loop_total)]
+    nor = normals[loops_face]
+    v_prev = normalize(co_prev - co)
+    v_next = normalize(co - co_next)
+    dir = v_prev + v_next
+    cross = np.cross(v_prev, v_next)
+    # concave corners
+    cross[np.einsum('ij,ij->i', cross, nor) < 0] *= -1
+    same = np.all(np.abs(v_prev - v_next) <= 1.1920929e-06, axis=1)
+    tan = np.where(same[:,None], np.cross(dir, nor), np.cross(dir, cross))
+    tan = normalize(np.cross(nor, np.cross(normalize(tan), nor))) # fix deformations
+    cos_angle = np.einsum('ij,ij->i', normalize(co_prev - co), normalize(co_next - co))
+    sin_angle = np.sin(np.arccos(np.clip(cos_angle, -1, 1))/2)
+    sin_angle[np.abs(sin_angle) < 1e-6] = 1e-6 # Prevent division by zero
+    return co + tan/sin_angle[:,None]*loops_thickness[:,None]
 
 def pre_processing(bm):
     delete = [e for e in bm.edges if len(e.link_faces) < 2]
@@ -720,90 +725,155 @@ def create_frame_faces(
     wireframe_faces,
     wireframe_faces_id,
     polyhedra_faces_id_neg,
-    thickness_dict,
+    thickness,
     outer_faces,
-    nodes_dict,
+    delete_faces,
+    nodes,
     edges_dict
 ):
-    for f in wireframe_faces:
-        f.normal_update()
-  
-    new_faces = []
-    outer_wireframe_faces = []
-    att_node_index = []
-    att_edge_index = []
-    frames_verts_dict = {}
-    all_loops = [[loop for loop in f.loops] for f in wireframe_faces]
-    is_outer = [f in outer_faces for f in wireframe_faces]
-  
-    for loops_index, loops in enumerate(all_loops):
-        n_loop = len(loops)
-        frame_id = wireframe_faces_id[loops_index]
-        single_face_id = min(frame_id, polyhedra_faces_id_neg[frame_id])
-        verts_inner = []
-        loops_keys = [tuple(loop.vert.co) + tuple((single_face_id,)) for loop in loops]
-        face_normal = wireframe_faces[loops_index].normal
-
-        # create vertices
-        if loops_keys[0] in frames_verts_dict:
-            verts_inner = [frames_verts_dict[key] for key in loops_keys]
-        else:
-            tangents = []
-            for loop in loops:
-                tan = loop.calc_tangent()
-                tan = face_normal.cross(tan.cross(face_normal)).normalized() # fix deformations
-                thickness = thickness_dict[tuple(loop.vert.co)]
-                sin_angle = sin(loop.calc_angle() / 2)
-                if abs(sin_angle) < 1e-6:
-                    sin_angle = 1e-6  # Prevent division by zero
-                tangents.append(tan / sin_angle * thickness)
-            for i, loop in enumerate(loops):
-                new_co = loop.vert.co + tangents[i]
-                new_vert = bm.verts.new(new_co)
-                frames_verts_dict[loops_keys[i]] = new_vert
-                verts_inner.append(new_vert)
-        
-        # add faces
-        closed_loops = loops + [loops[0]]
-        verts_inner_closed = verts_inner + [verts_inner[0]]
-        for i in range(n_loop):
-            v0 = closed_loops[i].vert
-            v1 = closed_loops[i+1].vert
-            v2 = verts_inner_closed[i+1]
-            v3 = verts_inner_closed[i]
-            face_verts = [v0,v1,v2,v3]
-            new_face = bm.faces.new(face_verts)
-            new_face.select = True
-            new_faces.append(new_face)
-            if is_outer[loops_index]:
-                outer_wireframe_faces.append(new_face)
-            new_face.normal_update()
-        node_indexes, edge_indexes = get_face_topology_indexes_from_dict(closed_loops, nodes_dict, edges_dict)
-        att_node_index += node_indexes
-        att_edge_index += edge_indexes
-
-    return new_faces, outer_wireframe_faces, att_node_index, att_edge_index
-
-def get_face_topology_indexes_from_dict(loops, nodes_dict, edges_dict):
-    indexes = [nodes_dict.get(tuple(loop.vert.co), -1) for loop in loops]
-    nodes_id = list(map(max, indexes[:-1], indexes[1:]))
-    edge_node1 = propagate_loop_node_indexes(indexes[:-1])
-    edge_node2 = reversed(propagate_loop_node_indexes(list(reversed(indexes))[:-1]))
-    edges_id = [edges_dict.get(tuple(sorted((i,j))),-1) for i,j in zip(edge_node1, edge_node2)]
+    '''
+    Vertices and loops of the whole wireframe as flat arrays: the faces that
+    are not replaced by frames, followed by the frames of the wireframe faces.
+    Unused vertices are removed, as bmesh.ops.delete() does.
+    '''
+    id_layer = bm.verts.layers.int['tissue_vert_id']
+    bm.verts.index_update()
+    bm.faces.index_update()
+    verts_id = np.array([v[id_layer] for v in bm.verts], dtype='int')
+    vertices = np.array([v.co for v in bm.verts]).reshape((-1,3))
+    loops_vert, loop_total = get_faces_loops_numpy(bm.faces)
+    n_faces = len(loop_total)
+    loop_start = np.cumsum(loop_total) - loop_total
+
+    # loops of the wireframe faces, in the order of the frames
+    frame_faces = np.array([f.index for f in wireframe_faces], dtype='int')
+    frame_total = loop_total[frame_faces]
+    frame_loops = np.repeat(loop_start[frame_faces] - np.cumsum(frame_total) + frame_total,
+        frame_total) + np.arange(np.sum(frame_total))
+    frame_vert = loops_vert[frame_loops]
+    frame_loops_id = verts_id[frame_vert]
+
+    # Newell normals of the wireframe faces
+    frame_face = np.repeat(np.arange(len(frame_faces)), frame_total)
+    co0 = vertices[frame_vert]
+    co1 = vertices[frame_vert[get_next_loops_numpy(frame_total)]]
+    cross = np.cross(co0, co1)
+    normals = np.zeros((len(frame_faces),3))
+    for i in range(3):
+        normals[:,i] = np.bincount(frame_face, weights=cross[:,i], minlength=len(frame_faces))
+    length = np.linalg.norm(normals, axis=1)
+    length[length == 0] = 1
+    normals /= length[:,None]
+
+    # inner vertices, shared by the two sides of each face
+    frame_id = np.array(wireframe_faces_id, dtype='int')
+    frame_id_neg = np.array([polyhedra_faces_id_neg[id] for id in wireframe_faces_id], dtype='int')
+    single_face_id = np.repeat(np.minimum(frame_id, frame_id_neg), frame_total)
+    loops_key = single_face_id*len(thickness) + frame_loops_id
+    keys, first, inverse = np.unique(loops_key, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.zeros(len(order), dtype='int')
+    rank[order] = np.arange(len(order))
+    frame_inner = rank[inverse.reshape((-1))] + len(vertices)
+    frame_co = get_frame_vertices(vertices, normals, frame_vert, frame_total,
+        thickness[frame_loops_id])[first[order]]
+
+    # frames of each loop: (vertex, next vertex, next inner, inner)
+    frame_next = get_next_loops_numpy(frame_total)
+    quads = np.stack((frame_vert, frame_vert[frame_next], frame_inner[frame_next], frame_inner), axis=1)
+
+    # faces that are not replaced or removed
+    keep = np.ones(n_faces, dtype='bool')
+    keep[frame_faces] = False
+    keep[[f.index for f in delete_faces]] = False
+    is_outer = np.zeros(n_faces, dtype='bool')
+    is_outer[[f.index for f in outer_faces]] = True
+    keep_loops = np.repeat(keep, loop_total)
+
+    loops_vert = np.concatenate((loops_vert[keep_loops], quads.reshape((-1))))
+    loop_total = np.concatenate((loop_total[keep], np.full(len(quads), 4, dtype='int')))
+    vertices = np.concatenate((vertices, frame_co))
+
+    # remove unused vertices
+    used = np.zeros(len(vertices), dtype='bool')
+    used[loops_vert] = True
+    verts_map = np.cumsum(used) - 1
+    loops_vert = verts_map[loops_vert]
+    vertices = vertices[used]
+
+    node_index, edge_index = get_frame_topology_indexes(nodes[frame_loops_id], frame_total, edges_dict)
+    n_keep = np.sum(keep)
+    face_attributes = {
+        'tissue_is_wireframe' : np.concatenate((np.zeros(n_keep, dtype='int'), np.ones(len(quads), dtype='int'))),
+        'tissue_node_index' : np.concatenate((np.zeros(n_keep, dtype='int'), node_index)),
+        'tissue_edge_index' : np.concatenate((np.zeros(n_keep, dtype='int'), edge_index)),
+        'tissue_is_outer' : np.concatenate((is_outer[keep], np.repeat(is_outer[frame_faces], frame_total))).astype('int')
+    }
+    return vertices, loops_vert, loop_total, face_attributes
+
+def get_frame_vertices(vertices, normals, loops_vert, loop_total, loops_thickness, batch_size=1024):
+    '''
+    Coordinates of the inner vertices of the frames. With Numba the faces
+    are processed in parallel batches, otherwise with NumPy.
+    '''
+    if not bool_numba:
+        return get_frame_vertices_numpy(vertices, normals, loops_vert, loop_total, loops_thickness)
+    n_faces = len(loop_total)
+    loop_start = np.cumsum(loop_total) - loop_total
+    batch_start = np.append(np.arange(0, n_faces, batch_size), n_faces)
+    frame_co = np.zeros((len(loops_vert),3))
+    numba_frame_vertices(
+        np.ascontiguousarray(vertices, dtype='float64'),
+        np.ascontiguousarray(normals, dtype='float64'),
+        loops_vert.astype('int64'),
+        loop_start.astype('int64'),
+        loop_total.astype('int64'),
+        loops_thickness.astype('float64'),
+        batch_start.astype('int64'),
+        frame_co
+    )
+    return frame_co
+
+def get_frame_topology_indexes(loops_node, loop_total, edges_dict):
+    '''
+    Source node and source edge of the frame of each loop. The node is the
+    one at the ends of the loop edge, if any. The edge connects the closest
+    nodes before and after the loop edge, around the face.
+    '''
+    n_loops = len(loops_node)
+    loop_start = np.cumsum(loop_total) - loop_total
+    loop_end = loop_start + loop_total - 1
+    loops_face = np.repeat(np.arange(len(loop_total)), loop_total)
+    next_loops = get_next_loops_numpy(loop_total)
+    nodes_id = np.maximum(loops_node, loops_node[next_loops])
+
+    valid = loops_node >= 0
+    loops_id = np.arange(n_loops)
+    # last node at or before each loop, around the face
+    prev_node = np.maximum.accumulate(np.where(valid, loops_id, -1))
+    last_node = np.maximum.reduceat(np.where(valid, loops_id, -1), loop_start) if n_loops else loop_start
+    prev_node = np.where(prev_node < loop_start[loops_face], last_node[loops_face], prev_node)
+    # first node at or after each loop, around the face
+    next_node = np.minimum.accumulate(np.where(valid, loops_id, n_loops)[::-1])[::-1]
+    first_node = np.minimum.reduceat(np.where(valid, loops_id, n_loops), loop_start) if n_loops else loop_start
+    next_node = np.where(next_node > loop_end[loops_face], first_node[loops_face], next_node)[next_loops]
+
+    node1 = np.where(prev_node >= 0, loops_node[np.clip(prev_node, 0, n_loops-1)], -1)
+    node2 = np.where(next_node < n_loops, loops_node[np.clip(next_node, 0, n_loops-1)], -1)
+    edges_id = np.full(n_loops, -1, dtype='int')
+    if len(edges_dict) == 0: return nodes_id, edges_id
+    n_nodes = max(max(key) for key in edges_dict) + 1
+    edges_key = np.array([i*n_nodes + j for i, j in edges_dict.keys()], dtype='int')
+    edges_index = np.array(list(edges_dict.values()), dtype='int')
+    order = np.argsort(edges_key)
+    edges_key = edges_key[order]
+    edges_index = edges_index[order]
+    key = np.minimum(node1, node2)*n_nodes + np.maximum(node1, node2)
+    pos = np.clip(np.searchsorted(edges_key, key), 0, len(edges_key)-1)
+    found = (np.minimum(node1, node2) >= 0) & (np.maximum(node1, node2) < n_nodes) & (edges_key[pos] == key)
+    edges_id[found] = edges_index[pos[found]]
     return nodes_id, edges_id
 
-def propagate_loop_node_indexes(indexes):
-    processed_list = []
-    prev_index = -1
-    for index in reversed(indexes):
-        if index >= 0:
-            prev_index = index 
-            break
-    for index in indexes:
-        prev_index = index if index >= 0 else prev_index
-        processed_list.append(prev_index)
-    return processed_list
-
 def polyhedral_subdivide_edges(bm, subs, proportional_segments):
     if subs > 1:
         if proportional_segments:
@@ -819,176 +889,154 @@ def polyhedral_subdivide_edges(bm, subs, proportional_segments):
             bmesh.ops.bisect_edges(bm, edges=bm.edges, cuts=subs-1)
 
 def get_double_faces_bmesh(bm):
-    double_faces = []
+    bm1 = bmesh.new()
+    # index of the source vertices
+    id_layer = bm1.verts.layers.int.new('tissue_vert_id')
     for f in bm.faces:
-        verts0 = [v.co for v in f.verts]
+        verts0 = list(f.verts)
         verts1 = verts0.copy()
         verts1.reverse()
-        double_faces.append(verts0)
-        double_faces.append(verts1)
-    bm1 = bmesh.new()
-    for verts_co in double_faces:
-        bm1.faces.new([bm1.verts.new(v) for v in verts_co])
+        for verts in (verts0, verts1):
+            new_verts = [bm1.verts.new(v.co) for v in verts]
+            for new_vert, v in zip(new_verts, verts):
+                new_vert[id_layer] = v.index
+            bm1.faces.new(new_verts)
     bm1.verts.ensure_lookup_table()
     bm1.edges.ensure_lookup_table()
     bm1.faces.ensure_lookup_table()
     return bm1
 
 def get_decomposed_polyhedra(bm):
-    polyhedra_from_facekey = {}
-    count = 0
-    to_merge = []
-    for e in bm.edges:
-        # ERROR: Naked edges
-        link_faces = e.link_faces
-        n_radial_faces = len(link_faces)
-        if n_radial_faces < 2:
-            return "Naked edges are not allowed"
-        vert0 = e.verts[0]
-        vert1 = e.verts[1]
-        edge_vec =  vert1.co - vert0.co
-
-        for id1 in range(n_radial_faces-1):
-            f1 = link_faces[id1]
-            facekey1 = f1.index+1
-            verts1 = [v.index for v in f1.verts]
-            v0_index = verts1.index(vert0.index)
-            v1_index = verts1.index(vert1.index)
-
-            ref_loop_dir = v0_index == (v1_index+1)%len(verts1)
-            edge_vec1 = edge_vec if ref_loop_dir else -edge_vec
-            tan1 = f1.normal.cross(edge_vec1)
-
-            # faces to compare with
-            faceskeys2, normals2 = get_second_faces(
-                link_faces,
-                vert0.index,
-                vert1.index,
-                ref_loop_dir,
-                f1
-            )
-
-            tangents2 = [nor.cross(-edge_vec1) for nor in normals2]
-
-            # positive side
-            facekey2_pos = get_closest_face(
-                faceskeys2,
-                tangents2,
-                tan1,
-                edge_vec1,
-                True
-            )
-            polyhedra_from_facekey, count, to_merge = store_neighbor_faces(
-                facekey1,
-                facekey2_pos,
-                polyhedra_from_facekey,
-                count,
-                to_merge
-            )
-            # negative side
-            facekey2_neg = get_closest_face(
-                faceskeys2,
-                tangents2,
-                tan1,
-                edge_vec1,
-                False
-            )
-            polyhedra_from_facekey, count, to_merge = store_neighbor_faces(
-                -facekey1,
-                facekey2_neg,
-                polyhedra_from_facekey,
-                count,
-                to_merge
-            )
-
-    polyhedra = [ [] for _ in range(count)]
-    unique_index = get_unique_polyhedra_index(count, to_merge)
-    for key, val in polyhedra_from_facekey.items():
-        polyhedra[unique_index[val]].append(key)
-    polyhedra = list(set(tuple(i) for i in polyhedra if i))
-    polyhedra = remove_double_faces_from_polyhedra(polyhedra)
+    bm.verts.index_update()
+    vertices = np.array([v.co for v in bm.verts])
+    normals = np.array([f.normal for f in bm.faces]).reshape((-1,3))
+    loop_total = np.array([len(f.verts) for f in bm.faces], dtype='int')
+    loops_vert = np.array([v.index for f in bm.faces for v in f.verts], dtype='int')
+    neighbors = get_radial_neighbors(vertices, normals, loops_vert, loop_total)
+    # ERROR: Naked edges
+    if neighbors is None:
+        return "Naked edges are not allowed"
+
+    # every face has two sides, labelled as disjoint sets
+    n_keys = len(loop_total)*2
+    parent = list(range(n_keys))
+    rank = [0]*n_keys
+    for key1, key2 in zip(*neighbors):
+        store_neighbor_faces(key1, key2, parent, rank)
+    return get_polyhedra_from_labels(parent)
+
+def get_radial_neighbors(vertices, normals, loops_vert, loop_total):
+    '''
+    Sort the faces around each edge by angle, and pair every side of each
+    face with the closest face side around all its edges.
+    Faces sides are identified by keys: face index + 1 for the side of the
+    normal, negative for the opposite side.
+    Returns None if there are naked edges.
+    '''
+    n_verts = len(vertices)
+    n_faces = len(loop_total)
+    loops_face = np.repeat(np.arange(n_faces), loop_total)
+    loop_start = np.cumsum(loop_total) - loop_total
+    loops_pos = np.arange(len(loops_vert)) - loop_start[loops_face]
+    loops_next = loops_vert[loop_start[loops_face] + (loops_pos+1) % loop_total[loops_face]]
+
+    # edge-face incidences, with the edge axis from the lower vertex index
+    id0 = np.minimum(loops_vert, loops_next)
+    id1 = np.maximum(loops_vert, loops_next)
+    forward = loops_vert < loops_next
+    edges_key = id0*n_verts + id1
+    axis = vertices[id1] - vertices[id0]
+    axis /= np.maximum(np.linalg.norm(axis, axis=1), 1e-12)[:,None]
+    # direction from the edge to the inside of the face
+    inner = np.cross(normals[loops_face], np.where(forward[:,None], axis, -axis))
+
+    order = np.argsort(edges_key, kind='stable')
+    edges_key = edges_key[order]
+    new_edge = np.ones(len(order), dtype='bool')
+    new_edge[1:] = edges_key[1:] != edges_key[:-1]
+    start = np.flatnonzero(new_edge)
+    count = np.diff(np.append(start, len(order)))
+    if np.any(count < 2): return None
+    start = np.repeat(start, count)
+    count = np.repeat(count, count)
+
+    # angle around the edge axis, from the first face of each edge
+    ref = inner[order][start]
+    inner = inner[order]
+    angle = np.arctan2(
+        np.einsum('ij,ij->i', inner, np.cross(axis[order], ref)),
+        np.einsum('ij,ij->i', inner, ref))
+    angle[new_edge] = 0
+    order = order[np.lexsort((angle, edges_key))]
+
+    # the positive side faces the next face around the loop direction
+    pos = np.arange(len(order)) - start
+    next_face = start + (pos+1) % count
+    prev_face = start + (pos-1) % count
+    forward = forward[order]
+    faces_key = loops_face[order] + 1
+    pos_face = np.where(forward, next_face, prev_face)
+    neg_face = np.where(forward, prev_face, next_face)
+    pos_key = np.where(forward[pos_face] != forward, 1, -1)*faces_key[pos_face]
+    neg_key = np.where(forward[neg_face] != forward, 1, -1)*faces_key[neg_face]
+    keys1 = np.concatenate((faces_key, -faces_key))
+    keys2 = np.concatenate((pos_key, -neg_key))
+    return keys1.tolist(), keys2.tolist()
+
+def get_facekey_index(facekey):
+    # index of the face side, as in get_double_faces_bmesh
+    return (facekey-1)*2 if facekey > 0 else (-facekey-1)*2+1
+
+def get_polyhedra_from_labels(parent):
+    polyhedra = {}
+    for i in range(len(parent)):
+        facekey = i//2+1 if i%2 == 0 else -(i//2+1)
+        root = find_polyhedron_label(parent, i)
+        polyhedra.setdefault(root, []).append(facekey)
+    polyhedra = remove_double_faces_from_polyhedra(list(polyhedra.values()))
     return polyhedra
 
 def remove_double_faces_from_polyhedra(polyhedra):
     new_polyhedra = []
     for polyhedron in polyhedra:
-        new_polyhedron = [key for key in polyhedron if -key not in polyhedron]
+        keys = set(polyhedron)
+        new_polyhedron = [key for key in polyhedron if -key not in keys]
         new_polyhedra.append(new_polyhedron)
     return new_polyhedra
 
-def get_unique_polyhedra_index(count, to_merge):
-    out = list(range(count))
-    keep_going = True
-    while keep_going:
-        keep_going = False
-        for pair in to_merge:
-            if out[pair[1]] != out[pair[0]]:
-                out[pair[0]] = out[pair[1]] = min(out[pair[0]], out[pair[1]])
-                keep_going = True
-    return out
-
-def get_closest_face(faces, tangents, ref_vector, axis, is_positive):
-    facekey = None
-    min_angle = 1000000
-    for fk, tangent in zip(faces, tangents):
-        rot_axis = -axis if is_positive else axis
-        angle = round_angle_with_axis(ref_vector, tangent, rot_axis)
-        if angle < min_angle:
-            facekey = fk
-            min_angle = angle
-    return facekey if is_positive else -facekey
-
-def get_second_faces(face_list, edge_v0, edge_v1, reference_loop_dir, self):
-    n_faces = len(face_list)-1
-    facekeys = [None]*n_faces
-    normals = [None]*n_faces
-    count = 0
-    for face in face_list:
-        if(face == self): continue
-        verts = [v.index for v in face.verts]
-        v0_index = verts.index(edge_v0)
-        v1_index = verts.index(edge_v1)
-        loop_dir = v0_index == (v1_index+1)%len(verts)
-        if reference_loop_dir != loop_dir:
-            facekeys[count] = face.index+1
-            normals[count] = face.normal
-        else:
-            facekeys[count] = -(face.index+1)
-            normals[count] = -face.normal
-        count+=1
-    return facekeys, normals
-
-def store_neighbor_faces(
-    key1,
-    key2,
-    polyhedra,
-    polyhedra_count,
-    to_merge
-):
-    poly1 = polyhedra.get(key1)
-    poly2 = polyhedra.get(key2)
-    if poly1 and poly2:
-        if poly1 != poly2:
-            to_merge.append((poly1, poly2))
-    elif poly1:
-        polyhedra[key2] = poly1
-    elif poly2:
-        polyhedra[key1] = poly2
-    else:
-        polyhedra[key1] = polyhedra[key2] = polyhedra_count
-        polyhedra_count += 1
-    return polyhedra, polyhedra_count, to_merge
-
-def add_polyhedron(bm,source_faces):
-    faces_verts_key = [[tuple(v.co) for v in f.verts] for f in source_faces]
-    polyhedron_verts_key = [key for face_key in faces_verts_key for key in face_key]
-    polyhedron_verts = [bm.verts.new(co) for co in polyhedron_verts_key]
-    polyhedron_verts_dict = dict(zip(polyhedron_verts_key, polyhedron_verts))
-    new_faces = [None]*len(faces_verts_key)
-    count = 0
-    for verts_keys in faces_verts_key:
-        new_faces[count] = bm.faces.new([polyhedron_verts_dict.get(key) for key in verts_keys])
-        count+=1
+def find_polyhedron_label(parent, i):
+    # find the root of the set, with path halving
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def merge_polyhedra_labels(parent, rank, i, j):
+    # union by rank
+    i = find_polyhedron_label(parent, i)
+    j = find_polyhedron_label(parent, j)
+    if i == j: return
+    if rank[i] < rank[j]: i, j = j, i
+    parent[j] = i
+    if rank[i] == rank[j]: rank[i] += 1
+
+def store_neighbor_faces(key1, key2, parent, rank):
+    merge_polyhedra_labels(parent, rank, get_facekey_index(key1), get_facekey_index(key2))
+
+def add_polyhedron(bm, source_faces, source_layer, id_layer):
+    # vertices shared by the faces of the polyhedron
+    polyhedron_verts = {}
+    new_faces = [None]*len(source_faces)
+    for i, f in enumerate(source_faces):
+        face_verts = []
+        for v in f.verts:
+            id = v[source_layer]
+            new_vert = polyhedron_verts.get(id)
+            if new_vert is None:
+                new_vert = polyhedron_verts[id] = bm.verts.new(v.co)
+                new_vert[id_layer] = id
+            face_verts.append(new_vert)
+        new_faces[i] = bm.faces.new(face_verts)
 
     bm.faces.ensure_lookup_table()
     bm.faces.index_update()
@@ -996,6 +1044,8 @@ def add_polyhedron(bm,source_faces):
 
 def combine_polyhedra_faces(bm,polyhedra):
     new_bm = bmesh.new()
+    source_layer = bm.verts.layers.int['tissue_vert_id']
+    id_layer = new_bm.verts.layers.int.new('tissue_vert_id')
     polyhedra_faces_id = [None]*len(polyhedra)
     all_faces_dict = {}
     polyhedra_faces_id_neg = {}
@@ -1003,7 +1053,7 @@ def combine_polyhedra_faces(bm,polyhedra):
     for p in polyhedra:
         faces_id = [(f-1)*2 if f > 0 else (-f-1)*2+1 for f in p]
         faces_id_neg = [(-f-1)*2 if f < 0 else (f-1)*2+1 for f in p]
-        new_faces = add_polyhedron(new_bm,[bm.faces[f_id] for f_id in faces_id])
+        new_faces = add_polyhedron(new_bm, [bm.faces[f_id] for f_id in faces_id], source_layer, id_layer)
         for i in range(len(new_faces)):
             face = new_faces[i]
             f_id = faces_id[i]
@@ -53,6 +53,7 @@ def tessellated(ob):
 
 def tessellate_patch(props):
     tt = time.time()
+    clear_corner_attributes_cache()
 
     ob = props['self']
     _ob0 = props['generator']
@@ -289,6 +290,7 @@ def tessellate_patch(props):
             elif m.type in not_allowed:
                 bpy.data.meshes.remove(ob0.data)
                 #bpy.data.meshes.remove(me0)
+                clear_corner_attributes_cache()
                 return "modifiers_error"
 
         before = _ob0.copy()
@@ -359,8 +361,7 @@ def tessellate_patch(props):
     weight = weight_thickness = weight_rotation = None
     if read_vertex_groups:
         if bool_vertex_group:
-            weight = [get_weight(vg, n_verts0) for vg in ob0.vertex_groups]
-            weight = np.array(weight)
+            weight = get_weights_numpy(ob0)
             n_vg = len(ob0.vertex_groups)
             if rotation_mode == 'WEIGHT':
                 vg_id = ob0.vertex_groups[vertex_group_rotation].index
@@ -801,18 +802,12 @@ def tessellate_patch(props):
 
             # Try to read an "Eval_Normals" corner attribute (Geometry Nodes)
             # If present map loop/corner data back to per-vertex UV-like coords
-            uv_loops = get_corner_attribute_vectors(me1, attr_name='Eval_Normals', use_evaluated=False, prefer_attributes=True)
+            uv_loops = get_corner_attribute_numpy(me1, attr_name='Eval_Normals', use_evaluated=False, prefer_attributes=True)
             if uv_loops is not None:
                 # map loop-level UVs to a per-vertex array (similar to uv_from_bmesh behavior)
-                uv_vert = [ (0.0, 0.0) ] * n_verts1
-                for li, uv in enumerate(uv_loops):
-                    try:
-                        vi = me1.loops[li].vertex_index
-                        uv_vert[vi] = uv
-                    except Exception:
-                        pass
-                uv_co = np.array(uv_vert)
-                vx_nor = uv_co[:,0]
+                loops_vert = get_attribute_numpy(me1.loops, 'vertex_index').astype('int')
+                vx_nor = np.zeros(n_verts1)
+                vx_nor[loops_vert] = uv_loops[:,0]
 
                 # grid coordinates
                 np_u = np.clip(vx_nor//step, 0, sides).astype('int')
@@ -1014,6 +1009,7 @@ def tessellate_patch(props):
         new_objects.append(new_patch)
         bpy.data.objects.remove(ob1)
     bpy.data.objects.remove(ob0)
+    clear_corner_attributes_cache()
     tt = tissue_time(tt, "Closing Tessellate Iteration", levels=2)
     return new_objects
 
@@ -1880,7 +1876,7 @@ class tissue_update_tessellate_deps(Operator):
                             self.report({'ERROR'}, "Can't compute Curve :-(")
                     if o.tissue.tissue_type == 'CONTOUR_CURVES':
                         try:
-                            bpy.ops.object.tissue_update_contour_curves()
+                            bpy.ops.object.tissue_update_contour_curves(use_cache=False)
                         except:
                             self.report({'ERROR'}, "Can't compute Contour Curves :-(")
 
@@ -3336,7 +3332,7 @@ def convert_to_frame(ob, props, use_modifiers=True):
             selected_edges = selected_edges[1:]
             if props['bool_vertex_group'] or True:
                 n_verts = len(new_ob.data.vertices)
-                base_vg = [get_weight(vg,n_verts) for vg in new_ob.vertex_groups]
+                base_vg = get_weights_numpy(new_ob).tolist()
             while True:
                 new_vert = None
                 face = None
@@ -10,6 +10,7 @@ from statistics import mean, stdev
 from mathutils import Vector
 from mathutils.kdtree import KDTree
 from numpy import *
+from .numba_functions import bool_numba
 try: from .numba_functions import run_tex_rd, run_tex_rd_ani
 except: pass
 #from .numba_functions import integrate_field
@@ -201,7 +202,7 @@ class tex_reaction_diffusion_prop(PropertyGroup):
 
     bool_cache : BoolProperty(
         name="Use Cache", default=False,
-        description="Read modifiers affect the vertex groups")
+        description="Read the images A and B from the baked cache")
 
     cache_frame_start : IntProperty(
         name="Start", default=1,
@@ -216,15 +217,159 @@ class tex_reaction_diffusion_prop(PropertyGroup):
         description = 'Directory that contains Reaction-Diffusion cache files'
         )
 
+    cache_half : BoolProperty(
+        name="Half Precision", default=False,
+        description="Store the cache as 16-bit floats, halving the size of the files")
+
     normalize : BoolProperty(
         name="Normalize values", default=False,
         description="Normalize values from 0 to 1")
 
+    solver : EnumProperty(
+        items=(
+            ('EXPLICIT', "Explicit", "Finite differences on the 8-neighbours stencil. Works with every image map"),
+            ('SPECTRAL', "Spectral (FFT)", "Exact diffusion in Fourier space on a periodic domain. Allows much larger time steps, but requires uniform diffusion (no Vector Field, Diff or Scale images)")
+            ),
+        default='EXPLICIT',
+        name="Solver",
+        description="Integration method used for the diffusion")
+
+def tex_laplacian_symbol(nx, ny):
+    '''
+    Fourier symbol of the isotropic 8-neighbours Laplacian stencil on a
+    periodic (nx, ny) grid, in the layout returned by numpy.fft.rfft2.
+    '''
+    diag = sqrt(2)/2
+    kx = 2*pi*np.fft.fftfreq(nx)[:,None]
+    ky = 2*pi*np.fft.rfftfreq(ny)[None,:]
+    return 2*(np.cos(kx)-1) + 2*(np.cos(ky)-1) + \
+        2*diag*(np.cos(kx+ky)-1) + 2*diag*(np.cos(kx-ky)-1)
+
+def run_tex_rd_spectral(A, B, diff_A, diff_B, f, k, dt, steps, brush):
+    '''
+    Integrate the Gray-Scott model with an exponential integrating factor:
+    the diffusion is solved exactly in Fourier space, while the reaction is
+    computed explicitly. Diffusion coefficients must be uniform.
+    '''
+    nx, ny = A.shape
+    lap = tex_laplacian_symbol(nx, ny)
+    exp_A = np.exp(lap*diff_A*dt)
+    exp_B = np.exp(lap*diff_B*dt)
+    for t in range(steps):
+        B += brush
+        ab2 = A*B**2
+        A += (f*(1-A) - ab2)*dt
+        B += (ab2 - (k+f)*B)*dt
+        np.clip(A,0,1,out=A)
+        np.clip(B,0,1,out=B)
+        A[:] = np.fft.irfft2(np.fft.rfft2(A)*exp_A, s=(nx,ny))
+        B[:] = np.fft.irfft2(np.fft.rfft2(B)*exp_B, s=(nx,ny))
+
+def np_tex_laplacian_ani(lap, arr, VF, pad, arr2, tmp):
+    '''
+    NumPy version of tex_laplacian_ani. The mirrored boundaries are written
+    in the preallocated pad buffer, of shape (nx+2, ny+2).
+    '''
+    pad[1:-1,1:-1] = arr
+    pad[0,1:-1] = arr[1]
+    pad[-1,1:-1] = arr[-2]
+    pad[:,0] = pad[:,2]
+    pad[:,-1] = pad[:,-3]
+    np.multiply(arr, 2, out=arr2)
+    # (i0, j) + (i1, j)
+    np.add(pad[:-2,1:-1], pad[2:,1:-1], out=tmp)
+    tmp -= arr2
+    np.multiply(tmp, VF[0], out=lap)
+    # (i, j0) + (i, j1)
+    np.add(pad[1:-1,:-2], pad[1:-1,2:], out=tmp)
+    tmp -= arr2
+    tmp *= VF[1]
+    lap += tmp
+    # (i0, j0) + (i1, j1)
+    np.add(pad[:-2,:-2], pad[2:,2:], out=tmp)
+    tmp -= arr2
+    tmp *= VF[2]
+    lap += tmp
+    # (i1, j0) + (i0, j1)
+    np.add(pad[2:,:-2], pad[:-2,2:], out=tmp)
+    tmp -= arr2
+    tmp *= VF[3]
+    lap += tmp
+
+def np_run_tex_rd_ani(A, B, lap_A, lap_B, diff_A, diff_B, f, k, dt, steps, vf1, vf2, brush):
+    '''
+    NumPy version of run_tex_rd_ani, used when Numba is not available.
+    '''
+    nx, ny = A.shape
+    pad = np.zeros((nx+2, ny+2))
+    arr2 = np.zeros((nx, ny))
+    tmp = np.zeros((nx, ny))
+    ab2 = np.zeros((nx, ny))
+    for t in range(steps):
+        np_tex_laplacian_ani(lap_A, A, vf2, pad, arr2, tmp)
+        np_tex_laplacian_ani(lap_B, B, vf1, pad, arr2, tmp)
+        B += brush
+        np.multiply(B, B, out=ab2)
+        ab2 *= A
+        # A += (lap_A*diff_A - ab2 + f*(1-A))*dt
+        np.subtract(1, A, out=tmp)
+        tmp *= f
+        tmp -= ab2
+        lap_A *= diff_A
+        tmp += lap_A
+        tmp *= dt
+        A += tmp
+        # B += (lap_B*diff_B + ab2 - (k+f)*B)*dt
+        np.add(k, f, out=tmp)
+        tmp *= B
+        np.subtract(ab2, tmp, out=tmp)
+        lap_B *= diff_B
+        tmp += lap_B
+        tmp *= dt
+        B += tmp
+
 def tex_rd_scene(scene, bake=False):
     for ob in bpy.context.scene.objects:
-        if ob.tex_reaction_diffusion_settings.run:
+        props = ob.tex_reaction_diffusion_settings
+        if props.run or props.bool_cache:
             tex_reaction_diffusion_def(ob)
 
+def tex_rd_cache_folder(props):
+    '''
+    Return the cache directory of the Texture Reaction-Diffusion, creating
+    a new one if not specified.
+    '''
+    if props.cache_dir == '':
+        letters = string.ascii_letters
+        random_name = ''.join(rnd.choice(letters) for i in range(6))
+        if bpy.context.blend_data.filepath == '':
+            folder = Path(bpy.context.preferences.filepaths.temporary_directory)
+            folder = folder / 'tex_reaction_diffusion_cache' / random_name
+        else:
+            folder = '//' + Path(bpy.context.blend_data.filepath).stem
+            folder = Path(bpy.path.abspath(folder)) / 'tex_reaction_diffusion_cache' / random_name
+        folder.mkdir(parents=True, exist_ok=True)
+        props.cache_dir = str(folder)
+    else:
+        folder = Path(bpy.path.abspath(props.cache_dir))
+    return folder
+
+def tex_rd_cache_file(folder, frame):
+    return folder / "ab_{:04d}.npy".format(frame)
+
+def tex_rd_store_image(img, values):
+    '''
+    Store the values of a chemical (nx, ny) in the RGB channels of the image.
+    '''
+    nx, ny = values.shape
+    if tuple(img.size) != (ny, nx):
+        img.scale(ny, nx)
+    px = np.ones((nx*ny, 4), dtype=np.float32)
+    px[:,:3] = values.reshape((-1,1))
+    img.pixels.foreach_set(px.reshape((-1)))
+    img.pixels.update()
+    img.update()
+
 def tex_reaction_diffusion_def(ob, bake=False):
     try:
         props = ob.tex_reaction_diffusion_settings
@@ -233,6 +378,21 @@ def tex_reaction_diffusion_def(ob, bake=False):
     scene = bpy.context.scene
     print("Texture Reaction Diffusion: " + str(scene.frame_current))
     start_time = timeit.default_timer()
+
+    if bake or props.bool_cache:
+        folder = tex_rd_cache_folder(props)
+
+    if props.bool_cache:
+        # load the baked frame directly, without simulating previous frames
+        try:
+            ab = np.load(tex_rd_cache_file(folder, scene.frame_current), mmap_mode='r')
+        except:
+            print('       Cannot read cache.')
+            return
+        tex_rd_store_image(bpy.data.images[props.img_a], np.float32(ab[0]))
+        tex_rd_store_image(bpy.data.images[props.img_b], np.float32(ab[1]))
+        print("Loaded cache: " + str(timeit.default_timer() - start_time) + " sec")
+        return
     img_a = bpy.data.images[props.img_a]
     img_b = bpy.data.images[props.img_b]
     diff_a = props.diff_a
@@ -369,6 +529,14 @@ def tex_reaction_diffusion_def(ob, bake=False):
 
     print("Load images: " + str(timeit.default_timer() - start_time) + " sec")
 
+    # the spectral solver needs a uniform diffusion
+    use_spectral = props.solver == 'SPECTRAL'
+    if use_spectral and (img_vector_field or img_diff_a or img_diff_b or img_scale):
+        print("Spectral solver requires uniform diffusion. Using Explicit solver.")
+        use_spectral = False
+    uniform_diff_a = props.diff_a*props.diff_mult
+    uniform_diff_b = props.diff_b*props.diff_mult
+
     start_time = timeit.default_timer()
 
     a_px = np.array(a_px).reshape((-1,4))
@@ -384,12 +552,22 @@ def tex_reaction_diffusion_def(ob, bake=False):
     print("Reshape data time: " + str(timeit.default_timer() - start_time) + " sec")
 
     start_time = timeit.default_timer()
-    run_tex_rd_ani(a, b, lap_a, lap_b, diff_a, diff_b, f, k, dt, time_steps, vf1, vf2, brush)
+    if use_spectral:
+        run_tex_rd_spectral(a, b, uniform_diff_a, uniform_diff_b, f, k, dt, time_steps, brush)
+    elif bool_numba:
+        run_tex_rd_ani(a, b, lap_a, lap_b, diff_a, diff_b, f, k, dt, time_steps, vf1, vf2, brush)
+    else:
+        print('Not using Numba! The simulation could be slow.')
+        np_run_tex_rd_ani(a, b, lap_a, lap_b, diff_a, diff_b, f, k, dt, time_steps, vf1, vf2, brush)
     print("Simulation time: " + str(timeit.default_timer() - start_time) + " sec")
 
     start_time = timeit.default_timer()
     np.clip(a,0,1,out=a)
     np.clip(b,0,1,out=b)
+    if bake:
+        folder.mkdir(parents=True, exist_ok=True)
+        dtype = np.float16 if props.cache_half else np.float32
+        np.save(tex_rd_cache_file(folder, scene.frame_current), np.array((a,b), dtype=dtype))
     a = a.flatten()
     b = b.flatten()
     a_px[:,0] = a
@@ -462,6 +640,48 @@ class reset_tex_reaction_diffusion(Operator):
 
         return {'FINISHED'}
 
+class bake_tex_reaction_diffusion(Operator):
+    bl_idname = "object.bake_tex_reaction_diffusion"
+    bl_label = "Bake Data"
+    bl_description = ("Bake the Texture Reaction-Diffusion to the cache directory")
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        props = context.object.tex_reaction_diffusion_settings
+        return props.img_a in bpy.data.images and props.img_b in bpy.data.images
+
+    def execute(self, context):
+        ob = context.object
+        props = ob.tex_reaction_diffusion_settings
+        props.bool_cache = False
+        for frame in range(props.cache_frame_start, props.cache_frame_end+1):
+            context.scene.frame_current = frame
+            tex_reaction_diffusion_def(ob, bake=True)
+        props.bool_cache = True
+        tex_reaction_diffusion_add_handler(self, context)
+        context.scene.frame_current = props.cache_frame_start
+        tex_reaction_diffusion_def(ob)
+        return {'FINISHED'}
+
+class tex_reaction_diffusion_free_data(Operator):
+    bl_idname = "object.tex_reaction_diffusion_free_data"
+    bl_label = "Free Data"
+    bl_description = ("Free Texture Reaction-Diffusion data")
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        ob = context.object
+        props = ob.tex_reaction_diffusion_settings
+        props.bool_cache = False
+
+        folder = Path(bpy.path.abspath(props.cache_dir))
+        for i in range(props.cache_frame_start, props.cache_frame_end+1):
+            file_name = tex_rd_cache_file(folder, i)
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        return {'FINISHED'}
+
 class start_tex_reaction_diffusion(Operator):
     bl_idname = "object.start_tex_reaction_diffusion"
     bl_label = "Start Texture Reaction Diffusion"
@@ -562,6 +782,14 @@ class TISSUE_PT_tex_reaction_diffusion(Panel):
             row.prop(props, "time_steps")
             row.prop(props, "dt")
             row.enabled = not props.bool_cache
+            row = col.row(align=True)
+            row.prop(props, "solver", text="")
+            row.enabled = not props.bool_cache
+            if props.solver == 'SPECTRAL':
+                images = bpy.data.images
+                if props.img_vector_field in images or props.img_diff_a in images or \
+                    props.img_diff_b in images or props.img_scale in images:
+                    col.label(text="Non-uniform diffusion: using Explicit", icon='INFO')
             col.separator()
             row = col.row(align=True)
             col1 = row.column(align=True)
@@ -581,28 +809,47 @@ class TISSUE_PT_tex_reaction_diffusion(Panel):
             col1 = row.column(align=True)
             col1.prop(props, "k")
             col1.enabled = props.img_k == '' and not props.bool_cache
-            '''
-            col.separator()
-            col.label(text='Cache:')
-            #col.prop(props, "bool_cache")
-            col.prop(props, "cache_dir", text='')
-            col.separator()
+
+class TISSUE_PT_tex_reaction_diffusion_cache(Panel):
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_context = "object"
+    bl_parent_id = "TISSUE_PT_tex_reaction_diffusion"
+    bl_label = "Cache"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    @classmethod
+    def poll(cls, context):
+        props = context.object.tex_reaction_diffusion_settings
+        if props.img_a and props.img_b in bpy.data.images.keys():
+            return True
+        else:
+            return False
+
+    def draw(self, context):
+        ob = context.object
+        props = ob.tex_reaction_diffusion_settings
+        layout = self.layout
+        col = layout.column(align=True)
+        col.label(text='Cache:')
+        col.prop(props, "cache_dir", text='')
+        col.separator()
+        row = col.row(align=True)
+        row.prop(props, "cache_frame_start")
+        row.prop(props, "cache_frame_end")
+        col.prop(props, "cache_half")
+        col.separator()
+        if props.bool_cache:
+            col.operator("object.tex_reaction_diffusion_free_data")
+        else:
             row = col.row(align=True)
-            row.prop(props, "cache_frame_start")
-            row.prop(props, "cache_frame_end")
-            col.separator()
-            if props.bool_cache:
-                col.operator("object.reaction_diffusion_free_data")
-            else:
-                row = col.row(align=True)
-                row.operator("object.bake_reaction_diffusion")
-                file = bpy.context.blend_data.filepath
-                temp = bpy.context.preferences.filepaths.temporary_directory
-                if file == temp == props.cache_dir == '':
-                    row.enabled = False
-                    col.label(text="Cannot use cache", icon='ERROR')
-                    col.label(text='please save the Blender or set a Cache directory')
-            '''
+            row.operator("object.bake_tex_reaction_diffusion")
+            file = bpy.context.blend_data.filepath
+            temp = bpy.context.preferences.filepaths.temporary_directory
+            if file == temp == props.cache_dir == '':
+                row.enabled = False
+                col.label(text="Cannot use cache", icon='ERROR')
+                col.label(text='please save the Blender or set a Cache directory')
 
 class TISSUE_PT_tex_reaction_diffusion_images(Panel):
     bl_space_type = 'PROPERTIES'
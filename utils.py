@@ -4,13 +4,21 @@
 
 import bpy, bmesh
 import threading
+import heapq
 import numpy as np
+from itertools import chain
 import multiprocessing
 from multiprocessing import Process, Pool
 from mathutils import Vector, Matrix
 from math import *
 try: from .numba_functions import *
 except: pass
+try:
+    import scipy.sparse
+    import scipy.sparse.linalg
+    bool_scipy = True
+except:
+    bool_scipy = False
 
 from . import config
 
@@ -1084,128 +1092,536 @@ def get_faces_edges_numpy(mesh):
     faces = [v.edge_keys for f in mesh.polygons]
     return np.array(faces)
 
+def get_loops_faces_numpy(mesh):
+    '''
+    Create two numpy arrays with the edge index and the polygon index of
+    every loop (corner) of a given mesh
+    '''
+    loops_edge = get_attribute_numpy(mesh.loops, 'edge_index').astype('int')
+    loop_total = get_attribute_numpy(mesh.polygons, 'loop_total').astype('int')
+    loops_face = np.repeat(np.arange(len(loop_total)), loop_total)
+    return loops_edge, loops_face
+
+def get_next_loops_numpy(loop_total):
+    '''
+    Index of the next loop of the same polygon, for every loop
+    '''
+    loop_start = np.cumsum(loop_total) - loop_total
+    next_loops = np.arange(np.sum(loop_total)) + 1
+    next_loops[loop_start + loop_total - 1] = loop_start
+    return next_loops
+
+def get_edges_face_angle_signed_numpy(mesh):
+    '''
+    Create a numpy array with the signed angle between the two polygons of
+    every edge of a given mesh (negative for concave edges), like
+    BMEdge.calc_face_angle_signed(). Non-manifold edges have angle 0.
+    '''
+    n_edges = len(mesh.edges)
+    loops_edge, loops_face = get_loops_faces_numpy(mesh)
+    loops_vert = get_attribute_numpy(mesh.loops, 'vertex_index').astype('int')
+    loop_total = get_attribute_numpy(mesh.polygons, 'loop_total').astype('int')
+    normals = get_attribute_numpy(mesh.polygons, 'normal', mult=3)
+    vertices = get_vertices_numpy(mesh)
+    # vertex of the next loop of the same polygon
+    loop_start = np.repeat(np.cumsum(loop_total) - loop_total, loop_total)
+    loop_id = np.arange(len(loops_edge))
+    loops_next = loops_vert[loop_start + (loop_id - loop_start + 1) % loop_total[loops_face]]
+    # the two loops of each manifold edge
+    order = np.argsort(loops_edge, kind='stable')
+    n_loops = np.bincount(loops_edge, minlength=n_edges)
+    manifold = np.flatnonzero(n_loops == 2)
+    first = (np.cumsum(n_loops) - n_loops)[manifold]
+    l1 = order[first]
+    l2 = order[first+1]
+    n1 = normals[loops_face[l1]]
+    n2 = normals[loops_face[l2]]
+    angle = np.arccos(np.clip(np.einsum('ij,ij->i', n1, n2), -1, 1))
+    direction = vertices[loops_next[l1]] - vertices[loops_vert[l1]]
+    convex = np.einsum('ij,ij->i', direction, np.cross(n1, n2)) > 0
+    convex |= np.all(n1 == n2, axis=1)
+    angles = np.zeros(n_edges)
+    angles[manifold] = np.where(convex, angle, -angle)
+    return angles
+
+def contour_edges_levels(weight, edges, iso_values, loops_edge=None, loops_face=None):
+    """
+    Find the crossings between the edges and all the iso values in one pass.
+    An edge crosses an iso value when exactly one of its vertices has a
+    weight lower or equal to it.
+    :arg weight: Weight value of each vertex.
+    :type weight: :class:'numpy.ndarray'
+    :arg edges: Vertex indexes of each edge, with shape (n_edges, 2).
+    :type edges: :class:'numpy.ndarray'
+    :arg iso_values: Contour values, in ascending order.
+    :type iso_values: :class:'numpy.ndarray'
+    :arg loops_edge: Edge index of each loop (optional).
+    :type loops_edge: :class:'numpy.ndarray'
+    :arg loops_face: Polygon index of each loop (optional).
+    :type loops_face: :class:'numpy.ndarray'
+    :return: Edge index, level index and interpolation factor of each
+        crossing, sorted by edge. If loops are provided, also the segments
+        connecting the crossings inside the polygons, as pairs of crossing
+        indexes.
+    :rtype: tuple
+    """
+    iso_values = np.asarray(iso_values)
+    n_edges = len(edges)
+    w0 = weight[edges[:,0]]
+    w1 = weight[edges[:,1]]
+    # range of iso values crossed by each edge: w_min <= iso < w_max
+    lo = np.searchsorted(iso_values, np.minimum(w0, w1), side='left')
+    hi = np.searchsorted(iso_values, np.maximum(w0, w1), side='left')
+    count = hi - lo
+    offset = np.zeros(n_edges+1, dtype='int')
+    np.cumsum(count, out=offset[1:])
+    n_cross = offset[-1]
+
+    cross_edge = np.repeat(np.arange(n_edges), count)
+    cross_level = np.arange(n_cross) - np.repeat(offset[:-1] - lo, count)
+    w0 = w0[cross_edge]
+    w1 = w1[cross_edge]
+    cross_param = (iso_values[cross_level] - w0)/(w1 - w0)
+    if loops_edge is None:
+        return cross_edge, cross_level, cross_param
+
+    # expand every loop to the crossings of its edge
+    loops_count = count[loops_edge]
+    n_items = np.sum(loops_count)
+    item_loop = np.repeat(np.arange(len(loops_edge)), loops_count)
+    loops_offset = np.cumsum(loops_count) - loops_count
+    item_edge = loops_edge[item_loop]
+    item_level = np.arange(n_items) - np.repeat(loops_offset, loops_count) + lo[item_edge]
+    item_cross = offset[item_edge] + item_level - lo[item_edge]
+    item_face = loops_face[item_loop]
+
+    # pair consecutive crossings of the same polygon and level
+    order = np.lexsort((item_loop, item_level, item_face))
+    item_face = item_face[order]
+    item_level = item_level[order]
+    item_cross = item_cross[order]
+    new_group = np.ones(n_items, dtype='bool')
+    new_group[1:] = (item_face[1:] != item_face[:-1]) | (item_level[1:] != item_level[:-1])
+    ids = np.arange(n_items)
+    rank = ids - np.maximum.accumulate(np.where(new_group, ids, 0))
+    first = np.flatnonzero((rank[:-1]%2 == 0) & ~new_group[1:])
+    segments = np.stack((item_cross[first], item_cross[first+1]), axis=1)
+    return cross_edge, cross_level, cross_param, segments
+
+def slice_polygons_numpy(weight, loops_vert, loop_total, iso_val):
+    """
+    Split the polygons crossed by an iso value of a scalar field. A new
+    vertex is added on every edge crossing the iso value, while vertices
+    lying exactly on it are used as split points.
+    Every polygon is cut into the pieces between two consecutive split
+    points, polygons with more than two split points also get the central
+    polygon connecting all of them.
+    :arg weight: Scalar value of each vertex.
+    :type weight: :class:'numpy.ndarray'
+    :arg loops_vert: Vertex index of each loop.
+    :type loops_vert: :class:'numpy.ndarray'
+    :arg loop_total: Number of loops of each polygon.
+    :type loop_total: :class:'numpy.ndarray'
+    :arg iso_val: Contour value.
+    :type iso_val: float
+    :return: Vertex indexes (n_new, 2) and interpolation factor of the new
+        vertices, vertex index of the new loops, number of loops of the new
+        polygons, original polygon of the new polygons, original loops
+        (n_loops, 2) and interpolation factor of the new loops.
+    :rtype: tuple of :class:'numpy.ndarray'
+    """
+    n_verts = len(weight)
+    n_polys = len(loop_total)
+    n_loops = len(loops_vert)
+    loop_start = np.cumsum(loop_total) - loop_total
+    loops_face = np.repeat(np.arange(n_polys), loop_total)
+    loops_pos = np.arange(n_loops) - loop_start[loops_face]
+    loops_next = loop_start[loops_face] + (loops_pos + 1) % loop_total[loops_face]
+    loops_prev = loop_start[loops_face] + (loops_pos - 1) % loop_total[loops_face]
+    v0 = loops_vert
+    v1 = loops_vert[loops_next]
+
+    below = weight < iso_val
+    on_iso = weight == iso_val
+    # edges crossing the iso value get a new vertex
+    crossing = (below[v0] != below[v1]) & ~on_iso[v0] & ~on_iso[v1]
+    # vertices on the iso value split the polygons touching lower values
+    corner_cut = on_iso[v0] & (below[v1] | below[loops_vert[loops_prev]])
+    n_cuts = np.bincount(loops_face, weights=crossing.astype('int') + corner_cut,
+        minlength=n_polys).astype('int')
+    split = n_cuts > 1
+    n_cuts[~split] = 0
+    crossing &= split[loops_face]
+    corner_cut &= split[loops_face]
+
+    # new vertices, shared by the loops of the same edge
+    cross_loops = np.flatnonzero(crossing)
+    id0 = v0[cross_loops]
+    id1 = v1[cross_loops]
+    keys = np.minimum(id0, id1)*n_verts + np.maximum(id0, id1)
+    keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    new_verts = np.stack((id0[first], id1[first]), axis=1)
+    w0 = weight[new_verts[:,0]]
+    new_param = (iso_val - w0)/(weight[new_verts[:,1]] - w0)
+    loops_new_vert = np.zeros(n_loops, dtype='int')
+    loops_new_vert[cross_loops] = n_verts + inverse.reshape((-1))
+    loops_param = np.zeros(n_loops)
+    w0 = weight[id0]
+    loops_param[cross_loops] = (iso_val - w0)/(weight[id1] - w0)
+
+    # items of the refined polygons: every loop followed by its new vertex
+    count = 1 + crossing
+    n_items = np.sum(count)
+    item_loop = np.repeat(np.arange(n_loops), count)
+    item_cross = np.zeros(n_items, dtype='bool')
+    item_cross[(np.cumsum(count) - 1)[crossing]] = True
+    item_cut = item_cross | corner_cut[item_loop]
+    item_face = loops_face[item_loop]
+    face_items = np.bincount(item_face, minlength=n_polys)
+    face_start = np.cumsum(face_items) - face_items
+    item_pos = np.arange(n_items) - face_start[item_face]
+
+    # rotate the split polygons to start from a split point
+    cuts = np.flatnonzero(item_cut)
+    first_cut = np.zeros(n_polys, dtype='int')
+    faces, first = np.unique(item_face[cuts], return_index=True)
+    first_cut[faces] = item_pos[cuts[first]]
+    item_pos = (item_pos - first_cut[item_face]) % face_items[item_face]
+    order = np.lexsort((item_pos, item_face))
+    item_loop = item_loop[order]
+    item_cross = item_cross[order]
+    item_cut = item_cut[order]
+    item_pos = item_pos[order]
+
+    # every split point starts a new piece and closes the previous one
+    n_pieces = np.where(split, n_cuts + (n_cuts > 2), 1)
+    piece_start = np.cumsum(n_pieces) - n_pieces
+    cuts_start = np.cumsum(n_cuts) - n_cuts
+    item_piece = np.cumsum(item_cut) - cuts_start[item_face] - split[item_face]
+    cuts = np.flatnonzero(item_cut)
+    cuts_face = item_face[cuts]
+    close_piece = (item_piece[cuts] - 1) % n_cuts[cuts_face]
+    central = cuts[n_cuts[cuts_face] > 2]
+    central_face = item_face[central]
+    items = np.concatenate((np.arange(n_items), cuts, central))
+    pieces = np.concatenate((
+        piece_start[item_face] + item_piece,
+        piece_start[cuts_face] + close_piece,
+        piece_start[central_face] + n_cuts[central_face]))
+    keys = np.concatenate((item_pos, face_items[cuts_face], item_pos[central]))
+    order = np.lexsort((keys, pieces))
+    items = items[order]
+    pieces = pieces[order]
+
+    # remove degenerate pieces between adjacent split points
+    pieces_size = np.bincount(pieces, minlength=np.sum(n_pieces))
+    valid = pieces_size > 2
+    items = items[valid[pieces]]
+    loop_total = pieces_size[valid]
+    polygons_index = np.repeat(np.arange(n_polys), n_pieces)[valid]
+
+    item_loop = item_loop[items]
+    item_cross = item_cross[items]
+    loops_vert = np.where(item_cross, loops_new_vert[item_loop], v0[item_loop])
+    loops_index = np.stack((item_loop, np.where(item_cross, loops_next[item_loop], item_loop)), axis=1)
+    loops_param = np.where(item_cross, loops_param[item_loop], 0)
+    return new_verts, new_param, loops_vert, loop_total, polygons_index, loops_index, loops_param
+
+def slice_mesh_numpy(vertices, weight, loops_vert, loop_total, iso_values,
+    verts_data=None, loops_data=None, polygons_data=None):
+    """
+    Split the polygons of a mesh along the contours of a scalar field, one
+    iso value after the other.
+    :arg vertices: Coordinates of the vertices.
+    :type vertices: :class:'numpy.ndarray'
+    :arg weight: Scalar value of each vertex.
+    :type weight: :class:'numpy.ndarray'
+    :arg loops_vert: Vertex index of each loop.
+    :type loops_vert: :class:'numpy.ndarray'
+    :arg loop_total: Number of loops of each polygon.
+    :type loop_total: :class:'numpy.ndarray'
+    :arg iso_values: Contour values.
+    :type iso_values: list
+    :arg verts_data: Values interpolated on the new vertices (optional).
+    :type verts_data: :class:'numpy.ndarray'
+    :arg loops_data: Values interpolated on the new loops (optional).
+    :type loops_data: :class:'numpy.ndarray'
+    :arg polygons_data: Values copied on the new polygons (optional).
+    :type polygons_data: :class:'numpy.ndarray'
+    :return: Vertices, weight, loops vertex index, loops total, the
+        additional data of the new mesh and the source edge of each vertex
+        (the same index twice for the source vertices).
+    :rtype: tuple of :class:'numpy.ndarray'
+    """
+    def interpolate(values, index, param):
+        if values is None: return None
+        param = param.reshape((-1,) + (1,)*(values.ndim-1))
+        return values[index[:,0]] + (values[index[:,1]] - values[index[:,0]])*param
+
+    verts_edge = np.repeat(np.arange(len(vertices))[:,None], 2, axis=1)
+    for iso_val in iso_values:
+        new_verts, new_param, loops_vert, loop_total, polygons_index, loops_index, loops_param = \
+            slice_polygons_numpy(weight, loops_vert, loop_total, iso_val)
+        # the new vertices split the source edges
+        new_edge = np.concatenate((verts_edge[new_verts[:,0]], verts_edge[new_verts[:,1]]), axis=1)
+        new_edge = np.stack((np.min(new_edge, axis=1), np.max(new_edge, axis=1)), axis=1)
+        verts_edge = np.concatenate((verts_edge, new_edge))
+        vertices = np.concatenate((vertices, interpolate(vertices, new_verts, new_param)))
+        weight = np.concatenate((weight, np.full(len(new_verts), iso_val)))
+        if verts_data is not None:
+            verts_data = np.concatenate((verts_data, interpolate(verts_data, new_verts, new_param)))
+        loops_data = interpolate(loops_data, loops_index, loops_param)
+        if polygons_data is not None: polygons_data = polygons_data[polygons_index]
+    return vertices, weight, loops_vert, loop_total, verts_data, loops_data, polygons_data, verts_edge
+
+def walk_chains(n_verts, adj_offset, adj_edges, edges_v0, edges_v1, degree, visited, ptr, out, chain_start):
+    """
+    Walk the edges of a graph, collecting chains of vertices. Chains start
+    from vertices without exactly two neighbors, then the remaining closed
+    loops are collected. Every edge is visited once.
+    Works with lists, or with numpy arrays when compiled with Numba.
+    :return: Number of stored vertices and number of chains.
+    :rtype: tuple
+    """
+    n_out = 0
+    n_chains = 0
+    for phase in range(2):
+        for v in range(n_verts):
+            if degree[v] == 0: continue
+            if phase == 0 and degree[v] == 2: continue
+            while True:
+                # first unvisited edge of the starting vertex
+                p = ptr[v]
+                end = adj_offset[v+1]
+                while p < end and visited[adj_edges[p]]: p += 1
+                ptr[v] = p
+                if p == end: break
+                chain_start[n_chains] = n_out
+                n_chains += 1
+                out[n_out] = v
+                n_out += 1
+                cur = v
+                while True:
+                    p = ptr[cur]
+                    end = adj_offset[cur+1]
+                    while p < end and visited[adj_edges[p]]: p += 1
+                    ptr[cur] = p
+                    if p == end: break
+                    e = adj_edges[p]
+                    visited[e] = True
+                    nxt = edges_v1[e] if edges_v0[e] == cur else edges_v0[e]
+                    out[n_out] = nxt
+                    n_out += 1
+                    cur = nxt
+                    if degree[cur] != 2: break
+    chain_start[n_chains] = n_out
+    return n_out, n_chains
+
+try: numba_walk_chains = njit(walk_chains)
+except: numba_walk_chains = None
+
+def find_chains(edges, n_verts):
+    """
+    Order the edges in chains of vertices, in linear time.
+    Open chains go from one end to the other, closed loops repeat the first
+    vertex at the end. Chains are interrupted at branching vertices.
+    :arg edges: Vertex indexes of each edge.
+    :type edges: :class:'numpy.ndarray' or list of pairs
+    :arg n_verts: Number of Vertices.
+    :type n_verts: int
+    :return: Ordered vertex indexes of all the chains, and the offsets of
+        the chains inside them (n_chains + 1).
+    :rtype: tuple of :class:'numpy.ndarray'
+    """
+    edges = np.array(edges, dtype='int').reshape((-1,2))
+    edges = edges[edges[:,0] != edges[:,1]]
+    n_edges = len(edges)
+    # vertex to edges adjacency (CSR)
+    half_verts = edges.reshape((-1))
+    degree = np.bincount(half_verts, minlength=n_verts)
+    adj_offset = np.zeros(n_verts+1, dtype='int')
+    np.cumsum(degree, out=adj_offset[1:])
+    adj_edges = np.argsort(half_verts, kind='stable')//2
+    edges_v0 = edges[:,0]
+    edges_v1 = edges[:,1]
+    if numba_walk_chains:
+        visited = np.zeros(n_edges, dtype='bool')
+        ptr = adj_offset[:-1].copy()
+        out = np.zeros(n_edges*2, dtype='int')
+        chain_start = np.zeros(n_edges+1, dtype='int')
+        n_out, n_chains = numba_walk_chains(n_verts, adj_offset, adj_edges,
+            edges_v0, edges_v1, degree, visited, ptr, out, chain_start)
+    else:
+        adj_offset = adj_offset.tolist()
+        visited = [False]*n_edges
+        ptr = adj_offset[:-1]
+        out = [0]*(n_edges*2)
+        chain_start = [0]*(n_edges+1)
+        n_out, n_chains = walk_chains(n_verts, adj_offset, adj_edges.tolist(),
+            edges_v0.tolist(), edges_v1.tolist(), degree.tolist(), visited, ptr, out, chain_start)
+    out = np.array(out[:n_out], dtype='int')
+    chain_start = np.array(chain_start[:n_chains+1], dtype='int')
+    return out, chain_start
+
+def split_chains(chains, chain_start):
+    """
+    Convert the output of find_chains to a list of lists of indexes.
+    """
+    chains = chains.tolist()
+    chain_start = chain_start.tolist()
+    return [chains[i0:i1] for i0, i1 in zip(chain_start[:-1], chain_start[1:])]
+
 def find_curves(edges, n_verts):
-    verts_dict = {key:[] for key in range(n_verts)}
-    for e in edges:
-        verts_dict[e[0]].append(e[1])
-        verts_dict[e[1]].append(e[0])
-    curves = []
-    while True:
-        if len(verts_dict) == 0: break
-        # next starting point
-        v = list(verts_dict.keys())[0]
-        # neighbors
-        v01 = verts_dict[v]
-        if len(v01) == 0:
-            verts_dict.pop(v)
-            continue
-        curve = []
-        if len(v01) > 1: curve.append(v01[1])    # add neighbors
-        curve.append(v)         # add starting point
-        curve.append(v01[0])    # add neighbors
-        verts_dict.pop(v)
-        # start building curve
-        while True:
-            #last_point = curve[-1]
-            #if last_point not in verts_dict: break
-
-            # try to change direction if needed
-            if curve[-1] in verts_dict: pass
-            elif curve[0] in verts_dict: curve.reverse()
-            else: break
-
-            # neighbors points
-            last_point = curve[-1]
-            v01 = verts_dict[last_point]
-
-            # curve end
-            if len(v01) == 1:
-                verts_dict.pop(last_point)
-                if curve[0] in verts_dict: continue
-                else: break
-
-            # chose next point
-            new_point = None
-            if v01[0] == curve[-2]: new_point = v01[1]
-            elif v01[1] == curve[-2]: new_point = v01[0]
-            #else: break
-
-            #if new_point != curve[1]:
-            curve.append(new_point)
-            verts_dict.pop(last_point)
-            if curve[0] == curve[-1]:
-                verts_dict.pop(new_point)
-                break
-        curves.append(curve)
-    return curves
+    chains, chain_start = find_chains(edges, n_verts)
+    return split_chains(chains, chain_start)
 
 def find_curves_attribute(edges, n_verts, attribute):
-    # dictionary with a list for every point
-    verts_dict = {key:[] for key in range(n_verts)}
-    # get neighbors for every point
-    for e in edges:
-        verts_dict[e[0]].append(e[1])
-        verts_dict[e[1]].append(e[0])
-    curves = []
-    ordered_attr = []
-    while True:
-        if len(verts_dict) == 0: break
-        # next starting point
-        v = list(verts_dict.keys())[0]
-        # neighbors
-        v01 = verts_dict[v]
-        if len(v01) == 0:
-            verts_dict.pop(v)
-            continue
-        curve = []
-        attr = []
-        if len(v01) > 1:
-            curve.append(v01[1])    # add neighbors
-            attr.append(attribute[v01[1]])    # add neighbors
-        curve.append(v)         # add starting point
-        attr.append(attribute[v])
-        curve.append(v01[0])    # add neighbors
-        attr.append(attribute[v01[0]])
-        verts_dict.pop(v)
-        # start building curve
-        while True:
-            #last_point = curve[-1]
-            #if last_point not in verts_dict: break
-
-            # try to change direction if needed
-            if curve[-1] in verts_dict: pass
-            elif curve[0] in verts_dict:
-                curve.reverse()
-                attr.reverse()
-            else: break
-
-            # neighbors points
-            last_point = curve[-1]
-            v01 = verts_dict[last_point]
-
-            # curve end
-            if len(v01) == 1:
-                verts_dict.pop(last_point)
-                if curve[0] in verts_dict: continue
-                else: break
-
-            # chose next point
-            new_point = None
-            if v01[0] == curve[-2]: new_point = v01[1]
-            elif v01[1] == curve[-2]: new_point = v01[0]
-            #else: break
-
-            #if new_point != curve[1]:
-            curve.append(new_point)
-            ordered_attr.append(attr)
-            verts_dict.pop(last_point)
-            if curve[0] == curve[-1]:
-                verts_dict.pop(new_point)
-                break
-        if(len(curve)>0):
-            curves.append(curve)
+    chains, chain_start = find_chains(edges, n_verts)
+    curves = split_chains(chains, chain_start)
+    ordered_attr = split_chains(np.asarray(attribute)[chains], chain_start)
     return curves, ordered_attr
 
+def walk_streamlines(seeds, pos_steps, neg_steps, next_vert, prev_vert, adj_offset, adj_verts, rand_dir, rand_values, visited, out, curve_start):
+    """
+    Trace the streamlines from the seeds, following prev_vert for neg_steps
+    and next_vert for pos_steps. If rand_dir > 0 the next vertex is randomly
+    picked among the neighbors (sorted by increasing weight), closer to the
+    highest or the lowest according to the direction. A vertex can't be
+    visited twice in the same direction, visited stores the last walk that
+    reached each vertex.
+    Works with lists, or with numpy arrays when compiled with Numba.
+    :return: Number of stored vertices and number of curves.
+    :rtype: tuple
+    """
+    n_out = 0
+    n_curves = 0
+    n_rand = len(rand_values)
+    r = 0
+    for k in range(len(seeds)):
+        seed = seeds[k]
+        start = n_out
+        for side in range(2):
+            stamp = 2*k + side + 1
+            visited[seed] = stamp
+            cur = seed
+            path_start = n_out
+            if side == 0:
+                n_steps = neg_steps
+            else:
+                n_steps = pos_steps
+                out[n_out] = seed
+                n_out += 1
+            for j in range(n_steps):
+                if rand_dir > 0:
+                    p0 = adj_offset[cur]
+                    deg = adj_offset[cur+1] - p0
+                    if deg == 0: break
+                    t = rand_values[r]
+                    r = (r + 1) % n_rand
+                    if side == 0: nxt = adj_verts[p0 + int(deg*t*rand_dir)]
+                    else: nxt = adj_verts[p0 + int((deg-1)*(1-t*rand_dir))]
+                    if visited[nxt] == stamp: continue
+                else:
+                    if side == 0: nxt = prev_vert[cur]
+                    else: nxt = next_vert[cur]
+                    if nxt < 0 or visited[nxt] == stamp: break
+                visited[nxt] = stamp
+                out[n_out] = nxt
+                n_out += 1
+                cur = nxt
+            if side == 0:
+                # low weight side goes backward
+                i0 = path_start
+                i1 = n_out - 1
+                while i0 < i1:
+                    tmp = out[i0]
+                    out[i0] = out[i1]
+                    out[i1] = tmp
+                    i0 += 1
+                    i1 -= 1
+        if n_out - start > 1:
+            curve_start[n_curves] = start
+            n_curves += 1
+        else:
+            n_out = start
+    curve_start[n_curves] = n_out
+    return n_out, n_curves
+
+try: numba_walk_streamlines = njit(walk_streamlines)
+except: numba_walk_streamlines = None
+
+def find_streamlines(weight, adj_offset, adj_verts, seeds, pos_steps, neg_steps, same_weight=True, rand_dir=0):
+    """
+    Streamlines of a scalar field over a graph, following the steepest
+    ascent and descent from each seed vertex.
+    :arg weight: Scalar value of each vertex.
+    :type weight: :class:'numpy.ndarray'
+    :arg adj_offset: Offsets of the neighbors of each vertex (n_verts + 1).
+    :type adj_offset: :class:'numpy.ndarray'
+    :arg adj_verts: Neighbors of the vertices.
+    :type adj_verts: :class:'numpy.ndarray'
+    :arg seeds: Starting vertex of each streamline.
+    :type seeds: :class:'numpy.ndarray'
+    :arg pos_steps: Number of steps in the direction of high weight.
+    :type pos_steps: int
+    :arg neg_steps: Number of steps in the direction of low weight.
+    :type neg_steps: int
+    :arg same_weight: Continue the streamlines when the weight is the same.
+    :type same_weight: bool
+    :arg rand_dir: Randomize streamlines directions.
+    :type rand_dir: float
+    :return: Ordered vertex indexes of all the streamlines, and the offsets
+        of the streamlines inside them (n_curves + 1).
+    :rtype: tuple of :class:'numpy.ndarray'
+    """
+    n_verts = len(weight)
+    seeds = np.array(seeds, dtype='int').reshape((-1))
+    adj_offset = np.array(adj_offset, dtype='int')
+    adj_verts = np.array(adj_verts, dtype='int')
+    degree = np.diff(adj_offset)
+    adj_source = np.repeat(np.arange(n_verts), degree)
+    # neighbors sorted by increasing weight
+    order = np.lexsort((weight[adj_verts], adj_source))
+    adj_verts = adj_verts[order]
+    has_neigh = degree > 0
+    next_vert = np.full(n_verts, -1, dtype='int')
+    prev_vert = np.full(n_verts, -1, dtype='int')
+    if rand_dir == 0:
+        max_vert = adj_verts[adj_offset[1:][has_neigh]-1]
+        min_vert = adj_verts[adj_offset[:-1][has_neigh]]
+        w = weight[has_neigh]
+        if same_weight:
+            up = weight[max_vert] >= w
+            down = weight[min_vert] <= w
+        else:
+            up = weight[max_vert] > w
+            down = weight[min_vert] < w
+        next_vert[has_neigh] = np.where(up, max_vert, -1)
+        prev_vert[has_neigh] = np.where(down, min_vert, -1)
+        rand_values = np.zeros(1)
+    else:
+        n_rand = min(len(seeds)*(pos_steps + neg_steps), 1<<20)
+        rand_values = np.random.random(max(n_rand, 1))
+
+    max_out = len(seeds)*(pos_steps + neg_steps + 1)
+    if numba_walk_streamlines:
+        visited = np.zeros(n_verts, dtype='int')
+        out = np.zeros(max_out, dtype='int')
+        curve_start = np.zeros(len(seeds)+1, dtype='int')
+        n_out, n_curves = numba_walk_streamlines(seeds, pos_steps, neg_steps,
+            next_vert, prev_vert, adj_offset, adj_verts, float(rand_dir),
+            rand_values, visited, out, curve_start)
+    else:
+        visited = [0]*n_verts
+        out = [0]*max_out
+        curve_start = [0]*(len(seeds)+1)
+        n_out, n_curves = walk_streamlines(seeds.tolist(), pos_steps, neg_steps,
+            next_vert.tolist(), prev_vert.tolist(), adj_offset.tolist(),
+            adj_verts.tolist(), rand_dir, rand_values.tolist(), visited, out, curve_start)
+    out = np.array(out[:n_out], dtype='int')
+    curve_start = np.array(curve_start[:n_curves+1], dtype='int')
+    return out, curve_start
+
 def curve_from_points(points, name='Curve'):
     curve = bpy.data.curves.new(name,'CURVE')
     for c in points:
@@ -1215,43 +1631,149 @@ def curve_from_points(points, name='Curve'):
     ob_curve = bpy.data.objects.new(name,curve)
     return ob_curve
 
+def curves_indexes_numpy(indexes):
+    '''
+    Flatten the points indexes of a list of curves. Curves where the last
+    index repeats the first one are considered cyclic, and the repeated index
+    is removed. Missing indexes (None) are removed as well.
+    :arg indexes: Points indexes of each curve.
+    :type indexes: list
+    :return: Points indexes, number of points of each curve, cyclic curves.
+    :rtype: tuple of :class:'numpy.ndarray'
+    '''
+    n_curves = len(indexes)
+    lengths = np.fromiter(map(len, indexes), dtype='int', count=n_curves)
+    ids = np.array(list(chain.from_iterable(indexes)), dtype=np.float64)
+    end = np.cumsum(lengths)
+    start = end - lengths
+    cyclic = np.zeros(n_curves, dtype='bool')
+    not_empty = lengths > 0
+    cyclic[not_empty] = ids[start[not_empty]] == ids[end[not_empty]-1]
+    keep = ~np.isnan(ids)
+    keep[end[cyclic]-1] = False
+    curve_id = np.repeat(np.arange(n_curves), lengths)[keep]
+    lengths = np.bincount(curve_id, minlength=n_curves)
+    return ids[keep].astype('int'), lengths, cyclic
+
+def walk_merge_points(dist, start, end, merge_distance, mask):
+    """
+    Keep a point every time the distance added up along the curve exceeds
+    the merge distance, then restart counting from that point.
+    Works with lists, or with numpy arrays when compiled with Numba.
+    """
+    for c in range(len(start)):
+        count = 0.0
+        for i in range(start[c], end[c]):
+            count += dist[i]
+            if count > merge_distance:
+                count = 0.0
+                mask[i] = True
+
+try: numba_walk_merge_points = njit(walk_merge_points)
+except: numba_walk_merge_points = None
+
+def merge_curves_points(points, lengths, merge_distance):
+    '''
+    Decimate the points of many curves at once. The distances between the
+    consecutive points are added up along each curve, and a point is kept
+    when the sum exceeds the merge distance, restarting the sum from it.
+    :arg points: Points coordinates of all the curves, with shape (n_pts, 3).
+    :type points: :class:'numpy.ndarray'
+    :arg lengths: Number of points of each curve.
+    :type lengths: :class:'numpy.ndarray'
+    :arg merge_distance: Length of curve to cover before keeping a point.
+    :type merge_distance: float
+    :return: Mask of the points to keep.
+    :rtype: :class:'numpy.ndarray'
+    '''
+    end = np.cumsum(lengths)
+    start = end - lengths
+    not_empty = lengths > 0
+    # previous point, the first one is connected to the last one
+    prev = np.arange(len(points)) - 1
+    prev[start[not_empty]] = end[not_empty]-1
+    dist = np.linalg.norm(np.array(points - points[prev], dtype=np.float64), axis=1)
+    if numba_walk_merge_points:
+        mask = np.zeros(len(points), dtype='bool')
+        numba_walk_merge_points(dist, start, end, float(merge_distance), mask)
+    else:
+        mask = [False]*len(points)
+        walk_merge_points(dist.tolist(), start.tolist(), end.tolist(), merge_distance, mask)
+    return np.array(mask, dtype='bool')
+
+def curves_points_numpy(points, indexes, merge_distance=0, skip_open=False, attributes=()):
+    '''
+    Points and attributes of the curves defined by indexes, as flat arrays.
+    :arg points: Points coordinates.
+    :type points: :class:'numpy.ndarray'
+    :arg indexes: Points indexes of each curve.
+    :type indexes: list
+    :arg merge_distance: Length of curve to cover before keeping a point
+        (see merge_curves_points).
+    :type merge_distance: float
+    :arg skip_open: Remove the open curves.
+    :type skip_open: bool
+    :arg attributes: Per point attributes, None if not available.
+    :type attributes: list
+    :return: Points, number of points of each curve, cyclic curves, attributes.
+    :rtype: tuple
+    '''
+    ids, lengths, cyclic = curves_indexes_numpy(indexes)
+    pts = np.array(points, dtype=np.float64)[ids]
+    attributes = [None if attr is None else np.array(attr, dtype=np.float64)[ids] for attr in attributes]
+    curve_id = np.repeat(np.arange(len(lengths)), lengths)
+    mask = np.ones(len(pts), dtype='bool')
+    if merge_distance > 0:
+        mask = merge_curves_points(pts, lengths, merge_distance)
+    if skip_open:
+        mask &= cyclic[curve_id]
+    pts = pts[mask]
+    attributes = [None if attr is None else attr[mask] for attr in attributes]
+    lengths = np.bincount(curve_id[mask], minlength=len(lengths))
+    not_empty = lengths > 0
+    return pts, lengths[not_empty], cyclic[not_empty], attributes
+
+def add_splines_numpy(curve, points, lengths, cyclic, radii=None, spline_type='POLY'):
+    '''
+    Add splines to a curve, from the flat arrays of their points.
+    :arg curve: Curve data.
+    :type curve: :class:'bpy.types.Curve'
+    :arg points: Points coordinates of all the splines, with shape (n_pts, 3).
+    :type points: :class:'numpy.ndarray'
+    :arg lengths: Number of points of each spline.
+    :type lengths: :class:'numpy.ndarray'
+    :arg cyclic: Cyclic splines.
+    :type cyclic: :class:'numpy.ndarray'
+    :arg radii: Radius of each point (optional).
+    :type radii: :class:'numpy.ndarray'
+    :arg spline_type: Type of the splines.
+    :type spline_type: str
+    '''
+    n_pts = len(points)
+    co = np.ones((n_pts, 4), dtype=np.float32)
+    co[:,:3] = points
+    co = co.reshape((-1))
+    if radii is not None:
+        radii = np.array(radii, dtype=np.float32).reshape((-1))
+    end = np.cumsum(lengths).tolist()
+    start = (np.cumsum(lengths) - lengths).tolist()
+    splines = curve.splines
+    for i0, i1, bool_cyclic in zip(start, end, cyclic.tolist()):
+        s = splines.new(spline_type)
+        s.points.add(i1-i0-1)
+        s.points.foreach_set('co', co[i0*4:i1*4])
+        if radii is not None: s.points.foreach_set('radius', radii[i0:i1])
+        s.use_cyclic_u = bool_cyclic
+
 def curve_from_pydata(points, radii, indexes, name='Curve', skip_open=False, merge_distance=1, set_active=True, only_data=False, curve=None, spline_type='POLY'):
     if not curve:
         curve = bpy.data.curves.new(name,'CURVE')
     curve.dimensions = '3D'
-    use_rad = True
-    for c in indexes:
-        bool_cyclic = c[0] == c[-1]
-        if bool_cyclic: c.pop(-1)
-        # cleanup
-        pts = np.array([points[i] for i in c])
-        try:
-            rad = np.array([radii[i] for i in c])
-        except:
-            use_rad = False
-            rad = 1
-        if merge_distance > 0:
-            pts1 = np.roll(pts,1,axis=0)
-            dist = np.linalg.norm(np.array(pts1-pts, dtype=np.float64), axis=1)
-            count = 0
-            n = len(dist)
-            mask = np.ones(n).astype('bool')
-            for i in range(n):
-                count += dist[i]
-                if count > merge_distance: count = 0
-                else: mask[i] = False
-            pts = pts[mask]
-            if use_rad: rad = rad[mask]
-
-        if skip_open and not bool_cyclic: continue
-        s = curve.splines.new(spline_type)
-        n_pts = len(pts)
-        s.points.add(n_pts-1)
-        w = np.ones(n_pts).reshape((n_pts,1))
-        co = np.concatenate((pts,w),axis=1).reshape((n_pts*4))
-        s.points.foreach_set('co',co)
-        if use_rad: s.points.foreach_set('radius',rad)
-        s.use_cyclic_u = bool_cyclic
+    try: radii = np.array(radii, dtype=np.float64).reshape((len(points),-1))[:,0]
+    except: radii = None
+    pts, lengths, cyclic, (rad,) = curves_points_numpy(points, indexes,
+        merge_distance, skip_open, (radii,))
+    add_splines_numpy(curve, pts, lengths, cyclic, rad, spline_type)
     if only_data:
         return curve
     else:
@@ -1263,95 +1785,25 @@ def curve_from_pydata(points, radii, indexes, name='Curve', skip_open=False, mer
 
 def update_curve_from_pydata_simple(curve, points, radii, indexes, skip_open=False, merge_distance=1, set_active=True, only_data=False, spline_type='POLY'):
     curve.splines.clear()
-    curve.dimensions = '3D'
-    use_rad = True
-    for c in indexes:
-        bool_cyclic = c[0] == c[-1]
-        if bool_cyclic: c.pop(-1)
-        # cleanup
-        pts = np.array([points[i] for i in c])
-        try:
-            rad = np.array([radii[i] for i in c])
-        except:
-            use_rad = False
-            rad = 1
-        if merge_distance > 0:
-            pts1 = np.roll(pts,1,axis=0)
-            dist = np.linalg.norm(pts1-pts, axis=1)
-            count = 0
-            n = len(dist)
-            mask = np.ones(n).astype('bool')
-            for i in range(n):
-                count += dist[i]
-                if count > merge_distance: count = 0
-                else: mask[i] = False
-            pts = pts[mask]
-            if use_rad: rad = rad[mask]
-
-        if skip_open and not bool_cyclic: continue
-        s = curve.splines.new(spline_type)
-        n_pts = len(pts)
-        s.points.add(n_pts-1)
-        w = np.ones(n_pts).reshape((n_pts,1))
-        co = np.concatenate((pts,w),axis=1).reshape((n_pts*4))
-        s.points.foreach_set('co',co)
-        if use_rad: s.points.foreach_set('radius',rad)
-        s.use_cyclic_u = bool_cyclic
-    if only_data:
-        return curve
-    else:
-        ob_curve = bpy.data.objects.new(name,curve)
-        bpy.context.collection.objects.link(ob_curve)
-        if set_active:
-            bpy.context.view_layer.objects.active = ob_curve
-        return ob_curve
+    return curve_from_pydata(points, radii, indexes, name=curve.name, skip_open=skip_open,
+        merge_distance=merge_distance, set_active=set_active, only_data=only_data,
+        curve=curve, spline_type=spline_type)
 
 def update_curve_from_pydata(curve, points, normals, radii, indexes, merge_distance=1, pattern=[1,0], depth=0.1, offset=0):
     curve.splines.clear()
-    use_rad = True
-    for ic, c in enumerate(indexes):
-        bool_cyclic = c[0] == c[-1]
-        if bool_cyclic: c.pop(-1)
-
-        # cleanup
-        pts = np.array([points[i] for i in c if i != None])
-        nor = np.array([normals[i] for i in c if i != None])
-        try:
-            rad = np.array([radii[i] for i in c if i != None])
-        except:
-            use_rad = False
-            rad = 1
-        if merge_distance > 0:
-            pts1 = np.roll(pts,1,axis=0)
-            dist = np.linalg.norm(pts1-pts, axis=1)
-            count = 0
-            n = len(dist)
-            mask = np.ones(n).astype('bool')
-            for i in range(n):
-                count += dist[i]
-                if count > merge_distance: count = 0
-                else: mask[i] = False
-            pts = pts[mask]
-            nor = nor[mask]
-            if use_rad: rad = rad[mask]
-        #if skip_open and not bool_cyclic: continue
-        n_pts = len(pts)
-        series = np.arange(n_pts)
-        if pattern[0]*pattern[1] != 0:
-            patt1 = series + (series-series%pattern[1])/pattern[1]*pattern[0]+pattern[0]
-            patt1 = patt1[patt1<n_pts].astype('int')
-            patt0 = series + (series-series%pattern[0])/pattern[0]*pattern[1]
-            patt0 = patt0[patt0<n_pts].astype('int')
-            nor[patt0] *= 0.5*depth*(1 + offset)
-            nor[patt1] *= 0.5*depth*(-1 + offset)
-            pts += nor
-        s = curve.splines.new('POLY')
-        s.points.add(n_pts-1)
-        w = np.ones(n_pts).reshape((n_pts,1))
-        co = np.concatenate((pts,w),axis=1).reshape((n_pts*4))
-        s.points.foreach_set('co',co)
-        if use_rad: s.points.foreach_set('radius',rad)
-        s.use_cyclic_u = bool_cyclic
+    try: radii = np.array(radii, dtype=np.float64).reshape((len(points),-1))[:,0]
+    except: radii = None
+    pts, lengths, cyclic, (nor, rad) = curves_points_numpy(points, indexes,
+        merge_distance, False, (normals, radii))
+    if pattern[0]*pattern[1] != 0:
+        # alternate displacement along the normals, for each curve
+        start = np.cumsum(lengths) - lengths
+        series = np.arange(len(pts)) - np.repeat(start, lengths)
+        patt0 = series % (pattern[0] + pattern[1]) < pattern[0]
+        nor[patt0] *= 0.5*depth*(1 + offset)
+        nor[~patt0] *= 0.5*depth*(-1 + offset)
+        pts += nor
+    add_splines_numpy(curve, pts, lengths, cyclic, rad, 'POLY')
 
 def loops_from_bmesh(edges):
     """
@@ -1464,23 +1916,27 @@ def curve_from_vertices(indexes, verts, name='Curve'):
     ob_curve = bpy.data.objects.new(name,curve)
     return ob_curve
 
-def nurbs_from_vertices(indexes, co, radii=[], name='Curve', set_active=True, interpolation='POLY'):
+def nurbs_from_vertices(indexes, co, radii=[], name='Curve', set_active=True, interpolation='POLY', lengths=None):
+    '''
+    Curve object with a spline for each list of vertex indexes. If lengths
+    is given, indexes is the flat array of the indexes of all the splines.
+    '''
     curve = bpy.data.curves.new(name,'CURVE')
     curve.dimensions = '3D'
     curve.resolution_u = 2
     curve.bevel_depth = 0.01
     curve.bevel_resolution = 0
-    for pts in indexes:
-        s = curve.splines.new(interpolation)
-        n_pts = len(pts)
-        s.points.add(n_pts-1)
-        w = np.ones(n_pts).reshape((n_pts,1))
-        curve_co = np.concatenate((co[pts],w),axis=1).reshape((n_pts*4))
-        s.points.foreach_set('co',curve_co)
-        try:
-            s.points.foreach_set('radius',radii[pts])
-        except: pass
-        s.use_endpoint_u = True
+    if lengths is None:
+        lengths = [len(pts) for pts in indexes]
+        indexes = list(chain.from_iterable(indexes))
+    indexes = np.array(indexes, dtype='int')
+    lengths = np.array(lengths, dtype='int')
+    if radii is not None and len(radii) > 0:
+        radii = np.array(radii, dtype=np.float64).reshape((-1))[indexes]
+    else: radii = None
+    add_splines_numpy(curve, co[indexes], lengths, np.zeros(len(lengths), dtype='bool'),
+        radii, interpolation)
+    curve.splines.foreach_set('use_endpoint_u', np.ones(len(lengths), dtype='bool'))
 
     ob_curve = bpy.data.objects.new(name,curve)
     bpy.context.collection.objects.link(ob_curve)
@@ -1493,6 +1949,99 @@ def nurbs_from_vertices(indexes, co, radii=[], name='Curve', set_active=True, in
 # VERTEX GROUPS AND WEIGHT
 # ------------------------------------------------------------------
 
+def get_weights_numpy(ob, groups=None, return_members=False):
+    """
+    Read the weight values of many Vertex Groups at once, with a single pass
+    over the deform layer of the mesh.
+    :arg ob: Mesh Object.
+    :type ob: :class:'bpy.types.Object'
+    :arg groups: Indexes of the Vertex Groups (all the Vertex Groups if None).
+    :type groups: list
+    :arg return_members: Return also which vertices belong to the Vertex Groups.
+    :type return_members: bool
+    :return: Weight values, with shape (n_groups, n_verts), and membership
+        mask with the same shape if return_members is True.
+    :rtype: :class:'numpy.ndarray'
+    """
+    me = ob.data
+    if groups is None: groups = range(len(ob.vertex_groups))
+    groups = list(groups)
+    edit_mode = me.is_editmode
+    if edit_mode:
+        bm = bmesh.from_edit_mesh(me)
+    else:
+        bm = bmesh.new()
+        bm.from_mesh(me)
+    weights = np.zeros((len(groups), len(bm.verts)))
+    members = np.zeros((len(groups), len(bm.verts)), dtype='bool')
+    layer = bm.verts.layers.deform.active
+    if layer is not None:
+        lookup = {group : i for i, group in enumerate(groups)}
+        rows = []
+        cols = []
+        values = []
+        for i, v in enumerate(bm.verts):
+            for group, w in v[layer].items():
+                if group in lookup:
+                    rows.append(lookup[group])
+                    cols.append(i)
+                    values.append(w)
+        weights[rows, cols] = values
+        members[rows, cols] = True
+    if not edit_mode: bm.free()
+    if return_members: return weights, members
+    return weights
+
+def set_weights_numpy(ob, groups, weights, members=None):
+    """
+    Write the weight values of many Vertex Groups at once, with a single pass
+    over the deform layer of the mesh. All the vertices are assigned to the
+    Vertex Groups, unless a membership mask is given.
+    :arg ob: Mesh Object.
+    :type ob: :class:'bpy.types.Object'
+    :arg groups: Indexes of the Vertex Groups.
+    :type groups: list
+    :arg weights: Weight values of each Vertex Group, as an array of
+        n_verts values or a single value.
+    :type weights: list
+    :arg members: Vertices to assign to each Vertex Group, with shape
+        (n_groups, n_verts). The other vertices are skipped (optional).
+    :type members: :class:'numpy.ndarray'
+    """
+    me = ob.data
+    groups = list(groups)
+    n_verts = len(me.vertices)
+    weights = np.array([np.broadcast_to(np.array(w, dtype=np.float64).reshape((-1)), (n_verts,))
+        for w in weights])
+    weights = np.clip(np.nan_to_num(weights), 0, 1).astype(np.float32)
+    if members is None: members = np.ones(weights.shape, dtype='bool')
+    members = np.broadcast_to(members, weights.shape)
+    if ob.mode == 'WEIGHT_PAINT':
+        # writing the mesh can crash in Weight Paint mode, the vertices
+        # with the same weight are added together instead
+        for group, weight, member in zip(groups, weights, members):
+            add_weight_numpy(ob.vertex_groups[group], weight, np.flatnonzero(member))
+        return
+    edit_mode = me.is_editmode
+    if edit_mode:
+        bm = bmesh.from_edit_mesh(me)
+    else:
+        bm = bmesh.new()
+        bm.from_mesh(me)
+    weights = weights.T.tolist()
+    members = members.T.tolist()
+    layer = bm.verts.layers.deform.verify()
+    for v, w, m in zip(bm.verts, weights, members):
+        dvert = v[layer]
+        for group, val, member in zip(groups, w, m):
+            if member: dvert[group] = val
+    if edit_mode:
+        bmesh.update_edit_mesh(me)
+    else:
+        bm.to_mesh(me)
+        bm.free()
+        me.update()
+
 def get_weight(vertex_group, n_verts):
     """
     Read weight values from given Vertex Group.
@@ -1503,11 +2052,7 @@ def get_weight(vertex_group, n_verts):
     :return: Readed weight values.
     :rtype: list
     """
-    weight = [0]*n_verts
-    for i in range(n_verts):
-        try: weight[i] = vertex_group.weight(i)
-        except: pass
-    return weight
+    return get_weight_numpy(vertex_group, n_verts).tolist()
 
 def get_weight_numpy(vertex_group, n_verts):
     """
@@ -1519,6 +2064,9 @@ def get_weight_numpy(vertex_group, n_verts):
     :return: Readed weight values as numpy array.
     :rtype: :class:'numpy.ndarray'
     """
+    ob = vertex_group.id_data
+    if ob.type == 'MESH' and len(ob.data.vertices) == n_verts:
+        return get_weights_numpy(ob, (vertex_group.index,))[0]
     weight = np.zeros(n_verts)
     for i in range(n_verts):
         try: weight[i] = vertex_group.weight(i)
@@ -1551,9 +2099,31 @@ def bmesh_set_weight_numpy(bm, group_index, weight):
         dvert[group_index] = weight[i]
     return bm
 
+def add_weight_numpy(vg, weight, verts=None, decimals=None):
+    """
+    Write the weight values of a single Vertex Group with VertexGroup.add(),
+    adding together the vertices with the same weight. The mesh is not
+    rebuilt, so it can be used from frame change handlers.
+    :arg vg: Vertex Group.
+    :type vg: :class:'bpy.types.VertexGroup'
+    :arg weight: Weight value of each vertex.
+    :type weight: :class:'numpy.ndarray'
+    :arg verts: Indexes of the vertices to write (all the vertices if None).
+    :type verts: :class:'numpy.ndarray'
+    :arg decimals: Round the weight values, limiting the number of calls (optional).
+    :type decimals: int
+    """
+    weight = np.clip(np.nan_to_num(np.array(weight, dtype='float32')), 0, 1)
+    if verts is None: verts = np.arange(len(weight))
+    weight = weight[verts]
+    if decimals is not None: weight = np.round(weight, decimals)
+    values, inverse, counts = np.unique(weight, return_inverse=True, return_counts=True)
+    ids = np.split(verts[np.argsort(inverse.reshape((-1)), kind='stable')], np.cumsum(counts)[:-1])
+    for val, id in zip(values.tolist(), ids):
+        vg.add(id.tolist(), val, 'REPLACE')
+
 def set_weight_numpy(vg, weight):
-    for i, w in enumerate(weight):
-        vg.add([i], w, 'REPLACE')
+    set_weights_numpy(vg.id_data, (vg.index,), (weight,))
     return vg
 
 def uv_from_bmesh(bm, uv_index=None):
@@ -1569,18 +2139,34 @@ def uv_from_bmesh(bm, uv_index=None):
     return uv_co
 
 
-def get_corner_attribute_vectors(obj_or_mesh, attr_name=None, use_evaluated=True, prefer_attributes=True):
-    """
-    Return a list of 2D/3D tuples for each loop (corner) in the mesh.
+corner_attributes_cache = {}
 
-    - obj_or_mesh: mesh datablock or object
-    - attr_name: optional attribute/uv name
-    - use_evaluated: when passing an Object, whether to use evaluated mesh (with modifiers)
-    - prefer_attributes: if True, try mesh.attributes (CORNER) first, then uv_layers
+def clear_corner_attributes_cache():
+    '''
+    Forget the corner attributes read by get_corner_attribute_numpy().
+    Operators call it when they start and when they are done with the meshes.
+    '''
+    corner_attributes_cache.clear()
 
-    Returns: list of tuples (one per loop) or None if nothing found.
+def get_corner_attribute_numpy(obj_or_mesh, attr_name=None, use_evaluated=True, prefer_attributes=True, use_cache=True):
+    """
+    Read a vector attribute of the corners (loops) of a mesh, or its UV layer,
+    with a single foreach_get() call.
+    :arg obj_or_mesh: Mesh datablock or Object.
+    :type obj_or_mesh: :class:'bpy.types.Mesh' or :class:'bpy.types.Object'
+    :arg attr_name: Name of the attribute or UV layer (active UV layer if None).
+    :type attr_name: str
+    :arg use_evaluated: Read the evaluated mesh (with modifiers) of an Object.
+    :type use_evaluated: bool
+    :arg prefer_attributes: Try mesh.attributes (CORNER) first, then uv_layers.
+    :type prefer_attributes: bool
+    :arg use_cache: Store the values read from a mesh datablock, until
+        clear_corner_attributes_cache() is called.
+    :type use_cache: bool
+    :return: Values with shape (n_loops, 2) or (n_loops, 3), or None if
+        nothing found.
+    :rtype: :class:'numpy.ndarray'
     """
-    import bpy
     created_eval = False
     me = None
     ob_eval = None
@@ -1596,21 +2182,34 @@ def get_corner_attribute_vectors(obj_or_mesh, attr_name=None, use_evaluated=True
         else:
             me = ob.data
 
-    def _cleanup():
-        if created_eval:
-            try: ob_eval.to_mesh_clear()
-            except: pass
+    # temporary evaluated meshes are never cached
+    use_cache = use_cache and not created_eval
+    n_loops = len(me.loops)
+    key = (me.as_pointer(), attr_name, prefer_attributes, n_loops)
+    if use_cache and key in corner_attributes_cache:
+        return corner_attributes_cache[key]
+
+    values = read_corner_attribute_numpy(me, attr_name, prefer_attributes)
+    if use_cache:
+        # shared between the callers
+        if values is not None: values.flags.writeable = False
+        corner_attributes_cache[key] = values
+    if created_eval:
+        try: ob_eval.to_mesh_clear()
+        except: pass
+    return values
 
+def read_corner_attribute_numpy(me, attr_name=None, prefer_attributes=True):
+    '''
+    Read the values for get_corner_attribute_numpy(), without any cache
+    '''
     # Helper: read a single attribute data element into a tuple.
     # Blender 5.0 changed how FLOAT2 / FLOAT_VECTOR attributes expose their
     # values.  We try every known accessor in order of likelihood.
-    def _read_item(item, data_type):
+    def _read_item(item):
         # 1) .vector – works for FLOAT_VECTOR and FLOAT2 in many Blender builds
         try:
-            vec = item.vector
-            if len(vec) >= 3:
-                return (vec[0], vec[1], vec[2])
-            return (vec[0], vec[1])
+            return tuple(item.vector)
         except Exception:
             pass
         # 2) .value – Blender 5.0 may expose FLOAT2 via .value
@@ -1618,9 +2217,7 @@ def get_corner_attribute_vectors(obj_or_mesh, attr_name=None, use_evaluated=True
             val = item.value
             # val could be a single float or a sequence
             if hasattr(val, '__len__'):
-                if len(val) >= 3:
-                    return (val[0], val[1], val[2])
-                return (val[0], val[1])
+                return tuple(val)
             # single float
             return (val, 0.0)
         except Exception:
@@ -1633,17 +2230,16 @@ def get_corner_attribute_vectors(obj_or_mesh, attr_name=None, use_evaluated=True
             pass
         # 4) direct sequence / indexing
         try:
-            if len(item) >= 3:
-                return (item[0], item[1], item[2])
-            return (item[0], item[1])
+            return tuple(item)
         except Exception:
             pass
-        # 5) Blender 5.0 FLOAT2: foreach_get based bulk read (handled at caller)
-        return None
+        return (0.0, 0.0)
 
     # Accepted attribute data types for vector-like corner data
     _VECTOR_TYPES = {'FLOAT_VECTOR', 'FLOAT2', 'FLOAT3'}
 
+    n_loops = len(me.loops)
+
     # Try attributes first (Geometry Nodes often writes CORNER float2)
     # When attr_name is not specified, prefer the active UV layer name to avoid
     # accidentally grabbing non-UV corner attributes (e.g. "Eval_Normals").
@@ -1660,42 +2256,26 @@ def get_corner_attribute_vectors(obj_or_mesh, attr_name=None, use_evaluated=True
             if search_name is not None and a.name != search_name:
                 continue
 
-            n_loops = len(me.loops)
             ad = me.attributes[a.name].data
+            size = 2 if a.data_type == 'FLOAT2' else 3
+            if len(ad) != n_loops:
+                # length mismatch – skip this attribute, try next
+                continue
 
             # --- Fast path: bulk read via foreach_get -----------------------
-            # Blender 5.0 FLOAT2 attributes support foreach_get('vector', ..)
-            out = None
-            if a.data_type in ('FLOAT2',):
-                try:
-                    buf = [0.0] * (n_loops * 2)
-                    ad.foreach_get('vector', buf)
-                    out = [(buf[i*2], buf[i*2+1]) for i in range(n_loops)]
-                except Exception:
-                    out = None
-            if out is None and a.data_type in ('FLOAT_VECTOR', 'FLOAT3'):
-                try:
-                    buf = [0.0] * (n_loops * 3)
-                    ad.foreach_get('vector', buf)
-                    out = [(buf[i*3], buf[i*3+1], buf[i*3+2]) for i in range(n_loops)]
-                except Exception:
-                    out = None
+            values = np.zeros(n_loops*size, dtype=np.float32)
+            try:
+                ad.foreach_get('vector', values)
+                return values.reshape((n_loops, size))
+            except Exception:
+                pass
 
             # --- Slow path: per-element read ---------------------------------
-            if out is None:
-                out = []
-                for item in ad:
-                    val = _read_item(item, a.data_type)
-                    if val is not None:
-                        out.append(val)
-                    else:
-                        out.append((0.0, 0.0))
-
-            if len(out) == n_loops:
-                _cleanup()
-                return out
-            # length mismatch – skip this attribute, try next
-            continue
+            values = np.zeros((n_loops, size), dtype=np.float32)
+            for i, item in enumerate(ad):
+                val = _read_item(item)[:size]
+                values[i,:len(val)] = val
+            return values
 
     # Fallback to legacy UV layers (loop/corner domain)
     if len(me.uv_layers) > 0:
@@ -1708,18 +2288,25 @@ def get_corner_attribute_vectors(obj_or_mesh, attr_name=None, use_evaluated=True
             # A specific attr_name was requested but does not exist at all.
             # Do NOT fall back to an unrelated UV layer – the caller expects
             # None when the exact attribute is missing (e.g. 'Eval_Normals').
-            _cleanup()
             return None
         else:
             # No specific name requested – read the active UV layer.
             layer = me.uv_layers.active.data
-        out = [tuple(l.uv) for l in layer]
-        _cleanup()
-        return out
+        values = np.zeros(n_loops*2, dtype=np.float32)
+        layer.foreach_get('uv', values)
+        return values.reshape((n_loops, 2))
 
-    _cleanup()
     return None
 
+def get_corner_attribute_vectors(obj_or_mesh, attr_name=None, use_evaluated=True, prefer_attributes=True):
+    """
+    Return a list of 2D/3D tuples for each loop (corner) in the mesh, or None
+    if nothing found. See get_corner_attribute_numpy().
+    """
+    values = get_corner_attribute_numpy(obj_or_mesh, attr_name, use_evaluated, prefer_attributes)
+    if values is None: return None
+    return [tuple(v) for v in values.tolist()]
+
 
 def get_uv_rotation_shifts(obj_or_mesh, uv_name=None, use_evaluated=True, prefer_attributes=True):
     """
@@ -1734,9 +2321,6 @@ def get_uv_rotation_shifts(obj_or_mesh, uv_name=None, use_evaluated=True, prefer
     - prefer_attributes: when True, check mesh.attributes (corner domain) first,
                          otherwise use uv_layers directly.
     """
-    import bpy
-    from mathutils import Vector
-
     created_eval = False
     me = None
     # If a Mesh datablock was provided, use it directly
@@ -1755,202 +2339,90 @@ def get_uv_rotation_shifts(obj_or_mesh, uv_name=None, use_evaluated=True, prefer
     n_polys = len(me.polygons)
     shifts = np.zeros(n_polys, dtype=np.int32)
 
-    def compute_shift(uv0, uv1, uv2, uv3):
-        # logic mirrors original tessellate code order
-        v01 = (uv0 + uv1)
-        v32 = (uv3 + uv2)
-        v0132 = (v32 - v01)
-        if v0132.length != 0:
-            v0132.normalize()
-
-        v12 = (uv1 + uv2)
-        v03 = (uv0 + uv3)
-        v1203 = (v03 - v12)
-        if v1203.length != 0:
-            v1203.normalize()
-
-        dot1203 = v1203.x
-        dot0132 = v0132.x
-        if abs(dot1203) < abs(dot0132):
-            shift = 0 if (dot0132 > 0) else 2
-        else:
-            shift = 3 if (dot1203 < 0) else 1
-        return shift
-
-    # Option A: prefer attributes (Geometry Nodes may write corner attributes)
-    if prefer_attributes:
-        corner_attr = None
-        # When uv_name is not specified, prefer the active UV layer name to avoid
-        # accidentally grabbing non-UV corner attributes (e.g. "Eval_Normals").
-        search_name = uv_name
-        if search_name is None and len(me.uv_layers) > 0 and me.uv_layers.active is not None:
-            search_name = me.uv_layers.active.name
-        for a in me.attributes:
-            # attribute API may vary: look for corner domain and float vector/float2
-            if a.domain == 'CORNER' and a.data_type in ('FLOAT_VECTOR', 'FLOAT2'):
-                if search_name is None or a.name == search_name:
-                    corner_attr = a.name
-                    break
-
-        if corner_attr:
-            ad = me.attributes[corner_attr].data
-
-            # Helper to read a 2D vector from a corner attribute element
-            def _read_uv(item):
-                # .vector – FLOAT_VECTOR / some FLOAT2 builds
-                try:
-                    v = item.vector
-                    return Vector((v[0], v[1]))
-                except Exception:
-                    pass
-                # .value – Blender 5.0 FLOAT2
-                try:
-                    v = item.value
-                    if hasattr(v, '__len__'):
-                        return Vector((v[0], v[1]))
-                    return Vector((v, 0.0))
-                except Exception:
-                    pass
-                # direct indexing
-                try:
-                    return Vector((item[0], item[1]))
-                except Exception:
-                    pass
-                return Vector((0.0, 0.0))
-
-            for poly in me.polygons:
-                if poly.loop_total < 4:
-                    continue
-                ls = poly.loop_start
-                uv0 = _read_uv(ad[ls + 0])
-                uv1 = _read_uv(ad[ls + 3])
-                uv2 = _read_uv(ad[ls + 2])
-                uv3 = _read_uv(ad[ls + 1])
-                shifts[poly.index] = compute_shift(uv0, uv1, uv2, uv3)
-
-            if created_eval:
-                try: ob_eval.to_mesh_clear()
-                except: pass
-            return shifts
-
-    # Option B: fall back to legacy UV layers
-    if len(me.uv_layers) > 0:
-        uv_layer = me.uv_layers.active.data
-        for poly in me.polygons:
-            if poly.loop_total < 4:
-                continue
-            ls = poly.loop_start
-            uv0 = Vector(uv_layer[ls + 0].uv)
-            # follow same order used historically by tessellate
-            uv1 = Vector(uv_layer[ls + 3].uv)
-            uv2 = Vector(uv_layer[ls + 2].uv)
-            uv3 = Vector(uv_layer[ls + 1].uv)
-            shifts[poly.index] = compute_shift(uv0, uv1, uv2, uv3)
-
-        if created_eval:
-            try: ob_eval.to_mesh_clear()
-            except: pass
-        return shifts
+    # Geometry Nodes may write corner attributes, otherwise legacy UV layers
+    uvs = get_corner_attribute_numpy(me, attr_name=uv_name, use_evaluated=False,
+        prefer_attributes=prefer_attributes, use_cache=not created_eval)
+    if uvs is not None:
+        loop_start = get_attribute_numpy(me.polygons, 'loop_start').astype('int')
+        loop_total = get_attribute_numpy(me.polygons, 'loop_total').astype('int')
+        quads = np.flatnonzero(loop_total >= 4)
+        # follow same order used historically by tessellate: 0, 3, 2, 1
+        quads_uv = uvs[loop_start[quads,None] + np.array((0,3,2,1)), :2].astype('float')
+        uv0, uv1, uv2, uv3 = quads_uv.transpose((1,0,2))
+
+        def normalized_x(vecs):
+            length = np.linalg.norm(vecs, axis=1)
+            length[length == 0] = 1
+            return vecs[:,0] / length
+
+        dot0132 = normalized_x((uv3 + uv2) - (uv0 + uv1))
+        dot1203 = normalized_x((uv0 + uv3) - (uv1 + uv2))
+        shifts[quads] = np.where(np.abs(dot1203) < np.abs(dot0132),
+            np.where(dot0132 > 0, 0, 2), np.where(dot1203 < 0, 3, 1))
 
-    # nothing found: clear evaluated mesh if created and return zeros
     if created_eval:
         try: ob_eval.to_mesh_clear()
         except: pass
     return shifts
 
 def get_uv_edge_vectors(me, uv_map = 0, only_positive=False):
+    """
+    Normalized UV direction of every edge, read from the last polygon
+    using it. Zero for the loose edges.
+    :arg me: Mesh data.
+    :type me: :class:'bpy.types.Mesh'
+    :arg uv_map: Index of the UV layer, used without corner attributes.
+    :type uv_map: int
+    :arg only_positive: Use the absolute values of the directions.
+    :type only_positive: bool
+    :return: UV directions with shape (n_edges, 2).
+    :rtype: :class:'numpy.ndarray'
+    """
     # Try to get per-loop UVs from corner attributes first, fallback to uv_layers
-    loop_uvs = get_corner_attribute_vectors(me, attr_name=None, use_evaluated=False, prefer_attributes=True)
-    use_corner = loop_uvs is not None
-
-    count = 0
-    uv_vectors = {}
-    for i, f in enumerate(me.polygons):
-        f_verts = len(f.vertices)
-        for j0 in range(f_verts):
-            j1 = (j0+1)%f_verts
-            if use_corner:
-                uv0 = Vector(loop_uvs[count + j0])
-                uv1 = Vector(loop_uvs[count + j1])
-            else:
-                # legacy uv layer access
-                uv0 = me.uv_layers[uv_map].data[count + j0].uv
-                uv1 = me.uv_layers[uv_map].data[count + j1].uv
-
-            delta_uv = (uv1 - uv0)
-            try:
-                delta_uv = delta_uv.normalized()
-            except Exception:
-                # zero-length -> leave as zero vector
-                pass
-            if only_positive:
-                delta_uv.x = abs(delta_uv.x)
-                delta_uv.y = abs(delta_uv.y)
-            edge_key = tuple(sorted([f.vertices[j0], f.vertices[j1]]))
-            uv_vectors[edge_key] = delta_uv
-        count += f_verts
-    uv_vectors = [uv_vectors[tuple(sorted(e.vertices))] for e in me.edges]
+    loop_uvs = get_corner_attribute_numpy(me, attr_name=None, use_evaluated=False, prefer_attributes=True)
+    if loop_uvs is None:
+        loop_uvs = np.zeros(len(me.loops)*2, dtype=np.float32)
+        me.uv_layers[uv_map].data.foreach_get('uv', loop_uvs)
+        loop_uvs = loop_uvs.reshape((-1,2))
+    loop_uvs = loop_uvs[:,:2]
+    loops_edge = get_attribute_numpy(me.loops, 'edge_index').astype('int')
+    loop_total = get_attribute_numpy(me.polygons, 'loop_total').astype('int')
+    delta_uv = loop_uvs[get_next_loops_numpy(loop_total)] - loop_uvs
+    length = np.linalg.norm(delta_uv, axis=1)
+    length[length == 0] = 1
+    delta_uv /= length[:,None]
+    if only_positive: delta_uv = np.abs(delta_uv)
+    uv_vectors = np.zeros((len(me.edges),2))
+    uv_vectors[loops_edge] = delta_uv
     return uv_vectors
 
 def mesh_diffusion(me, values, iter, diff=0.2, uv_dir=0):
     values = np.array(values)
     n_verts = len(me.vertices)
 
-    n_edges = len(me.edges)
-    edge_verts = [0]*n_edges*2
-    #me.edges.foreach_get("vertices", edge_verts)
-
-    count = 0
-    edge_verts = []
-    uv_factor = {}
-    uv_ang = (0.5 + uv_dir*0.5)*pi/2
-    uv_vec = Vector((cos(uv_ang), sin(uv_ang)))
-    # Try to get per-loop UVs from corner attributes first
-    loop_uvs = get_corner_attribute_vectors(me, attr_name=None, use_evaluated=False, prefer_attributes=True)
-    use_corner = loop_uvs is not None
-
-    for i, f in enumerate(me.polygons):
-        f_verts = len(f.vertices)
-        for j0 in range(f_verts):
-            j1 = (j0+1)%f_verts
-            if uv_dir != 0:
-                if use_corner:
-                    uv0 = Vector(loop_uvs[count + j0])
-                    uv1 = Vector(loop_uvs[count + j1])
-                    delta_uv = (uv1 - uv0)
-                    try: delta_uv = delta_uv.normalized()
-                    except: pass
-                else:
-                    uv0 = me.uv_layers[0].data[count+j0].uv
-                    uv1 = me.uv_layers[0].data[count+j1].uv
-                    delta_uv = (uv1 - uv0)
-                    try: delta_uv = delta_uv.normalized()
-                    except: pass
-                delta_uv.x = abs(delta_uv.x)
-                delta_uv.y = abs(delta_uv.y)
-                dir = uv_vec.dot(delta_uv)
-            else:
-                dir = 1
-            edge_key = [f.vertices[j0], f.vertices[j1]]
-            edge_key.sort()
-            uv_factor[tuple(edge_key)] = dir
-        count += f_verts
-    id0 = []
-    id1 = []
-    uv_mult = []
-    for ek, val in uv_factor.items():
-        id0.append(ek[0])
-        id1.append(ek[1])
-        uv_mult.append(val)
-    id0 = np.array(id0)
-    id1 = np.array(id1)
-    uv_mult = np.array(uv_mult)
-
-    #edge_verts = np.array(edge_verts)
-    #arr = np.arange(n_edges)*2
-
-    #id0 = edge_verts[arr]     # first vertex indices for each edge
-    #id1 = edge_verts[arr+1]   # second vertex indices for each edge
+    # edges of the polygons, keeping the loop of the last polygon
+    loop_total = get_attribute_numpy(me.polygons, 'loop_total').astype('int')
+    loops_vert = get_attribute_numpy(me.loops, 'vertex_index').astype('int')
+    next_loops = get_next_loops_numpy(loop_total)
+    edge_keys = np.sort(np.stack((loops_vert, loops_vert[next_loops]), axis=1), axis=1)
+    edge_keys, index = np.unique(edge_keys[::-1], axis=0, return_index=True)
+    edges_loop = len(loops_vert) - 1 - index
+    id0 = edge_keys[:,0]
+    id1 = edge_keys[:,1]
+
+    uv_mult = np.ones(len(edge_keys))
+    if uv_dir != 0:
+        # Try to get per-loop UVs from corner attributes first
+        loop_uvs = get_corner_attribute_numpy(me, attr_name=None, use_evaluated=False, prefer_attributes=True)
+        if loop_uvs is not None:
+            uv_ang = (0.5 + uv_dir*0.5)*pi/2
+            loop_uvs = loop_uvs[:,:2]
+            delta_uv = loop_uvs[next_loops[edges_loop]] - loop_uvs[edges_loop]
+            length = np.linalg.norm(delta_uv, axis=1)
+            length[length == 0] = 1
+            delta_uv = np.abs(delta_uv / length[:,None])
+            uv_mult = delta_uv[:,0]*cos(uv_ang) + delta_uv[:,1]*sin(uv_ang)
+
     for ii in range(iter):
         lap = np.zeros(n_verts)
         if uv_dir != 0:
@@ -1975,21 +2447,561 @@ def mesh_diffusion_vector(me, vectors, iter, diff, uv_dir=0):
     vectors[:,2] = z
     return vectors
 
-def fill_neighbors_attribute(verts,weight,attribute):
-    neigh = {}
-    for v0 in verts:
-        for f in v0.link_faces:
-            for v1 in f.verts:
-                if attribute == 'GEODESIC':
-                    dist = weight[v0.index] + (v0.co-v1.co).length
-                elif attribute == 'TOPOLOGY':
-                    dist = weight[v0.index] + 1.0
-                w1 = weight[v1.index]
-                if w1 == None or w1 > dist:
-                    weight[v1.index] = dist
-                    neigh[v1] = 0
-    if len(neigh) == 0: return weight
-    else: return fill_neighbors_attribute(neigh.keys(), weight, attribute)
+def get_polygons_numpy(mesh):
+    """
+    Group the polygons of a given mesh by number of sides.
+    :arg mesh: Mesh data.
+    :type mesh: :class:'bpy.types.Mesh'
+    :return: Dictionary with the number of sides as key and the vertex
+        indexes of the polygons as numpy array of shape (n_polygons, sides).
+    :rtype: dict
+    """
+    loop_total = get_attribute_numpy(mesh.polygons, 'loop_total').astype('int')
+    loops_vert = get_attribute_numpy(mesh.loops, 'vertex_index').astype('int')
+    loop_start = np.cumsum(loop_total) - loop_total
+    polygons = {}
+    for sides in np.unique(loop_total):
+        start = loop_start[loop_total == sides]
+        polygons[sides] = loops_vert[start[:,None] + np.arange(sides)]
+    return polygons
+
+def get_polygons_graph_numpy(mesh, polygons=None):
+    """
+    Compressed adjacency (CSR) connecting every vertex to all the vertices
+    that share a polygon with it.
+    :return: Offsets (n_verts + 1) and neighbors of the vertices.
+    :rtype: tuple of :class:'numpy.ndarray'
+    """
+    n_verts = len(mesh.vertices)
+    if polygons is None: polygons = get_polygons_numpy(mesh)
+    pairs = [np.zeros((0,2), dtype='int')]
+    for sides, verts in polygons.items():
+        i, j = np.nonzero(~np.eye(sides, dtype='bool'))
+        pairs.append(np.stack((verts[:,i].reshape((-1)), verts[:,j].reshape((-1))), axis=1))
+    pairs = np.unique(np.concatenate(pairs), axis=0)
+    adj_offset = np.zeros(n_verts+1, dtype='int')
+    np.cumsum(np.bincount(pairs[:,0], minlength=n_verts), out=adj_offset[1:])
+    return adj_offset, pairs[:,1]
+
+def get_triangles_numpy(mesh, polygons=None):
+    """
+    Fan triangulation of the polygons of a given mesh.
+    :return: Vertex indexes of the triangles, with shape (n_tris, 3).
+    :rtype: :class:'numpy.ndarray'
+    """
+    if polygons is None: polygons = get_polygons_numpy(mesh)
+    tris = [np.zeros((0,3), dtype='int')]
+    for sides, verts in polygons.items():
+        for i in range(1, sides-1):
+            tris.append(verts[:,(0,i,i+1)])
+    return np.concatenate(tris)
+
+def mesh_from_loops_numpy(name, vertices, loops_vert, loop_total, mesh=None, edges=None):
+    """
+    Create a mesh from flat arrays of vertices and loops, with bulk
+    foreach_set() calls instead of from_pydata().
+    :arg name: Name of the new mesh.
+    :type name: str
+    :arg vertices: Coordinates of the vertices.
+    :type vertices: :class:'numpy.ndarray'
+    :arg loops_vert: Vertex index of each loop.
+    :type loops_vert: :class:'numpy.ndarray'
+    :arg loop_total: Number of loops of each polygon.
+    :type loop_total: :class:'numpy.ndarray'
+    :arg mesh: Empty mesh to fill (optional).
+    :type mesh: :class:'bpy.types.Mesh'
+    :arg edges: Additional edges, such as loose edges (optional).
+    :type edges: :class:'numpy.ndarray'
+    :return: Mesh data.
+    :rtype: :class:'bpy.types.Mesh'
+    """
+    if mesh is None: mesh = bpy.data.meshes.new(name)
+    loop_total = np.array(loop_total, dtype='int32')
+    mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set('co', np.array(vertices, dtype='float32').reshape((-1)))
+    if edges is not None and len(edges) > 0:
+        mesh.edges.add(len(edges))
+        mesh.edges.foreach_set('vertices', np.array(edges, dtype='int32').reshape((-1)))
+    mesh.loops.add(len(loops_vert))
+    mesh.loops.foreach_set('vertex_index', np.array(loops_vert, dtype='int32'))
+    mesh.polygons.add(len(loop_total))
+    mesh.polygons.foreach_set('loop_start', (np.cumsum(loop_total) - loop_total).astype('int32'))
+    # read-only since Blender 4.0
+    try: mesh.polygons.foreach_set('loop_total', loop_total)
+    except: pass
+    # the existing edges are kept
+    mesh.update(calc_edges=True)
+    return mesh
+
+# foreach_get() key, number of components and NumPy type of the attributes
+attribute_types = {
+    'FLOAT' : ('value', 1, 'float32'),
+    'INT' : ('value', 1, 'int32'),
+    'INT8' : ('value', 1, 'int8'),
+    'BOOLEAN' : ('value', 1, 'bool'),
+    'FLOAT2' : ('vector', 2, 'float32'),
+    'INT32_2D' : ('value', 2, 'int32'),
+    'FLOAT_VECTOR' : ('vector', 3, 'float32'),
+    'FLOAT_COLOR' : ('color', 4, 'float32'),
+    'BYTE_COLOR' : ('color', 4, 'float32'),
+    'QUATERNION' : ('value', 4, 'float32')
+    }
+
+def get_attributes_numpy(mesh, domain, exclude=()):
+    """
+    Read all the generic attributes of a domain as float values. Internal
+    attributes (starting with '.') and unsupported types are skipped.
+    :arg mesh: Mesh data.
+    :type mesh: :class:'bpy.types.Mesh'
+    :arg domain: Attribute domain ('POINT', 'EDGE', 'FACE' or 'CORNER').
+    :type domain: str
+    :arg exclude: Names of the attributes to skip.
+    :type exclude: list
+    :return: Names and types of the attributes, and their values stacked
+        with shape (n_elements, n_components).
+    :rtype: tuple
+    """
+    names = []
+    types = []
+    values = []
+    for attr in mesh.attributes:
+        if attr.domain != domain or attr.data_type not in attribute_types: continue
+        if attr.name.startswith('.') or attr.name in exclude: continue
+        key, size, dtype = attribute_types[attr.data_type]
+        data = np.zeros(len(attr.data)*size, dtype=dtype)
+        attr.data.foreach_get(key, data)
+        names.append(attr.name)
+        types.append(attr.data_type)
+        values.append(data.reshape((-1,size)).astype('float'))
+    n_elements = {'POINT' : len(mesh.vertices), 'EDGE' : len(mesh.edges),
+        'FACE' : len(mesh.polygons), 'CORNER' : len(mesh.loops)}[domain]
+    values = np.concatenate([np.zeros((n_elements,0))] + values, axis=1)
+    return names, types, values
+
+def set_attributes_numpy(mesh, domain, names, types, values):
+    """
+    Create the generic attributes read by get_attributes_numpy(), rounding
+    the interpolated values of integer and boolean attributes.
+    :arg mesh: Mesh data.
+    :type mesh: :class:'bpy.types.Mesh'
+    :arg domain: Attribute domain ('POINT', 'EDGE', 'FACE' or 'CORNER').
+    :type domain: str
+    :arg names: Names of the attributes.
+    :type names: list
+    :arg types: Types of the attributes.
+    :type types: list
+    :arg values: Values of the attributes, with shape (n_elements, n_components).
+    :type values: :class:'numpy.ndarray'
+    """
+    col = 0
+    for name, data_type in zip(names, types):
+        key, size, dtype = attribute_types[data_type]
+        data = values[:,col:col+size]
+        col += size
+        if dtype == 'bool': data = data > 0.5
+        elif dtype != 'float32': data = np.round(data)
+        if name in mesh.attributes: attr = mesh.attributes[name]
+        else: attr = mesh.attributes.new(name, data_type, domain)
+        attr.data.foreach_set(key, data.astype(dtype).reshape((-1)))
+
+def walk_dual_faces(next_out, twin, visited, out, face_start, face_open):
+    """
+    Collect the fans of half-edges leaving each vertex, in counterclockwise
+    order. The open fans of the boundary vertices start from a boundary
+    half-edge and are collected first, then the closed fans of the inner
+    vertices. Every half-edge is visited once.
+    Works with lists, or with numpy arrays when compiled with Numba.
+    :return: Number of stored half-edges and number of fans.
+    :rtype: tuple
+    """
+    n_out = 0
+    n_faces = 0
+    for phase in range(2):
+        for h in range(len(next_out)):
+            if visited[h]: continue
+            if phase == 0 and twin[h] > -1: continue
+            face_start[n_faces] = n_out
+            face_open[n_faces] = phase == 0
+            n_faces += 1
+            cur = h
+            while cur > -1 and not visited[cur]:
+                visited[cur] = True
+                out[n_out] = cur
+                n_out += 1
+                cur = next_out[cur]
+    face_start[n_faces] = n_out
+    return n_out, n_faces
+
+try: numba_walk_dual_faces = njit(walk_dual_faces)
+except: numba_walk_dual_faces = None
+
+def dual_mesh_numpy(vertices, tris, preserve_borders=True):
+    """
+    Dual of a triangulated mesh. Every triangle becomes a vertex in its
+    centroid, and every vertex becomes a polygon connecting the centroids
+    of the triangles around it.
+    :arg vertices: Coordinates of the vertices.
+    :type vertices: :class:'numpy.ndarray'
+    :arg tris: Vertex indexes of the triangles, with shape (n_tris, 3).
+    :type tris: :class:'numpy.ndarray'
+    :arg preserve_borders: Close the polygons of the boundary vertices with
+        the midpoints of the boundary edges and the vertex itself, instead
+        of skipping them.
+    :type preserve_borders: bool
+    :return: Vertices of the dual mesh, vertex index of each loop and number
+        of loops of each polygon.
+    :rtype: tuple of :class:'numpy.ndarray'
+    """
+    vertices = np.array(vertices, dtype='float').reshape((-1,3))
+    tris = np.array(tris, dtype='int').reshape((-1,3))
+    n_verts = len(vertices)
+    n_tris = len(tris)
+    centroids = np.mean(vertices[tris], axis=1)
+
+    # half-edge h goes from corner h%3 to the next corner of triangle h//3
+    half_v0 = tris.reshape((-1))
+    half_v1 = np.roll(tris, -1, axis=1).reshape((-1))
+    n_half = len(half_v0)
+    half_prev = np.arange(n_half) + np.tile((2,-1,-1), n_tris)
+
+    # opposite half-edges, only for edges with two consistent triangles
+    keys = half_v0.astype(np.int64)*n_verts + half_v1
+    unique_keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape((-1))
+    sorted_half = np.argsort(inverse, kind='stable')
+    twin_keys = half_v1.astype(np.int64)*n_verts + half_v0
+    pos = np.clip(np.searchsorted(unique_keys, twin_keys), 0, max(len(unique_keys)-1,0))
+    twin = np.full(n_half, -1, dtype='int')
+    if n_half > 0:
+        found = (unique_keys[pos] == twin_keys) & (counts[pos] == 1) & (counts[inverse] == 1)
+        first = np.cumsum(counts) - counts
+        twin[found] = sorted_half[first[pos[found]]]
+
+    # rotating counterclockwise around the first vertex of each half-edge
+    next_out = twin[half_prev]
+
+    if numba_walk_dual_faces:
+        visited = np.zeros(n_half, dtype='bool')
+        out = np.zeros(n_half, dtype='int')
+        face_start = np.zeros(n_half+1, dtype='int')
+        face_open = np.zeros(n_half, dtype='bool')
+        n_out, n_faces = numba_walk_dual_faces(next_out, twin, visited, out, face_start, face_open)
+    else:
+        visited = [False]*n_half
+        out = [0]*n_half
+        face_start = [0]*(n_half+1)
+        face_open = [False]*n_half
+        n_out, n_faces = walk_dual_faces(next_out.tolist(), twin.tolist(), visited, out, face_start, face_open)
+    out = np.array(out[:n_out], dtype='int')
+    face_start = np.array(face_start[:n_faces+1], dtype='int')
+    face_open = np.array(face_open[:n_faces], dtype='bool')
+    fan_total = np.diff(face_start)
+
+    # new vertices on the boundary edges and on the boundary vertices
+    is_bound = twin == -1
+    bound_mid = np.cumsum(is_bound) - 1 + n_tris
+    first_half = out[face_start[:-1]]
+    last_half = half_prev[out[face_start[1:]-1]]
+    open_verts = half_v0[first_half[face_open]]
+    open_verts, open_index = np.unique(open_verts, return_inverse=True)
+    mid_co = (vertices[half_v0[is_bound]] + vertices[half_v1[is_bound]])/2
+    dual_verts = np.concatenate((centroids, mid_co, vertices[open_verts]))
+
+    if preserve_borders: keep = np.ones(n_faces, dtype='bool')
+    else: keep = ~face_open
+    extra = face_open*3
+    keep &= fan_total + extra > 2
+    loop_total = (fan_total + extra)[keep]
+    loop_start = np.cumsum(loop_total) - loop_total
+    n_loops = np.sum(loop_total)
+    loops_vert = np.zeros(n_loops, dtype='int')
+
+    # centroids of the fans, after the first midpoint of the open fans
+    faces_id = np.repeat(np.arange(n_faces), fan_total)
+    fan_pos = np.arange(n_out) - face_start[faces_id]
+    new_id = np.full(n_faces, -1, dtype='int')
+    new_id[keep] = np.arange(len(loop_total))
+    keep_loops = keep[faces_id]
+    faces_id = new_id[faces_id[keep_loops]]
+    loops_vert[loop_start[faces_id] + face_open[keep][faces_id] + fan_pos[keep_loops]] = \
+        out[keep_loops]//3
+
+    # boundary midpoints and boundary vertex of the open fans
+    open_keep = keep[face_open]
+    open_faces = new_id[face_open][open_keep]
+    start = loop_start[open_faces]
+    end = start + loop_total[open_faces]
+    loops_vert[start] = bound_mid[first_half[face_open][open_keep]]
+    loops_vert[end-2] = bound_mid[last_half[face_open][open_keep]]
+    loops_vert[end-1] = n_tris + len(mid_co) + open_index.reshape((-1))[open_keep]
+
+    # remove the unused vertices
+    used = np.zeros(len(dual_verts), dtype='bool')
+    used[loops_vert] = True
+    verts_id = np.cumsum(used) - 1
+    return dual_verts[used], verts_id[loops_vert], loop_total
+
+def walk_geodesic(adj_offset, adj_verts, adj_length, dist, known, seeds, co, tri_offset, tri_ids, tris, use_triangles):
+    """
+    Multi-source Dijkstra propagation with a binary heap. When use_triangles
+    is True, the distances are also updated across the triangles as in the
+    Fast Marching Method, approximating the distance on the surface.
+    Works with lists, or with numpy arrays when compiled with Numba.
+    """
+    heap = [(0.0, seeds[0])]
+    for i in range(len(seeds)):
+        dist[seeds[i]] = 0.0
+        if i > 0: heapq.heappush(heap, (0.0, seeds[i]))
+    while len(heap) > 0:
+        d, v = heapq.heappop(heap)
+        if known[v]: continue
+        known[v] = True
+        # edge updates
+        for p in range(adj_offset[v], adj_offset[v+1]):
+            u = adj_verts[p]
+            if known[u]: continue
+            nd = d + adj_length[p]
+            if nd < dist[u]:
+                dist[u] = nd
+                heapq.heappush(heap, (nd, u))
+        if not use_triangles: continue
+        # triangle updates: from the known vertices v and a to c
+        for p in range(tri_offset[v], tri_offset[v+1]):
+            t = tri_ids[p]*3
+            kv = 0 if tris[t] == v else (1 if tris[t+1] == v else 2)
+            for k in range(3):
+                if k == kv: continue
+                a = tris[t+k]
+                if not known[a]: continue
+                c = tris[t+3-k-kv]
+                if known[c]: continue
+                ax = co[a*3] - co[c*3]
+                ay = co[a*3+1] - co[c*3+1]
+                az = co[a*3+2] - co[c*3+2]
+                bx = co[v*3] - co[c*3]
+                by = co[v*3+1] - co[c*3+1]
+                bz = co[v*3+2] - co[c*3+2]
+                aa = ax*ax + ay*ay + az*az
+                bb = bx*bx + by*by + bz*bz
+                ab = ax*bx + ay*by + az*bz
+                det = aa*bb - ab*ab
+                if det <= 0: continue
+                # planar wavefront through a and v: solve |n| = 1
+                ta = dist[a]
+                tb = d
+                q_sum = (aa + bb - 2*ab)/det
+                q_t = (ta*(bb-ab) + tb*(aa-ab))/det
+                q_tt = (ta*ta*bb - 2*ta*tb*ab + tb*tb*aa)/det
+                delta = q_t*q_t - q_sum*(q_tt - 1)
+                if delta < 0: continue
+                nd = (q_t + sqrt(delta))/q_sum
+                if nd < ta or nd < tb: continue
+                # the front must come from inside the triangle
+                la = (bb*(ta-nd) - ab*(tb-nd))/det
+                lb = (aa*(tb-nd) - ab*(ta-nd))/det
+                if la > 0 or lb > 0: continue
+                if nd < dist[c]:
+                    dist[c] = nd
+                    heapq.heappush(heap, (nd, c))
+
+try: numba_walk_geodesic = njit(walk_geodesic)
+except: numba_walk_geodesic = None
+
+def sparse_cg(rows, cols, values, diag, b, tol=1e-10, max_iter=5000):
+    """
+    Jacobi preconditioned Conjugate Gradient for a symmetric positive
+    definite sparse matrix, given as coordinates (rows, cols, values).
+    Used when SciPy is not available.
+    """
+    n = len(b)
+    x = np.zeros(n)
+    r = np.array(b, dtype=np.float64)
+    b_norm = np.linalg.norm(r)
+    if b_norm == 0: return x
+    z = r/diag
+    p = z.copy()
+    rz = np.dot(r, z)
+    for i in range(max_iter):
+        Ap = np.bincount(rows, weights=values*p[cols], minlength=n)
+        alpha = rz/np.dot(p, Ap)
+        x += alpha*p
+        r -= alpha*Ap
+        if np.linalg.norm(r) < tol*b_norm: break
+        z = r/diag
+        rz1 = np.dot(r, z)
+        p *= rz1/rz
+        p += z
+        rz = rz1
+    return x
+
+heat_method_cache = {}
+
+def heat_method_operators(vertices, tris):
+    """
+    Precompute the operators used by the Heat Method: cotangent Laplacian,
+    lumped mass matrix, and the two factorized (or preconditioned) systems.
+    The result is cached for the given geometry, so that every new set of
+    seeds only costs two sparse solves.
+    :arg vertices: Vertices coordinates, with shape (n_verts, 3).
+    :type vertices: :class:'numpy.ndarray'
+    :arg tris: Vertex indexes of the triangles, with shape (n_tris, 3).
+    :type tris: :class:'numpy.ndarray'
+    :return: Precomputed data.
+    :rtype: dict
+    """
+    vertices = np.ascontiguousarray(vertices, dtype=np.float64)
+    tris = np.ascontiguousarray(tris, dtype='int')
+    key = (hash(vertices.tobytes()), hash(tris.tobytes()))
+    if key in heat_method_cache: return heat_method_cache[key]
+
+    n_verts = len(vertices)
+    v0 = vertices[tris[:,0]]
+    v1 = vertices[tris[:,1]]
+    v2 = vertices[tris[:,2]]
+    # edges opposite to each corner, counterclockwise
+    edges = np.stack((v2-v1, v0-v2, v1-v0), axis=1)
+    normals = np.cross(v1-v0, v2-v0)
+    area2 = np.linalg.norm(normals, axis=1)
+    area2 = np.maximum(area2, 1e-16)
+    normals /= area2[:,None]
+    # cotangent of the angle of each corner
+    cot = -np.einsum('ij,ij->i', edges[:,(1,2,0)].reshape((-1,3)),
+        edges[:,(2,0,1)].reshape((-1,3))).reshape((-1,3)) / area2[:,None]
+
+    # positive semi-definite cotangent Laplacian
+    id_i = tris[:,(1,2,0)].reshape((-1))
+    id_j = tris[:,(2,0,1)].reshape((-1))
+    w = cot.reshape((-1))/2
+    diag_L = np.bincount(id_i, weights=w, minlength=n_verts) + np.bincount(id_j, weights=w, minlength=n_verts)
+    mass = np.bincount(tris.reshape((-1)), weights=np.repeat(area2/6, 3), minlength=n_verts)
+    mass = np.maximum(mass, 1e-16)
+    rows = np.concatenate((id_i, id_j, np.arange(n_verts)))
+    cols = np.concatenate((id_j, id_i, np.arange(n_verts)))
+    values_L = np.concatenate((-w, -w, diag_L))
+    values_M = np.concatenate((np.zeros(len(w)*2), mass))
+
+    # time step: squared mean edge length
+    t = np.mean(np.linalg.norm(edges, axis=2))**2
+    if not bool_scipy:
+        # the iterative solver can't resolve the vanishing heat far from
+        # the seeds, a longer diffusion keeps it above the tolerance
+        diagonal = np.linalg.norm(np.ptp(vertices, axis=0))
+        t = max(t, (diagonal/25)**2)
+    values_heat = values_M + t*values_L
+    values_poisson = values_L + 1e-8*values_M
+    ops = {'tris' : tris, 'edges' : edges, 'normals' : normals, 'area2' : area2,
+        'cot' : cot, 'n_verts' : n_verts}
+    if bool_scipy:
+        shape = (n_verts, n_verts)
+        heat = scipy.sparse.csc_matrix((values_heat, (rows, cols)), shape=shape)
+        poisson = scipy.sparse.csc_matrix((values_poisson, (rows, cols)), shape=shape)
+        ops['solve_heat'] = scipy.sparse.linalg.factorized(heat)
+        ops['solve_poisson'] = scipy.sparse.linalg.factorized(poisson)
+    else:
+        diag_heat = np.bincount(rows, weights=values_heat*(rows==cols), minlength=n_verts)
+        diag_poisson = np.bincount(rows, weights=values_poisson*(rows==cols), minlength=n_verts)
+        ops['solve_heat'] = lambda b: sparse_cg(rows, cols, values_heat, diag_heat, b)
+        ops['solve_poisson'] = lambda b: sparse_cg(rows, cols, values_poisson, diag_poisson, b)
+
+    # keep only the most recent geometries
+    if len(heat_method_cache) > 3:
+        heat_method_cache.pop(next(iter(heat_method_cache)))
+    heat_method_cache[key] = ops
+    return ops
+
+def heat_geodesic_distance(vertices, tris, seeds):
+    """
+    Geodesic distance from the seed vertices, computed with the Heat Method
+    (Crane et al. 2013).
+    :arg vertices: Vertices coordinates, with shape (n_verts, 3).
+    :type vertices: :class:'numpy.ndarray'
+    :arg tris: Vertex indexes of the triangles, with shape (n_tris, 3).
+    :type tris: :class:'numpy.ndarray'
+    :arg seeds: Indexes of the seed vertices.
+    :type seeds: :class:'numpy.ndarray'
+    :return: Distance of each vertex, inf for vertices not reached by the heat.
+    :rtype: :class:'numpy.ndarray'
+    """
+    ops = heat_method_operators(vertices, tris)
+    tris = ops['tris']
+    edges = ops['edges']
+    cot = ops['cot']
+    delta = np.zeros(ops['n_verts'])
+    delta[seeds] = 1
+    # 1. heat diffusion
+    u = ops['solve_heat'](delta)
+    # 2. normalized gradient of the heat, for each triangle
+    grad = np.einsum('ij,ijk->ik', u[tris], np.cross(ops['normals'][:,None,:], edges))
+    grad_len = np.linalg.norm(grad, axis=1)
+    grad_len[grad_len == 0] = inf
+    X = -grad/grad_len[:,None]
+    # 3. integrated divergence of the field, for each vertex
+    dot = np.einsum('ijk,ik->ij', edges, X)
+    # corner k: cot of the opposite corners times the edges leaving k
+    div_corner = np.stack((
+        cot[:,2]*dot[:,2] - cot[:,1]*dot[:,1],
+        cot[:,0]*dot[:,0] - cot[:,2]*dot[:,2],
+        cot[:,1]*dot[:,1] - cot[:,0]*dot[:,0]), axis=1)/2
+    div = np.bincount(tris.reshape((-1)), weights=div_corner.reshape((-1)), minlength=ops['n_verts'])
+    # 4. distance recovered from the divergence
+    dist = ops['solve_poisson'](-div)
+    dist -= np.min(dist[seeds])
+    dist[u == 0] = inf
+    return dist
+
+def geodesic_distance(mesh, seeds, mode='GEODESIC', vertices=None):
+    """
+    Compute the distance of all the vertices from the seed vertices.
+    :arg mesh: Mesh data.
+    :type mesh: :class:'bpy.types.Mesh'
+    :arg seeds: Indexes of the seed vertices.
+    :type seeds: :class:'numpy.ndarray'
+    :arg mode: 'GEODESIC' (shortest path between vertices of the same
+        polygons), 'TOPOLOGY' (number of steps), 'SURFACE' (Fast Marching
+        on the triangulated surface) or 'HEAT' (Heat Method, cached for
+        repeated queries on the same geometry).
+    :type mode: str
+    :arg vertices: Vertices coordinates (optional).
+    :type vertices: :class:'numpy.ndarray'
+    :return: Distance of each vertex, inf for vertices not connected to the seeds.
+    :rtype: :class:'numpy.ndarray'
+    """
+    n_verts = len(mesh.vertices)
+    seeds = np.unique(np.array(seeds, dtype='int'))
+    dist = np.full(n_verts, inf)
+    if len(seeds) == 0: return dist
+    if vertices is None: vertices = get_vertices_numpy(mesh)
+    polygons = get_polygons_numpy(mesh)
+    if mode == 'HEAT':
+        return heat_geodesic_distance(vertices, get_triangles_numpy(mesh, polygons), seeds)
+    adj_offset, adj_verts = get_polygons_graph_numpy(mesh, polygons)
+    vert0 = np.repeat(np.arange(n_verts), np.diff(adj_offset))
+    if mode == 'TOPOLOGY':
+        adj_length = np.ones(len(adj_verts))
+    else:
+        adj_length = np.linalg.norm(vertices[adj_verts] - vertices[vert0], axis=1)
+    use_triangles = mode == 'SURFACE'
+    if use_triangles:
+        tris = get_triangles_numpy(mesh, polygons)
+        tri_verts = tris.reshape((-1))
+        tri_ids = np.argsort(tri_verts, kind='stable')//3
+        tri_offset = np.zeros(n_verts+1, dtype='int')
+        np.cumsum(np.bincount(tri_verts, minlength=n_verts), out=tri_offset[1:])
+    else:
+        tri_verts = tri_ids = np.zeros(0, dtype='int')
+        tri_offset = np.zeros(n_verts+1, dtype='int')
+    co = np.array(vertices, dtype=np.float64).reshape((-1))
+    known = np.zeros(n_verts, dtype='bool')
+    if numba_walk_geodesic:
+        numba_walk_geodesic(adj_offset, adj_verts, adj_length, dist, known, seeds,
+            co, tri_offset, tri_ids, tri_verts, use_triangles)
+    else:
+        dist = dist.tolist()
+        walk_geodesic(adj_offset.tolist(), adj_verts.tolist(), adj_length.tolist(),
+            dist, known.tolist(), seeds.tolist(), co.tolist(), tri_offset.tolist(),
+            tri_ids.tolist(), tri_verts.tolist(), use_triangles)
+        dist = np.array(dist)
+    return dist
 
 # ------------------------------------------------------------------
 # MODIFIERS
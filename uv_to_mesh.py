@@ -2,11 +2,10 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 
-import bpy, bmesh
+import bpy
 import math
 from bpy.types import Operator
 from bpy.props import BoolProperty
-from mathutils import Vector
 from .utils import *
 
 
@@ -37,6 +36,12 @@ class uv_to_mesh(Operator):
             description="Scale the new object in order to preserve the average surface area"
             )
 
+    weld : BoolProperty(
+            name="Weld Vertices",
+            default=True,
+            description="Merge the corners sharing the same vertex and UV coordinates (within 1e-6)"
+            )
+
     def execute(self, context):
         if context.mode == 'EDIT_MESH': on_selection = True
         else: on_selection = False
@@ -49,104 +54,106 @@ class uv_to_mesh(Operator):
         name0 = ob0.name
         ob0 = convert_object_to_mesh(ob0, apply_modifiers=self.apply_modifiers, preserve_status=False)
         me0 = ob0.data
-        area = 0
-        verts = []
-        faces = []
-        face_materials = []
-        if on_selection: polygons = [f for f in me0.polygons if f.select]
-        else: polygons = me0.polygons
-        bm = bmesh.new()
-
-        for face in polygons:
-            area += face.area
-            uv_face = []
-            store = False
-            # Try corner attributes (Geometry Nodes) first, fall back to legacy UV layers
-            loop_uvs = get_corner_attribute_vectors(me0, attr_name=None, use_evaluated=False, prefer_attributes=True)
-            if loop_uvs is not None:
-                verts = []
-                for loop in face.loop_indices:
-                    uv = loop_uvs[loop]
-                    ux = uv[0] if len(uv) > 0 else 0.0
-                    uy = uv[1] if len(uv) > 1 else 0.0
-                    if ux != 0 and uy != 0:
-                        store = True
-                    new_vert = bm.verts.new((ux, uy, 0))
-                    verts.append(new_vert)
-                if store:
-                    new_face = bm.faces.new(verts)
-                    new_face.material_index = face.material_index
-            elif len(me0.uv_layers) > 0:
-                verts = []
-                for loop in face.loop_indices:
-                    uv = me0.uv_layers.active.data[loop].uv
-                    if uv.x != 0 and uv.y != 0:
-                        store = True
-                    new_vert = bm.verts.new((uv.x, uv.y, 0))
-                    verts.append(new_vert)
-                if store:
-                    new_face = bm.faces.new(verts)
-                    new_face.material_index = face.material_index
-            else:
-                self.report({'ERROR'}, "Missing UV Map or corner attribute")
+
+        # Try corner attributes (Geometry Nodes) first, fall back to legacy UV layers
+        uvs = get_corner_attribute_numpy(me0, attr_name=None, use_evaluated=False,
+            prefer_attributes=True, use_cache=False)
+        if uvs is None:
+            self.report({'ERROR'}, "Missing UV Map or corner attribute")
+            bpy.data.objects.remove(ob0)
+            return {'CANCELLED'}
+        uvs = uvs[:,:2].astype('float')
+
+        loop_total = get_attribute_numpy(me0.polygons, 'loop_total').astype('int')
+        loops_vert = get_attribute_numpy(me0.loops, 'vertex_index').astype('int')
+        loops_face = np.repeat(np.arange(len(loop_total)), loop_total)
+        if on_selection: mask = get_attribute_numpy(me0.polygons, 'select').astype('bool')
+        else: mask = np.ones(len(loop_total), dtype='bool')
+        area = np.sum(get_attribute_numpy(me0.polygons, 'area')[mask])
+
+        # faces with all the corners in the origin of the UV are skipped
+        store = np.zeros(len(loop_total), dtype='bool')
+        store[loops_face[(uvs[:,0] != 0) & (uvs[:,1] != 0)]] = True
+        mask &= store
+        loops_mask = mask[loops_face]
+        uvs = uvs[loops_mask]
+        loops_vert = loops_vert[loops_mask]
+        loop_total = loop_total[mask]
+
+        # one vertex per corner, or per vertex and UV coordinates
+        if self.weld:
+            index, new_loops = weld_uv_corners(loops_vert, uvs)
+        else:
+            index = np.arange(len(uvs))
+            new_loops = index
+        verts_source = loops_vert[index]
+        verts = np.zeros((len(index),3))
+        verts[:,:2] = uvs[index]
+
+        if self.auto_scale:
+            # area of the UV polygons
+            loop_start = np.cumsum(loop_total) - loop_total
+            loops_next = get_next_loops_numpy(loop_total)
+            cross = uvs[:,0]*uvs[loops_next,1] - uvs[loops_next,0]*uvs[:,1]
+            new_area = 0
+            if len(cross) > 0:
+                new_area = np.sum(np.abs(np.add.reduceat(cross, loop_start)))/2
+            if new_area == 0:
+                self.report({'ERROR'}, "Impossible to generate mesh from UV")
+                bpy.data.objects.remove(ob0)
                 return {'CANCELLED'}
+            verts *= math.pow(area / new_area, 1 / 2)
 
         name = name0 + '_UV'
         # Create mesh and object
-        me = bpy.data.meshes.new(name + 'Mesh')
+        me = mesh_from_loops_numpy(name + 'Mesh', verts, new_loops, loop_total)
+        if self.materials:
+            material_index = get_attribute_numpy(me0.polygons, 'material_index').astype('int')
+            me.polygons.foreach_set('material_index', material_index[mask])
+            # assign old material
+            for slot in ob0.material_slots:
+                me.materials.append(slot.material)
+        me.update()
         ob = bpy.data.objects.new(name, me)
 
         # Link object to scene and make active
-        scn = bpy.context.scene
         bpy.context.collection.objects.link(ob)
         bpy.context.view_layer.objects.active = ob
         ob.select_set(True)
 
-        # Create mesh from given verts, faces.
-        bm.to_mesh(me)
-        # Update mesh with new data
-        me.update()
-
-        if self.auto_scale:
-            new_area = 0
-            for p in me.polygons:
-                new_area += p.area
-            if new_area == 0:
-                self.report({'ERROR'}, "Impossible to generate mesh from UV")
-                bpy.data.objects.remove(ob0)
-                return {'CANCELLED'}
-
         # VERTEX GROUPS
-        if self.vertex_groups:
+        if self.vertex_groups and len(ob0.vertex_groups) > 0:
             for group in ob0.vertex_groups:
-                index = group.index
                 ob.vertex_groups.new(name=group.name)
-                for p in polygons:
-                    for vert, loop in zip(p.vertices, p.loop_indices):
-                        try:
-                            ob.vertex_groups[index].add([loop], group.weight(vert), 'REPLACE')
-                        except:
-                            pass
+            weights, members = get_weights_numpy(ob0, return_members=True)
+            set_weights_numpy(ob, range(len(weights)), weights[:,verts_source],
+                members[:,verts_source])
 
         ob0.select_set(False)
-        if self.auto_scale:
-            scaleFactor = math.pow(area / new_area, 1 / 2)
-            ob.scale = Vector((scaleFactor, scaleFactor, scaleFactor))
-
-        bpy.ops.object.mode_set(mode='EDIT', toggle=False)
-        bpy.ops.mesh.remove_doubles(threshold=1e-06)
-        bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
-        bpy.ops.object.transform_apply(location=False, rotation=False, scale=True)
-
-        # MATERIALS
-        if self.materials:
-            if len(ob0.material_slots) > 0:
-                # assign old material
-                uv_materials = [slot.material for slot in ob0.material_slots]
-                for i in range(len(uv_materials)):
-                    bpy.ops.object.material_slot_add()
-                    bpy.context.object.material_slots[i].material = uv_materials[i]
-
         bpy.data.objects.remove(ob0)
         bpy.data.meshes.remove(me0)
         return {'FINISHED'}
+
+def weld_uv_corners(loops_vert, uvs, tolerance=1e-6):
+    '''
+    Group the corners of the same vertex with UV coordinates closer than the
+    tolerance, splitting them first along U and then along V. Unlike rounded
+    keys, close values on the two sides of a rounding step are merged.
+    Returns the first corner of each group and the group of each corner,
+    with groups sorted by their first corner.
+    '''
+    n_loops = len(loops_vert)
+    groups = loops_vert
+    split = np.ones(n_loops, dtype='bool')
+    for axis in range(2):
+        order = np.lexsort((uvs[:,axis], groups))
+        split[1:] = (np.diff(groups[order]) != 0) | (np.diff(uvs[order,axis]) > tolerance)
+        groups = np.zeros(n_loops, dtype='int')
+        groups[order] = np.cumsum(split) - 1
+    n_groups = np.max(groups) + 1 if n_loops > 0 else 0
+    first = np.full(n_groups, n_loops)
+    np.minimum.at(first, groups, np.arange(n_loops))
+    order = np.argsort(first)
+    rank = np.zeros(n_groups, dtype='int')
+    rank[order] = np.arange(n_groups)
+    return first[order], rank[groups]
@@ -871,9 +871,7 @@ def reaction_diffusion_def(ob, bake=False):
             vg_b = ob.vertex_groups.new(name='B')
         if ob.mode == 'WEIGHT_PAINT':
             # slower, but prevent crashes
-            for i in range(n_verts):
-                if vg_a: vg_a.add([i], a[i], 'REPLACE')
-                if vg_b: vg_b.add([i], b[i], 'REPLACE')
+            set_weights_numpy(ob, (vg_a.index, vg_b.index), (a, b))
         else:
             if use_modifiers or props.bool_cache:
                 #bm.free()               # release old bmesh
@@ -3,6 +3,8 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import bpy, bmesh, os
+import ast
+from collections import OrderedDict
 import numpy as np
 import math, timeit, time
 from math import pi
@@ -38,68 +40,96 @@ class formula_prop(PropertyGroup):
     float_var : FloatVectorProperty(name="", description="", default=(0, 0, 0, 0, 0), size=5)
     int_var : IntVectorProperty(name="", description="", default=(0, 0, 0, 0, 0), size=5)
 
-from numpy import *
-def compute_formula(ob=None, formula="rx", float_var=(0,0,0,0,0), int_var=(0,0,0,0,0)):
-    verts = ob.data.vertices
-    n_verts = len(verts)
+formula_variables = ('lx', 'ly', 'lz', 'gx', 'gy', 'gz', 'rx', 'ry', 'rz', 'nx', 'ny', 'nz',
+    'f1', 'f2', 'f3', 'f4', 'f5', 'i1', 'i2', 'i3', 'i4', 'i5')
+formula_functions = {name : getattr(np, name) for name in dir(np) if isinstance(getattr(np, name), np.ufunc)}
+formula_functions.update({name : getattr(np, name) for name in ('where', 'clip', 'interp',
+    'sum', 'mean', 'min', 'max', 'round', 'pi', 'e', 'inf', 'nan')})
+formula_nodes = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare,
+    ast.IfExp, ast.Call, ast.keyword, ast.Name, ast.Load, ast.Constant, ast.Subscript,
+    ast.Tuple, ast.List, ast.operator, ast.unaryop, ast.cmpop, ast.boolop)
+# least recently used formulas, the oldest are discarded
+formula_cache = OrderedDict()
+formula_cache_size = 32
+
+def compile_formula(formula):
+    '''
+    Parse a Weight Formula, allowing only the known variables and the NumPy
+    functions. The compiled expression is cached for the next evaluations,
+    keeping only the last formula_cache_size formulas.
+    :arg formula: Formula to compile.
+    :type formula: str
+    :return: Compiled expression, referenced variables and Vertex Groups.
+    :rtype: tuple
+    '''
+    if formula in formula_cache:
+        formula_cache.move_to_end(formula)
+        return formula_cache[formula]
+    tree = ast.parse(formula.strip(), mode='eval')
+    variables = set()
+    groups = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, formula_nodes):
+            raise ValueError("{} is not allowed".format(type(node).__name__))
+        if isinstance(node, ast.Subscript):
+            if not (isinstance(node.value, ast.Name) and node.value.id == 'w' and
+                    isinstance(node.slice, ast.Constant) and type(node.slice.value) == int):
+                raise ValueError("Vertex Groups must be used as w[index]")
+            groups.add(node.slice.value)
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name):
+                raise ValueError("Only NumPy functions are allowed")
+        elif isinstance(node, ast.Name):
+            if node.id in formula_variables:
+                variables.add(node.id)
+            elif node.id != 'w' and node.id not in formula_functions:
+                raise ValueError("'{}' not recognized".format(node.id))
+    code = compile(tree, '<formula>', 'eval')
+    formula_cache[formula] = (code, variables, groups)
+    if len(formula_cache) > formula_cache_size:
+        formula_cache.popitem(last=False)
+    return formula_cache[formula]
 
-    f1,f2,f3,f4,f5 = float_var
-    i1,i2,i3,i4,i5 = int_var
-
-    do_groups = "w[" in formula
-    do_local = "lx" in formula or "ly" in formula or "lz" in formula
-    do_global = "gx" in formula or "gy" in formula or "gz" in formula
-    do_relative = "rx" in formula or "ry" in formula or "rz" in formula
-    do_normal = "nx" in formula or "ny" in formula or "nz" in formula
-    mat = ob.matrix_world
+def compute_formula(ob=None, formula="rx", float_var=(0,0,0,0,0), int_var=(0,0,0,0,0)):
+    try:
+        code, variables, groups = compile_formula(formula)
+    except SyntaxError:
+        return "There is something wrong"
+    except ValueError as e:
+        return str(e)
 
-    for i in range(1000):
-        if "w["+str(i)+"]" in formula and i > len(ob.vertex_groups)-1:
+    me = ob.data
+    n_verts = len(me.vertices)
+    for i in groups:
+        if i > len(ob.vertex_groups)-1:
             return "w["+str(i)+"] not found"
 
-    w = []
-    for i in range(len(ob.vertex_groups)):
-        w.append([])
-        if "w["+str(i)+"]" in formula:
-            vg = ob.vertex_groups[i]
-            for v in verts:
-                try:
-                    w[i].append(vg.weight(v.index))
-                except:
-                    w[i].append(0)
-            w[i] = array(w[i])
-
-    start_time = timeit.default_timer()
-    # compute vertex coordinates
-    if do_local or do_relative or do_global:
-        co = [0]*n_verts*3
-        verts.foreach_get('co', co)
-        np_co = array(co).reshape((n_verts, 3))
-        lx, ly, lz = array(np_co).transpose()
-        if do_relative:
-            rx = np.interp(lx, (lx.min(), lx.max()), (0, +1))
-            ry = np.interp(ly, (ly.min(), ly.max()), (0, +1))
-            rz = np.interp(lz, (lz.min(), lz.max()), (0, +1))
-        if do_global:
-            co = [v.co for v in verts]
-            global_co = []
-            for v in co:
-                global_co.append(mat @ v)
-            global_co = array(global_co).reshape((n_verts, 3))
-            gx, gy, gz = array(global_co).transpose()
-    # compute vertex normals
-    if do_normal:
-        normal = [0]*n_verts*3
-        verts.foreach_get('normal', normal)
-        normal = array(normal).reshape((n_verts, 3))
-        nx, ny, nz = array(normal).transpose()
+    # read only the values used by the formula
+    values = dict(formula_functions)
+    values['__builtins__'] = {}
+    values.update(zip(('f1','f2','f3','f4','f5'), float_var))
+    values.update(zip(('i1','i2','i3','i4','i5'), int_var))
+    groups = sorted(groups)
+    values['w'] = dict(zip(groups, get_weights_numpy(ob, groups))) if groups else {}
+    if variables.intersection(('lx','ly','lz','rx','ry','rz','gx','gy','gz')):
+        co = get_vertices_numpy(me)
+        values['lx'], values['ly'], values['lz'] = co.T
+        for var, val in zip(('rx','ry','rz'), co.T):
+            if var in variables:
+                values[var] = np.interp(val, (val.min(), val.max()), (0, +1))
+        if variables.intersection(('gx','gy','gz')):
+            mat = np.array(ob.matrix_world)
+            global_co = co @ mat[:3,:3].T + mat[:3,3]
+            values['gx'], values['gy'], values['gz'] = global_co.T
+    if variables.intersection(('nx','ny','nz')):
+        normals = [0]*n_verts*3
+        me.vertices.foreach_get('normal', normals)
+        values['nx'], values['ny'], values['nz'] = np.array(normals).reshape((n_verts, 3)).T
 
     try:
-        weight = eval(formula)
-        return weight
+        return eval(code, values)
     except:
         return "There is something wrong"
-    print("Weight Formula: " + str(timeit.default_timer() - start_time))
 
 class weight_formula_wiki(Operator):
     bl_idname = "scene.weight_formula_wiki"
@@ -219,7 +249,6 @@ class weight_formula(Operator):
 
     def execute(self, context):
         ob = context.active_object
-        n_verts = len(ob.data.vertices)
         #if self.examples == 'CUSTOM':
         #    formula = self.formula
         #else:
@@ -255,14 +284,8 @@ class weight_formula(Operator):
             return {'CANCELLED'}
 
         #start_time = timeit.default_timer()
-        weight = nan_to_num(weight)
         vg = ob.vertex_groups[-1]
-        if type(weight) == int or type(weight) == float:
-            for i in range(n_verts):
-                vg.add([i], weight, 'REPLACE')
-        elif type(weight) == ndarray:
-            for i in range(n_verts):
-                vg.add([i], weight[i], 'REPLACE')
+        set_weight_numpy(vg, weight)
         ob.data.update()
         bpy.ops.object.mode_set(mode='WEIGHT_PAINT')
 
@@ -290,7 +313,6 @@ class update_weight_formula(Operator):
 
     def execute(self, context):
         ob = context.active_object
-        n_verts = len(ob.data.vertices)
 
         vg = ob.vertex_groups.active
         formula = vg.name
@@ -300,13 +322,7 @@ class update_weight_formula(Operator):
             return {'CANCELLED'}
 
         #start_time = timeit.default_timer()
-        weight = nan_to_num(weight)
-        if type(weight) == int or type(weight) == float:
-            for i in range(n_verts):
-                vg.add([i], weight, 'REPLACE')
-        elif type(weight) == ndarray:
-            for i in range(n_verts):
-                vg.add([i], weight[i], 'REPLACE')
+        set_weight_numpy(vg, weight)
         ob.data.update()
         bpy.ops.object.mode_set(mode='WEIGHT_PAINT')
         return {'FINISHED'}
@@ -377,12 +393,7 @@ class _weight_laplacian(Operator):
         bm.edges.ensure_lookup_table()
 
         # store weight values
-        weight = []
-        for v in me.vertices:
-            try:
-                weight.append(ob.vertex_groups[input_group].weight(v.index))
-            except:
-                weight.append(0)
+        weight = get_weight_numpy(ob.vertex_groups[input_group], len(me.vertices))
 
         n_verts = len(bm.verts)
         lap = [0]*n_verts
@@ -426,11 +437,7 @@ class _weight_laplacian(Operator):
         # check undeformed errors
         if delta_def == 0: delta_def = 0.0001
 
-        for i in range(len(lap)):
-            val = (lap[i]-min_def)/delta_def
-            #if val > 0.7: print(str(val) + " " + str(lap[i]))
-            #val = weight[i] + 0.2*lap[i]
-            ob.vertex_groups[-1].add([i], val, 'REPLACE')
+        set_weight_numpy(ob.vertex_groups[-1], (np.array(lap)-min_def)/delta_def)
         self.bounds_string = str(round(min_def,2)) + " to " + str(round(max_def,2))
         ob.vertex_groups[-1].name = group_name + " " + self.bounds_string
         ob.vertex_groups.update()
@@ -472,14 +479,7 @@ class ok_weight_laplacian(Operator):
         ob.vertex_groups.new(name=group_name)
 
         # store weight values
-        a = []
-        for v in me.vertices:
-            try:
-                a.append(ob.vertex_groups[input_group].weight(v.index))
-            except:
-                a.append(0)
-
-        a = array(a)
+        a = get_weight_numpy(ob.vertex_groups[input_group], len(me.vertices))
 
 
         # initialize
@@ -525,8 +525,7 @@ class ok_weight_laplacian(Operator):
         lap /= n_records
         lap /= max(lap)
 
-        for i in range(n_verts):
-            ob.vertex_groups['Laplacian'].add([i], lap[i], 'REPLACE')
+        set_weight_numpy(ob.vertex_groups['Laplacian'], lap)
         ob.vertex_groups.update()
         ob.data.update()
         bpy.ops.object.mode_set(mode='WEIGHT_PAINT')
@@ -555,59 +554,158 @@ class weight_laplacian(Operator):
             return {'CANCELLED'}
 
         me = ob.data
-        bm = bmesh.new()
-        bm.from_mesh(me)
-        bm.edges.ensure_lookup_table()
         n_verts = len(me.vertices)
 
         group_id = ob.vertex_groups.active_index
-        input_group = ob.vertex_groups[group_id].name
-
-        group_name = "Laplacian"
-        vg = ob.vertex_groups.new(name=group_name)
 
         # store weight values
-        dvert_lay = bm.verts.layers.deform.active
-        weight = bmesh_get_weight_numpy(group_id, dvert_lay, bm.verts)
-
-        #verts, normals = get_vertices_and_normals_numpy(me)
+        weight = get_weight_numpy(ob.vertex_groups[group_id], n_verts)
 
-        #lap = zeros((n_verts))#[0]*n_verts
-        lap = [Vector((0,0,0)) for i in range(n_verts)]
-        n_records = zeros((n_verts))
-        for e in bm.edges:
-            vert0 = e.verts[0]
-            vert1 = e.verts[1]
-            id0 = vert0.index
-            id1 = vert1.index
-            v0 = vert0.co
-            v1 = vert1.co
-            v01 = v1-v0
-            v10 = -v01
-            v01 -= v01.project(vert0.normal)
-            v10 -= v10.project(vert1.normal)
-            length = e.calc_length()
-            if length == 0: continue
-            dw = (weight[id1] - weight[id0])/length
-            lap[id0] += v01.normalized() * dw
-            lap[id1] -= v10.normalized() * dw
-            n_records[id0]+=1
-            n_records[id1]+=1
-        #lap /= n_records[:,np.newaxis]
-        lap = [l.length/r for r,l in zip(n_records,lap)]
+        group_name = "Laplacian"
+        vg = ob.vertex_groups.new(name=group_name)
 
-        lap = np.array(lap)
+        verts, normals = get_vertices_and_normals_numpy(me)
+        edges = get_edges_numpy(me)
+        id0 = edges[:,0]
+        id1 = edges[:,1]
+        v01 = verts[id1] - verts[id0]
+        length = np.linalg.norm(v01, axis=1)
+        mask = length > 0
+        id0 = id0[mask]
+        id1 = id1[mask]
+        v01 = v01[mask]
+        length = length[mask]
+        # edge directions projected on the tangent plane of each vertex
+        n0 = normals[id0]
+        n1 = normals[id1]
+        v10 = -v01
+        v01 = v01 - n0*(np.einsum('ij,ij->i', v01, n0)/np.maximum(np.einsum('ij,ij->i', n0, n0), 1e-16))[:,None]
+        v10 = v10 - n1*(np.einsum('ij,ij->i', v10, n1)/np.maximum(np.einsum('ij,ij->i', n1, n1), 1e-16))[:,None]
+        v01 /= np.maximum(np.linalg.norm(v01, axis=1), 1e-16)[:,None]
+        v10 /= np.maximum(np.linalg.norm(v10, axis=1), 1e-16)[:,None]
+        dw = ((weight[id1] - weight[id0])/length)[:,None]
+        lap = np.zeros((n_verts,3))
+        for i in range(3):
+            lap[:,i] = np.bincount(id0, weights=v01[:,i]*dw[:,0], minlength=n_verts)
+            lap[:,i] -= np.bincount(id1, weights=v10[:,i]*dw[:,0], minlength=n_verts)
+        n_records = np.bincount(np.concatenate((id0, id1)), minlength=n_verts)
+        lap = np.linalg.norm(lap, axis=1)/np.maximum(n_records, 1)
         lap /= np.max(lap)
-        lap = list(lap)
 
-        for i in range(n_verts):
-            vg.add([i], lap[i], 'REPLACE')
+        set_weight_numpy(vg, lap)
         ob.vertex_groups.update()
         ob.data.update()
         bpy.ops.object.mode_set(mode='WEIGHT_PAINT')
-        bm.free()
         return {'FINISHED'}
 
+def edges_deformation_add_handler(self, context):
+    # remove existing handlers
+    edges_deformation_remove_handler(self, context)
+    # add new handler
+    bpy.app.handlers.frame_change_post.append(edges_deformation_scene)
+
+def edges_deformation_remove_handler(self, context):
+    # remove existing handlers
+    old_handlers = []
+    for h in bpy.app.handlers.frame_change_post:
+        if "edges_deformation" in str(h):
+            old_handlers.append(h)
+    for h in old_handlers: bpy.app.handlers.frame_change_post.remove(h)
+
+class edges_deformation_prop(PropertyGroup):
+    run : BoolProperty(
+        name="Animate", default=False,
+        description="Update the Vertex Group at every frame (Cloth and Soft Body caches must be baked)")
+    vertex_group : StringProperty(
+        name="Vertex Group", default="",
+        description="Vertex Group storing the deformation")
+    mode : StringProperty(default='MEAN')
+    bounds : StringProperty(default='AUTOMATIC')
+    min_def : FloatProperty(default=0)
+    max_def : FloatProperty(default=0.5)
+
+def compute_edges_deformation(ob, mode='MEAN', depsgraph=None):
+    """
+    Strain rate of the edges of the evaluated Object, compared to its
+    undeformed mesh, reduced to the vertices.
+    :arg ob: Mesh Object.
+    :type ob: :class:'bpy.types.Object'
+    :arg mode: 'MEAN' (average deformation) or 'MAX' (deformation with the
+        largest magnitude).
+    :type mode: str
+    :arg depsgraph: Evaluated Depsgraph (optional).
+    :type depsgraph: :class:'bpy.types.Depsgraph'
+    :return: Deformation of each vertex, None if the topology is altered.
+    :rtype: :class:'numpy.ndarray'
+    """
+    me0 = ob.data
+    n_verts = len(me0.vertices)
+    edges = get_edges_numpy(me0)
+    verts0 = get_vertices_numpy(me0)
+    if depsgraph == None:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+    ob_eval = ob.evaluated_get(depsgraph)
+    me = ob_eval.to_mesh()
+    if len(me.vertices) != n_verts or len(me.edges) != len(edges):
+        ob_eval.to_mesh_clear()
+        return None
+    verts1 = get_vertices_numpy(me)
+    ob_eval.to_mesh_clear()
+
+    l0 = np.linalg.norm(verts0[edges[:,1]] - verts0[edges[:,0]], axis=1)
+    l1 = np.linalg.norm(verts1[edges[:,1]] - verts1[edges[:,0]], axis=1)
+    deformations = np.ones(len(edges))
+    mask = l0 > 0
+    deformations[mask] = (l1[mask] - l0[mask])/l0[mask]
+
+    edges = edges.reshape((-1))
+    deformations = np.repeat(deformations, 2)
+    if mode == 'MAX':
+        # signed deformation with the largest magnitude
+        max_def = np.zeros(n_verts)
+        np.maximum.at(max_def, edges, np.abs(deformations))
+        v_deformations = np.zeros(n_verts)
+        mask = np.abs(deformations) == max_def[edges]
+        v_deformations[edges[mask]] = deformations[mask]
+    else:
+        n_edges = np.bincount(edges, minlength=n_verts)
+        v_deformations = np.bincount(edges, weights=deformations, minlength=n_verts)
+        v_deformations /= np.maximum(n_edges, 1)
+    return v_deformations
+
+def edges_deformation_bounds(v_deformations, bounds, min_def, max_def):
+    if bounds == 'AUTOMATIC':
+        min_def = np.min(v_deformations)
+        max_def = np.max(v_deformations)
+    elif bounds == 'COMPRESSION':
+        min_def = 0
+        max_def = np.min(v_deformations)
+    elif bounds == 'TENSION':
+        min_def = 0
+        max_def = np.max(v_deformations)
+    return min_def, max_def
+
+def edges_deformation_def(ob, depsgraph=None):
+    props = ob.edges_deformation_settings
+    if props.vertex_group not in ob.vertex_groups.keys(): return
+    # editing the Vertex Groups resets the unbaked simulations of the object
+    for m in ob.modifiers:
+        if m.type in ('CLOTH', 'SOFT_BODY') and not m.point_cache.is_baked: return
+    v_deformations = compute_edges_deformation(ob, props.mode, depsgraph)
+    if v_deformations is None: return
+    min_def, max_def = edges_deformation_bounds(v_deformations, props.bounds,
+        props.min_def, props.max_def)
+    delta_def = max_def - min_def
+    if delta_def == 0: delta_def = 0.0001
+    # only the Vertex Group is written, without rebuilding the mesh
+    add_weight_numpy(ob.vertex_groups[props.vertex_group], (v_deformations - min_def)/delta_def,
+        decimals=3)
+
+def edges_deformation_scene(scene, depsgraph=None):
+    for ob in scene.objects:
+        if ob.type == 'MESH' and ob.edges_deformation_settings.run:
+            edges_deformation_def(ob, depsgraph)
+
 class edges_deformation(Operator):
     bl_idname = "object.edges_deformation"
     bl_label = "Edges Deformation"
@@ -635,6 +733,10 @@ class edges_deformation(Operator):
         name="Max", default=0.5, soft_min=0, soft_max=5,
         description="Deformations with 1 weight")
 
+    bool_run : BoolProperty(
+        name="Animate", default=False,
+        description="Update the Vertex Group at every frame, for example following a baked Cloth or Soft Body cache")
+
     bounds_string = ""
 
     frame = None
@@ -655,6 +757,8 @@ class edges_deformation(Operator):
             col.prop(self, "min_def")
             col.prop(self, "max_def")
         col.label(text="\u03B5" + ": from " + self.bounds_string)
+        col.separator()
+        col.prop(self, "bool_run")
 
     def execute(self, context):
         try: ob = context.object
@@ -675,53 +779,17 @@ class edges_deformation(Operator):
         if self.mode == 'MEAN': group_name = "Average Deformation"
         elif self.mode == 'MAX': group_name = "Max Deformation"
         ob.vertex_groups.new(name=group_name)
-        me0 = ob.data
 
-        me = simple_to_mesh(ob) #ob.to_mesh(preserve_all_data_layers=True, depsgraph=bpy.context.evaluated_depsgraph_get()).copy()
-        if len(me.vertices) != len(me0.vertices) or len(me.edges) != len(me0.edges):
+        v_deformations = compute_edges_deformation(ob, self.mode)
+        if v_deformations is None:
             self.report({'ERROR'}, "The topology of the object should be" +
                 "unaltered")
             return {'CANCELLED'}
 
-        bm0 = bmesh.new()
-        bm0.from_mesh(me0)
-        bm = bmesh.new()
-        bm.from_mesh(me)
-        deformations = []
-        for e0, e in zip(bm0.edges, bm.edges):
-            try:
-                l0 = e0.calc_length()
-                l1 = e.calc_length()
-                epsilon = (l1 - l0)/l0
-                deformations.append(epsilon)
-            except: deformations.append(1)
-        v_deformations = []
-        for v in bm.verts:
-            vdef = []
-            for e in v.link_edges:
-                vdef.append(deformations[e.index])
-            if self.mode == 'MEAN': v_deformations.append(mean(vdef))
-            elif self.mode == 'MAX': v_deformations.append(max(vdef, key=abs))
-            #elif self.mode == 'MIN': v_deformations.append(min(vdef, key=abs))
-
-        if self.bounds == 'MANUAL':
-            min_def = self.min_def
-            max_def = self.max_def
-        elif self.bounds == 'AUTOMATIC':
-            min_def = min(v_deformations)
-            max_def = max(v_deformations)
-            self.min_def = min_def
-            self.max_def = max_def
-        elif self.bounds == 'COMPRESSION':
-            min_def = 0
-            max_def = min(v_deformations)
-            self.min_def = min_def
-            self.max_def = max_def
-        elif self.bounds == 'TENSION':
-            min_def = 0
-            max_def = max(v_deformations)
-            self.min_def = min_def
-            self.max_def = max_def
+        min_def, max_def = edges_deformation_bounds(v_deformations, self.bounds,
+            self.min_def, self.max_def)
+        self.min_def = min_def
+        self.max_def = max_def
         delta_def = max_def - min_def
 
         # check undeformed errors
@@ -739,17 +807,24 @@ class edges_deformation(Operator):
             if physics:
                 self.frame = context.scene.frame_current
 
-        for i in range(len(v_deformations)):
-            weight = (v_deformations[i] - min_def)/delta_def
-            ob.vertex_groups[-1].add([i], weight, 'REPLACE')
+        set_weight_numpy(ob.vertex_groups[-1], (v_deformations - min_def)/delta_def)
         self.bounds_string = str(round(min_def,2)) + " to " + str(round(max_def,2))
         ob.vertex_groups[-1].name = group_name + " " + self.bounds_string
         ob.vertex_groups.update()
         ob.data.update()
+
+        # store settings for the animation
+        props = ob.edges_deformation_settings
+        props.vertex_group = ob.vertex_groups[-1].name
+        props.mode = self.mode
+        props.bounds = self.bounds
+        props.min_def = min_def
+        props.max_def = max_def
+        props.run = self.bool_run
+        if self.bool_run:
+            edges_deformation_add_handler(self, context)
+
         bpy.ops.object.mode_set(mode='WEIGHT_PAINT')
-        bpy.data.meshes.remove(me)
-        bm.free()
-        bm0.free()
         return {'FINISHED'}
 
 class edges_bending(Operator):
@@ -816,41 +891,32 @@ class edges_bending(Operator):
         if len(me.vertices) != len(me0.vertices) or len(me.edges) != len(me0.edges):
             self.report({'ERROR'}, "The topology of the object should be" +
                 "unaltered")
-        bm0 = bmesh.new()
-        bm0.from_mesh(me0)
-        bm = bmesh.new()
-        bm.from_mesh(me)
-        deformations = []
-        for e0, e in zip(bm0.edges, bm.edges):
-            try:
-                ang = e.calc_face_angle_signed()
-                ang0 = e0.calc_face_angle_signed()
-                if self.bounds == 'UNSIGNED':
-                    deformations.append(abs(ang-ang0))
-                else:
-                    deformations.append(ang-ang0)
-            except: deformations.append(0)
-        v_deformations = []
-        for v in bm.verts:
-            vdef = []
-            for e in v.link_edges:
-                vdef.append(deformations[e.index])
-            v_deformations.append(mean(vdef))
+            bpy.data.meshes.remove(me)
+            return {'CANCELLED'}
+        deformations = get_edges_face_angle_signed_numpy(me) - get_edges_face_angle_signed_numpy(me0)
+        if self.bounds == 'UNSIGNED':
+            deformations = np.abs(deformations)
+        # mean bending of the edges around each vertex
+        edges = get_edges_numpy(me).reshape((-1))
+        n_verts = len(me.vertices)
+        n_edges = np.bincount(edges, minlength=n_verts)
+        v_deformations = np.bincount(edges, weights=np.repeat(deformations, 2), minlength=n_verts)
+        v_deformations /= np.maximum(n_edges, 1)
         if self.bounds == 'MANUAL':
             min_def = radians(self.min_def)
             max_def = radians(self.max_def)
         elif self.bounds == 'AUTOMATIC':
-            min_def = min(v_deformations)
-            max_def = max(v_deformations)
+            min_def = np.min(v_deformations)
+            max_def = np.max(v_deformations)
         elif self.bounds == 'POSITIVE':
             min_def = 0
-            max_def = min(v_deformations)
+            max_def = np.min(v_deformations)
         elif self.bounds == 'NEGATIVE':
             min_def = 0
-            max_def = max(v_deformations)
+            max_def = np.max(v_deformations)
         elif self.bounds == 'UNSIGNED':
             min_def = 0
-            max_def = max(v_deformations)
+            max_def = np.max(v_deformations)
         delta_def = max_def - min_def
 
         # check undeformed errors
@@ -868,17 +934,13 @@ class edges_bending(Operator):
             if physics:
                 self.frame = context.scene.frame_current
 
-        for i in range(len(v_deformations)):
-            weight = (v_deformations[i] - min_def)/delta_def
-            ob.vertex_groups[-1].add([i], weight, 'REPLACE')
+        set_weight_numpy(ob.vertex_groups[-1], (v_deformations - min_def)/delta_def)
         self.bounds_string = str(round(min_def,2)) + " to " + str(round(max_def,2))
         ob.vertex_groups[-1].name = group_name + " " + self.bounds_string
         ob.vertex_groups.update()
         ob.data.update()
         bpy.ops.object.mode_set(mode='WEIGHT_PAINT')
         bpy.data.meshes.remove(me)
-        bm0.free()
-        bm.free()
         return {'FINISHED'}
 
 class weight_contour_displace(Operator):
@@ -940,23 +1002,12 @@ class weight_contour_displace(Operator):
         else:
             me0 = ob0.data.copy()
 
-        # generate new bmesh
-        bm = bmesh.new()
-        bm.from_mesh(me0)
-        bm.verts.ensure_lookup_table()
-        bm.edges.ensure_lookup_table()
-        bm.faces.ensure_lookup_table()
-
         # store weight values
-        weight = []
         ob = bpy.data.objects.new("temp", me0)
         for g in ob0.vertex_groups:
             ob.vertex_groups.new(name=g.name)
-        for v in me0.vertices:
-            try:
-                weight.append(ob.vertex_groups[vertex_group_name].weight(v.index))
-            except:
-                weight.append(0)
+        weights, members = get_weights_numpy(ob, return_members=True)
+        bpy.data.objects.remove(ob)
 
         # define iso values
         iso_values = []
@@ -969,141 +1020,9 @@ class weight_contour_displace(Operator):
             else: iso_val = (self.max_iso + self.min_iso)/2
             iso_values.append(iso_val)
 
-        # Start Cuts Iterations
-        filtered_edges = bm.edges
-        for iso_val in iso_values:
-            delete_edges = []
-
-            faces_mask = []
-            for f in bm.faces:
-                w_min = 2
-                w_max = 2
-                for v in f.verts:
-                    w = weight[v.index]
-                    if w_min == 2:
-                        w_max = w_min = w
-                    if w > w_max: w_max = w
-                    if w < w_min: w_min = w
-                    if w_min < iso_val and w_max > iso_val:
-                        faces_mask.append(f)
-                        break
-
-            #link_faces = [[f for f in e.link_faces] for e in bm.edges]
-
-            #faces_todo = [f.select for f in bm.faces]
-            #faces_todo = [True for f in bm.faces]
-            verts = []
-            edges = []
-            edges_id = {}
-            _filtered_edges = []
-            n_verts = len(bm.verts)
-            count = n_verts
-            for e in filtered_edges:
-                #id0 = e.vertices[0]
-                #id1 = e.vertices[1]
-                id0 = e.verts[0].index
-                id1 = e.verts[1].index
-                w0 = weight[id0]
-                w1 = weight[id1]
-
-                if w0 == w1: continue
-                elif w0 > iso_val and w1 > iso_val:
-                    _filtered_edges.append(e)
-                    continue
-                elif w0 < iso_val and w1 < iso_val: continue
-                elif w0 == iso_val or w1 == iso_val:
-                    _filtered_edges.append(e)
-                    continue
-                else:
-                    v0 = bm.verts[id0].co
-                    v1 = bm.verts[id1].co
-                    v = v0.lerp(v1, (iso_val-w0)/(w1-w0))
-                    if e not in delete_edges:
-                        delete_edges.append(e)
-                    verts.append(v)
-                    edges_id[str(id0)+"_"+str(id1)] = count
-                    edges_id[str(id1)+"_"+str(id0)] = count
-                    count += 1
-                    _filtered_edges.append(e)
-            filtered_edges = _filtered_edges
-            splitted_faces = []
-
-            switch = False
-            # splitting faces
-            for f in faces_mask:
-                # create sub-faces slots. Once a new vertex is reached it will
-                # change slot, storing the next vertices for a new face.
-                build_faces = [[],[]]
-                #switch = False
-                verts0 = [v.index for v in f.verts]
-                verts1 = list(verts0)
-                verts1.append(verts1.pop(0)) # shift list
-                for id0, id1 in zip(verts0, verts1):
-
-                    # add first vertex to active slot
-                    build_faces[switch].append(id0)
-
-                    # try to split edge
-                    try:
-                        # check if the edge must be splitted
-                        new_vert = edges_id[str(id0)+"_"+str(id1)]
-                        # add new vertex
-                        build_faces[switch].append(new_vert)
-                        # if there is an open face on the other slot
-                        if len(build_faces[not switch]) > 0:
-                            # store actual face
-                            splitted_faces.append(build_faces[switch])
-                            # reset actual faces and switch
-                            build_faces[switch] = []
-                            # change face slot
-                        switch = not switch
-                        # continue previous face
-                        build_faces[switch].append(new_vert)
-                    except: pass
-                if len(build_faces[not switch]) == 2:
-                    build_faces[not switch].append(id0)
-                if len(build_faces[not switch]) > 2:
-                    splitted_faces.append(build_faces[not switch])
-                # add last face
-                splitted_faces.append(build_faces[switch])
-                #del_faces.append(f.index)
-
-            # adding new vertices
-            _new_vert = bm.verts.new
-            for v in verts: new_vert = _new_vert(v)
-            bm.verts.index_update()
-            bm.verts.ensure_lookup_table()
-            # adding new faces
-            _new_face = bm.faces.new
-            missed_faces = []
-            added_faces = []
-            for f in splitted_faces:
-                try:
-                    face_verts = [bm.verts[i] for i in f]
-                    new_face = _new_face(face_verts)
-                    for e in new_face.edges:
-                        filtered_edges.append(e)
-                except:
-                    missed_faces.append(f)
-
-            bm.faces.ensure_lookup_table()
-            # updating weight values
-            weight = weight + [iso_val]*len(verts)
-
-            # deleting old edges/faces
-            _remove_edge = bm.edges.remove
-            bm.edges.ensure_lookup_table()
-            for e in delete_edges:
-                _remove_edge(e)
-            _filtered_edges = []
-            for e in filtered_edges:
-                if e not in delete_edges: _filtered_edges.append(e)
-            filtered_edges = _filtered_edges
-
+        # Cut the mesh along all the iso values
         name = ob0.name + '_ContourDisp'
-        me = bpy.data.meshes.new(name)
-        bm.to_mesh(me)
-        bm.free()
+        me, weights, members = contour_slice_mesh(me0, weights, members, group_id, iso_values, name)
         ob = bpy.data.objects.new(name, me)
 
         # Link object to scene and make active
@@ -1118,29 +1037,29 @@ class weight_contour_displace(Operator):
             ob.vertex_groups.new(name=g.name)
         #ob.vertex_groups.new(name=vertex_group_name)
 
-        all_weight = weight + [iso_val]*len(verts)
-        #mult = 1/(1-iso_val)
-        for id in range(len(all_weight)):
-            #if False: w = (all_weight[id]-iso_val)*mult
-            w = all_weight[id]
-            if self.weight_mode == 'Alternate':
-                direction = self.bool_flip
-                for i in range(len(iso_values)-1):
-                    val0, val1 = iso_values[i], iso_values[i+1]
-                    if val0 < w <= val1:
-                        if direction: w1 = (w-val0)/(val1-val0)
-                        else: w1 = (val1-w)/(val1-val0)
-                    direction = not direction
-                if w < iso_values[0]: w1 = not self.bool_flip
-                if w > iso_values[-1]: w1 = not direction
-            elif self.weight_mode == 'Remapped':
-                if w < min_iso: w1 = 0
-                elif w > max_iso: w1 = 1
-                else: w1 = (w - min_iso)/delta_iso
-            else:
-                if self.bool_flip: w1 = 1-w
-                else: w1 = w
-            ob.vertex_groups[vertex_group_name].add([id], w1, 'REPLACE')
+        weight = weights[group_id]
+        iso_values = np.array(iso_values)
+        if self.weight_mode == 'Alternate':
+            # the direction of the gradient changes at every interval
+            direction = np.logical_xor(self.bool_flip, np.arange(len(iso_values))%2 == 1)
+            new_weight = np.zeros(len(weight))
+            if len(iso_values) > 1:
+                i = np.clip(np.searchsorted(iso_values, weight) - 1, 0, len(iso_values)-2)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    w1 = (weight - iso_values[i])/(iso_values[i+1] - iso_values[i])
+                new_weight = np.where(direction[i], w1, 1-w1)
+            new_weight[weight <= iso_values[0]] = not self.bool_flip
+            new_weight[weight > iso_values[-1]] = not direction[-1]
+        elif self.weight_mode == 'Remapped':
+            if delta_iso > 0: new_weight = np.clip((weight - min_iso)/delta_iso, 0, 1)
+            else: new_weight = (weight > max_iso).astype('float')
+        else:
+            if self.bool_flip: new_weight = 1-weight
+            else: new_weight = weight
+        weights[group_id] = new_weight
+        # all the vertices belong to the contour Vertex Group
+        members[group_id] = True
+        set_weights_numpy(ob, range(len(weights)), weights, members)
 
         ob.vertex_groups.active_index = group_id
 
@@ -1215,146 +1134,16 @@ class weight_contour_mask(Operator):
         else:
             me0 = ob0.data.copy()
 
-        # generate new bmesh
-        bm = bmesh.new()
-        bm.from_mesh(me0)
-        bm.verts.ensure_lookup_table()
-        bm.edges.ensure_lookup_table()
-        bm.faces.ensure_lookup_table()
-
         # store weight values
-        weight = []
         ob = bpy.data.objects.new("temp", me0)
         for g in ob0.vertex_groups:
             ob.vertex_groups.new(name=g.name)
-        for v in me0.vertices:
-            try:
-                #weight.append(v.groups[vertex_group_name].weight)
-                weight.append(ob.vertex_groups[vertex_group_name].weight(v.index))
-            except:
-                weight.append(0)
-
-        faces_mask = []
-        for f in bm.faces:
-            w_min = 2
-            w_max = 2
-            for v in f.verts:
-                w = weight[v.index]
-                if w_min == 2:
-                    w_max = w_min = w
-                if w > w_max: w_max = w
-                if w < w_min: w_min = w
-                if w_min < iso_val and w_max > iso_val:
-                    faces_mask.append(f)
-                    break
-
-        filtered_edges = bm.edges# me0.edges
-        faces_todo = [f.select for f in bm.faces]
-        verts = []
-        edges = []
-        delete_edges = []
-        edges_id = {}
-        _filtered_edges = []
-        n_verts = len(bm.verts)
-        count = n_verts
-        for e in filtered_edges:
-            id0 = e.verts[0].index
-            id1 = e.verts[1].index
-            w0 = weight[id0]
-            w1 = weight[id1]
-
-            if w0 == w1: continue
-            elif w0 > iso_val and w1 > iso_val:
-                continue
-            elif w0 < iso_val and w1 < iso_val: continue
-            elif w0 == iso_val or w1 == iso_val: continue
-            else:
-                v0 = me0.vertices[id0].co
-                v1 = me0.vertices[id1].co
-                v = v0.lerp(v1, (iso_val-w0)/(w1-w0))
-                delete_edges.append(e)
-                verts.append(v)
-                edges_id[str(id0)+"_"+str(id1)] = count
-                edges_id[str(id1)+"_"+str(id0)] = count
-                count += 1
-
-        splitted_faces = []
-
-        switch = False
-        # splitting faces
-        for f in faces_mask:
-            # create sub-faces slots. Once a new vertex is reached it will
-            # change slot, storing the next vertices for a new face.
-            build_faces = [[],[]]
-            #switch = False
-            verts0 = list(me0.polygons[f.index].vertices)
-            verts1 = list(verts0)
-            verts1.append(verts1.pop(0)) # shift list
-            for id0, id1 in zip(verts0, verts1):
-
-                # add first vertex to active slot
-                build_faces[switch].append(id0)
-
-                # try to split edge
-                try:
-                    # check if the edge must be splitted
-                    new_vert = edges_id[str(id0)+"_"+str(id1)]
-                    # add new vertex
-                    build_faces[switch].append(new_vert)
-                    # if there is an open face on the other slot
-                    if len(build_faces[not switch]) > 0:
-                        # store actual face
-                        splitted_faces.append(build_faces[switch])
-                        # reset actual faces and switch
-                        build_faces[switch] = []
-                        # change face slot
-                    switch = not switch
-                    # continue previous face
-                    build_faces[switch].append(new_vert)
-                except: pass
-            if len(build_faces[not switch]) == 2:
-                build_faces[not switch].append(id0)
-            if len(build_faces[not switch]) > 2:
-                splitted_faces.append(build_faces[not switch])
-            # add last face
-            splitted_faces.append(build_faces[switch])
-
-        # adding new vertices
-        _new_vert = bm.verts.new
-        for v in verts: _new_vert(v)
-        bm.verts.ensure_lookup_table()
-
-        # deleting old edges/faces
-        _remove_edge = bm.edges.remove
-        bm.edges.ensure_lookup_table()
-        remove_edges = []
-        for e in delete_edges: _remove_edge(e)
-
-        bm.verts.ensure_lookup_table()
-        # adding new faces
-        _new_face = bm.faces.new
-        missed_faces = []
-        for f in splitted_faces:
-            try:
-                face_verts = [bm.verts[i] for i in f]
-                _new_face(face_verts)
-            except:
-                missed_faces.append(f)
-
-        # Mask geometry
-        if(True):
-            _remove_vert = bm.verts.remove
-            all_weight = weight + [iso_val+0.0001]*len(verts)
-            weight = []
-            for w, v in zip(all_weight, bm.verts):
-                if w < iso_val: _remove_vert(v)
-                else: weight.append(w)
-
-        # Create mesh and object
+        weights, members = get_weights_numpy(ob, return_members=True)
+        bpy.data.objects.remove(ob)
+
+        # Cut and mask geometry
         name = ob0.name + '_ContourMask_{:.3f}'.format(iso_val)
-        me = bpy.data.meshes.new(name)
-        bm.to_mesh(me)
-        bm.free()
+        me, weights, members = contour_slice_mesh(me0, weights, members, group_id, [iso_val], name, mask_iso=iso_val)
         ob = bpy.data.objects.new(name, me)
 
         # Link object to scene and make active
@@ -1370,10 +1159,9 @@ class weight_contour_mask(Operator):
 
         if iso_val != 1: mult = 1/(1-iso_val)
         else: mult = 1
-        for id in range(len(weight)):
-            if self.normalize_weight: w = (weight[id]-iso_val)*mult
-            else: w = weight[id]
-            ob.vertex_groups[vertex_group_name].add([id], w, 'REPLACE')
+        if self.normalize_weight: weights[group_id] = (weights[group_id]-iso_val)*mult
+        members[group_id] = True
+        set_weights_numpy(ob, range(len(weights)), weights, members)
         ob.vertex_groups.active_index = group_id
 
         # align new object
@@ -1436,30 +1224,16 @@ class weight_contour_mask_wip(Operator):
         else:
             me0 = ob0.data.copy()
 
-        # generate new bmesh
-        bm = bmesh.new()
-        bm.from_mesh(me0)
-
         # store weight values
-        weight = []
         ob = bpy.data.objects.new("temp", me0)
         for g in ob0.vertex_groups:
             ob.vertex_groups.new(name=g.name)
-        weight = get_weight_numpy(ob.vertex_groups[vertex_group_name], len(me0.vertices))
-
-        me0, bm, weight = contour_bmesh(me0, bm, weight, iso_val)
-
-        # Mask geometry
-        mask = weight >= iso_val
-        weight = weight[mask]
-        mask = np.logical_not(mask)
-        delete_verts = np.array(bm.verts)[mask]
+        weights, members = get_weights_numpy(ob, return_members=True)
+        bpy.data.objects.remove(ob)
 
-        # Create mesh and object
+        # Cut and mask geometry
         name = ob0.name + '_ContourMask_{:.3f}'.format(iso_val)
-        me = bpy.data.meshes.new(name)
-        bm.to_mesh(me)
-        bm.free()
+        me, weights, members = contour_slice_mesh(me0, weights, members, group_id, [iso_val], name, mask_iso=iso_val)
         ob = bpy.data.objects.new(name, me)
 
         # Link object to scene and make active
@@ -1475,10 +1249,9 @@ class weight_contour_mask_wip(Operator):
 
         if iso_val != 1: mult = 1/(1-iso_val)
         else: mult = 1
-        for id in range(len(weight)):
-            if self.normalize_weight: w = (weight[id]-iso_val)*mult
-            else: w = weight[id]
-            ob.vertex_groups[vertex_group_name].add([id], w, 'REPLACE')
+        if self.normalize_weight: weights[group_id] = (weights[group_id]-iso_val)*mult
+        members[group_id] = True
+        set_weights_numpy(ob, range(len(weights)), weights, members)
         ob.vertex_groups.active_index = group_id
 
         # align new object
@@ -1883,26 +1656,26 @@ class face_area_to_vertex_groups(Operator):
             return {'CANCELLED'}
         ob.vertex_groups.new(name="Faces Area")
 
-        areas = [[] for v in ob.data.vertices]
-
-        for p in ob.data.polygons:
-            for v in p.vertices:
-                areas[v].append(p.area)
-
-        for i in range(len(areas)):
-            areas[i] = mean(areas[i])
+        # mean area of the faces around each vertex
+        me = ob.data
+        n_verts = len(me.vertices)
+        faces_area = get_attribute_numpy(me.polygons, 'area')
+        loops_total = get_attribute_numpy(me.polygons, 'loop_total').astype('int')
+        loops_vert = get_attribute_numpy(me.loops, 'vertex_index').astype('int')
+        areas = np.bincount(loops_vert, weights=np.repeat(faces_area, loops_total), minlength=n_verts)
+        areas /= np.maximum(np.bincount(loops_vert, minlength=n_verts), 1)
         if self.bounds == 'MANUAL':
             min_area = self.min_area
             max_area = self.max_area
         elif self.bounds == 'AUTOMATIC':
-            min_area = min(areas)
-            max_area = max(areas)
+            min_area = np.min(areas)
+            max_area = np.max(areas)
         elif self.bounds == 'COMPRESSION':
             min_area = 1
-            max_area = min(areas)
+            max_area = np.min(areas)
         elif self.bounds == 'TENSION':
             min_area = 1
-            max_area = max(areas)
+            max_area = np.max(areas)
         delta_area = max_area - min_area
         if delta_area == 0:
             delta_area = 0.0001
@@ -1911,9 +1684,7 @@ class face_area_to_vertex_groups(Operator):
             else:
                 self.report({'ERROR'}, "The faces have the same areas")
                 #return {'CANCELLED'}
-        for i in range(len(areas)):
-            weight = (areas[i] - min_area)/delta_area
-            ob.vertex_groups[-1].add([i], weight, 'REPLACE')
+        set_weight_numpy(ob.vertex_groups[-1], (areas - min_area)/delta_area)
         ob.vertex_groups.update()
         ob.data.update()
         bpy.ops.object.mode_set(mode='WEIGHT_PAINT')
@@ -1952,8 +1723,7 @@ class random_weight(Operator):
         np.clip(weight, 0, 1, out=weight)
 
         group_id = ob.vertex_groups.active_index
-        for i in range(n_verts):
-            ob.vertex_groups[group_id].add([i], weight[i], 'REPLACE')
+        set_weight_numpy(ob.vertex_groups[group_id], weight)
         ob.vertex_groups.update()
         ob.data.update()
         bpy.ops.object.mode_set(mode='WEIGHT_PAINT')
@@ -1995,11 +1765,9 @@ class harmonic_weight(Operator):
         if len(ob.vertex_groups) > 0:
             group_id = ob.vertex_groups.active_index
             ob.vertex_groups.new(name="Harmonic")
-            for i in range(len(ob.data.vertices)):
-                try: val = ob.vertex_groups[group_id].weight(i)
-                except: val = 0
-                weight = self.amp*(math.sin(val*self.freq) - self.midlevel)/2 + 0.5 + self.add*val*(1-(1-val)*self.mult)
-                ob.vertex_groups[-1].add([i], weight, 'REPLACE')
+            val = get_weight_numpy(ob.vertex_groups[group_id], len(ob.data.vertices))
+            weight = self.amp*(np.sin(val*self.freq) - self.midlevel)/2 + 0.5 + self.add*val*(1-(1-val)*self.mult)
+            set_weight_numpy(ob.vertex_groups[-1], weight)
             ob.data.update()
         else:
             self.report({'ERROR'}, "Active object doesn't have vertex groups")
@@ -2017,6 +1785,8 @@ class tissue_weight_distance(Operator):
 
     mode : EnumProperty(
         items=(('GEOD', "Geodesic Distance", ""),
+            ('SURF', "Surface Distance", "Geodesic distance computed with the Fast Marching Method. More accurate, but slower"),
+            ('HEAT', "Heat Distance", "Geodesic distance computed with the Heat Method. Smooth, and fast for repeated updates"),
             ('EUCL', "Euclidean Distance", ""),
             ('TOPO', "Topology Distance", "")),
         default='GEOD', name="Distance Method")
@@ -2036,22 +1806,6 @@ class tissue_weight_distance(Operator):
     def invoke(self, context, event):
         return context.window_manager.invoke_props_dialog(self, width=250)
 
-    def fill_neighbors(self,verts,weight):
-        neigh = {}
-        for v0 in verts:
-            for f in v0.link_faces:
-                for v1 in f.verts:
-                    if self.mode == 'GEOD':
-                        dist = weight[v0.index] + (v0.co-v1.co).length
-                    elif self.mode == 'TOPO':
-                        dist = weight[v0.index] + 1.0
-                    w1 = weight[v1.index]
-                    if w1 == None or w1 > dist:
-                        weight[v1.index] = dist
-                        neigh[v1] = 0
-        if len(neigh) == 0: return weight
-        else: return self.fill_neighbors(neigh.keys(), weight)
-
     def execute(self, context):
         ob = context.object
         old_mode = ob.mode
@@ -2064,20 +1818,15 @@ class tissue_weight_distance(Operator):
         weight = [None]*len(me.vertices)
 
         if self.mode != 'EUCL':
-            bm = bmesh.new()
-            bm.from_mesh(me)
-            bm.verts.ensure_lookup_table()
-            bm.edges.ensure_lookup_table()
-            bm.faces.ensure_lookup_table()
-            selected = [v for v in bm.verts if v.select]
+            selected = np.flatnonzero(get_attribute_numpy(me.vertices, 'select'))
             if len(selected) == 0:
                 bpy.ops.object.mode_set(mode=old_mode)
                 message = "Please, select one or more vertices"
                 self.report({'ERROR'}, message)
                 return {'CANCELLED'}
-            for v in selected: weight[v.index] = 0
-            weight = self.fill_neighbors(selected, weight)
-            bm.free()
+            modes = {'GEOD': 'GEODESIC', 'TOPO': 'TOPOLOGY', 'SURF': 'SURFACE', 'HEAT': 'HEAT'}
+            weight = geodesic_distance(me, selected, modes[self.mode])
+            weight[weight == inf] = 0
         else:
             selected = [v for v in me.vertices if v.select]
             kd = KDTree(len(selected))
@@ -2105,8 +1854,7 @@ class tissue_weight_distance(Operator):
             vg = ob.vertex_groups.new(name='Distance: {:d}'.format(int(max_dist)))
         else:
             vg = ob.vertex_groups.new(name='Distance: {:.4f}'.format(max_dist))
-        for i, w in enumerate(weight):
-            vg.add([i], w, 'REPLACE')
+        set_weight_numpy(vg, weight)
         bpy.ops.object.mode_set(mode='WEIGHT_PAINT')
         return {'FINISHED'}
 
@@ -2187,119 +1935,126 @@ class TISSUE_PT_weight(Panel):
         col.operator("object.vertex_group_to_uv", icon="UV",
             text="Convert to UV")
 
-def contour_bmesh(me, bm, weight, iso_val):
-    bm.verts.ensure_lookup_table()
-    bm.edges.ensure_lookup_table()
-    bm.faces.ensure_lookup_table()
-
-    vertices = get_vertices_numpy(me)
-    faces_mask = np.array(bm.faces)
-    filtered_edges = get_edges_id_numpy(me)
-    n_verts = len(bm.verts)
-
-    #############################
-
-    # vertices indexes
-    id0 = filtered_edges[:,0]
-    id1 = filtered_edges[:,1]
-    # vertices weight
-    w0 = weight[id0]
-    w1 = weight[id1]
-    # weight condition
-    bool_w0 = w0 < iso_val
-    bool_w1 = w1 < iso_val
-
-    # mask all edges that have one weight value below the iso value
-    mask_new_verts = np.logical_xor(bool_w0, bool_w1)
-    if not mask_new_verts.any(): return np.array([[None]]), {}, np.array([[None]])
-
-    id0 = id0[mask_new_verts]
-    id1 = id1[mask_new_verts]
-    # filter arrays
-    v0 = vertices[id0]
-    v1 = vertices[id1]
-    w0 = w0[mask_new_verts]
-    w1 = w1[mask_new_verts]
-    param = (iso_val-w0)/(w1-w0)
-    param = np.expand_dims(param,axis=1)
-    verts = v0 + (v1-v0)*param
-
-    edges_id = {}
-    for i, e in enumerate(filtered_edges):
-        #edges_id[id] = i + n_verts
-        edges_id['{}_{}'.format(e[0],e[1])] = i + n_verts
-        edges_id['{}_{}'.format(e[1],e[0])] = i + n_verts
-
-    splitted_faces = []
-
-    switch = False
-    # splitting faces
-    for f in faces_mask:
-        # create sub-faces slots. Once a new vertex is reached it will
-        # change slot, storing the next vertices for a new face.
-        build_faces = [[],[]]
-        #switch = False
-        verts0 = list(me.polygons[f.index].vertices)
-        verts1 = list(verts0)
-        verts1.append(verts1.pop(0)) # shift list
-        for id0, id1 in zip(verts0, verts1):
-
-            # add first vertex to active slot
-            build_faces[switch].append(id0)
-
-            # try to split edge
-            try:
-                # check if the edge must be splitted
-                new_vert = edges_id['{}_{}'.format(id0,id1)]
-                # add new vertex
-                build_faces[switch].append(new_vert)
-                # if there is an open face on the other slot
-                if len(build_faces[not switch]) > 0:
-                    # store actual face
-                    splitted_faces.append(build_faces[switch])
-                    # reset actual faces and switch
-                    build_faces[switch] = []
-                    # change face slot
-                switch = not switch
-                # continue previous face
-                build_faces[switch].append(new_vert)
-            except: pass
-        if len(build_faces[not switch]) == 2:
-            build_faces[not switch].append(id0)
-        if len(build_faces[not switch]) > 2:
-            splitted_faces.append(build_faces[not switch])
-        # add last face
-        splitted_faces.append(build_faces[switch])
-
-    # adding new vertices use fast local method access
-    _new_vert = bm.verts.new
-    for v in verts: _new_vert(v)
-    bm.verts.ensure_lookup_table()
-
-    # deleting old edges/faces
-    bm.edges.ensure_lookup_table()
-    remove_edges = [bm.edges[i] for i in filtered_edges[:,2]]
-    #for e in remove_edges: bm.edges.remove(e)
-    #for e in delete_edges: bm.edges.remove(e)
-
-    bm.verts.ensure_lookup_table()
-    # adding new faces use fast local method access
-    _new_face = bm.faces.new
-    missed_faces = []
-    for f in splitted_faces:
-        try:
-            face_verts = [bm.verts[i] for i in f]
-            _new_face(face_verts)
-        except:
-            missed_faces.append(f)
-
-    #me = bpy.data.meshes.new('_tissue_tmp_')
-    bm.to_mesh(me)
-    weight = np.concatenate((weight, np.ones(len(verts))*iso_val))
-
-    return me, bm, weight
-
-
+def contour_slice_mesh(me0, weights, members, group_id, iso_values, name, mask_iso=None):
+    """
+    Create a new mesh splitting the polygons of a given mesh along the
+    contours of a Vertex Group. UVs, Vertex Groups and the point and corner
+    attributes are interpolated on the new elements, while materials, face
+    and edge attributes (seams and sharp edges included) are copied from the
+    source elements. The new vertices belong to the Vertex Groups of the
+    vertices of their edge. Loose edges are kept.
+    :arg me0: Mesh data.
+    :type me0: :class:'bpy.types.Mesh'
+    :arg weights: Weight values of all the Vertex Groups (n_groups, n_verts).
+    :type weights: :class:'numpy.ndarray'
+    :arg members: Membership of the vertices to the Vertex Groups (n_groups, n_verts).
+    :type members: :class:'numpy.ndarray'
+    :arg group_id: Index of the Vertex Group used for the contours.
+    :type group_id: int
+    :arg iso_values: Contour values.
+    :type iso_values: list
+    :arg name: Name of the new mesh.
+    :type name: str
+    :arg mask_iso: Remove the vertices with lower weight (optional).
+    :type mask_iso: float
+    :return: New mesh, weight values and membership of its vertices.
+    :rtype: tuple
+    """
+    vertices = get_vertices_numpy(me0)
+    n_verts0 = len(vertices)
+    loops_vert = get_attribute_numpy(me0.loops, 'vertex_index').astype('int')
+    loop_total = get_attribute_numpy(me0.polygons, 'loop_total').astype('int')
+    n_loops = len(loops_vert)
+    uv_names = [uv.name for uv in me0.uv_layers]
+    loops_data = [np.zeros((n_loops,0))]
+    for uv in me0.uv_layers:
+        loops_data.append(get_attribute_numpy(uv.data, 'uv', mult=2, size=n_loops))
+    corner_names, corner_types, corner_data = get_attributes_numpy(me0, 'CORNER', exclude=uv_names)
+    loops_data.append(corner_data)
+    loops_data = np.concatenate(loops_data, axis=1)
+    face_names, face_types, face_data = get_attributes_numpy(me0, 'FACE',
+        exclude=('material_index', 'sharp_face'))
+    polygons_data = np.concatenate((
+        get_attribute_numpy(me0.polygons, 'material_index')[:,None],
+        get_attribute_numpy(me0.polygons, 'use_smooth')[:,None],
+        face_data), axis=1)
+    point_names, point_types, point_data = get_attributes_numpy(me0, 'POINT', exclude=('position',))
+
+    # edges data, with seams and sharp edges first
+    edges0 = get_edges_numpy(me0)
+    edge_names, edge_types, edge_data = get_attributes_numpy(me0, 'EDGE', exclude=('sharp_edge',))
+    edges_data = np.concatenate((
+        get_attribute_numpy(me0.edges, 'use_seam')[:,None],
+        get_attribute_numpy(me0.edges, 'use_edge_sharp')[:,None],
+        edge_data), axis=1)
+    loops_edge = get_attribute_numpy(me0.loops, 'edge_index').astype('int')
+    loose_edges = edges0[np.bincount(loops_edge, minlength=len(edges0)) == 0]
+
+    n_groups = len(weights)
+    verts_data = np.concatenate((weights.T, members.T, point_data), axis=1)
+    vertices, weight, loops_vert, loop_total, verts_data, loops_data, polygons_data, verts_edge = \
+        slice_mesh_numpy(vertices, weights[group_id], loops_vert, loop_total,
+        iso_values, verts_data, loops_data, polygons_data)
+    weights = verts_data[:,:n_groups].T
+    members = verts_data[:,n_groups:n_groups*2].T > 0
+    point_data = verts_data[:,n_groups*2:]
+    # new vertices have the exact iso value
+    weights[group_id] = weight
+
+    verts_index = np.arange(len(vertices))
+    if mask_iso is not None:
+        keep = weight >= mask_iso
+        loops_face = np.repeat(np.arange(len(loop_total)), loop_total)
+        keep_faces = np.bincount(loops_face, weights=~keep[loops_vert],
+            minlength=len(loop_total)) == 0
+        keep_loops = keep_faces[loops_face]
+        verts_map = np.cumsum(keep) - 1
+        loops_vert = verts_map[loops_vert[keep_loops]]
+        loops_data = loops_data[keep_loops]
+        loop_total = loop_total[keep_faces]
+        polygons_data = polygons_data[keep_faces]
+        loose_edges = verts_map[loose_edges[np.all(keep[loose_edges], axis=1)]]
+        vertices = vertices[keep]
+        weights = weights[:,keep]
+        members = members[:,keep]
+        point_data = point_data[keep]
+        verts_index = verts_index[keep]
+
+    me = mesh_from_loops_numpy(name, vertices, loops_vert, loop_total, edges=loose_edges)
+    for i, uv_name in enumerate(uv_names):
+        uv = me.uv_layers.new(name=uv_name)
+        uv.data.foreach_set('uv', loops_data[:,i*2:i*2+2].reshape((-1)))
+    set_attributes_numpy(me, 'CORNER', corner_names, corner_types, loops_data[:,len(uv_names)*2:])
+    set_attributes_numpy(me, 'POINT', point_names, point_types, point_data)
+    for mat in me0.materials: me.materials.append(mat)
+    me.polygons.foreach_set('material_index', polygons_data[:,0].astype('int'))
+    me.polygons.foreach_set('use_smooth', polygons_data[:,1].astype('bool'))
+    set_attributes_numpy(me, 'FACE', face_names, face_types, polygons_data[:,2:])
+
+    # the edges lying on a source edge inherit its data
+    edges = get_edges_numpy(me)
+    edges_source = verts_edge[verts_index[edges]].reshape((-1,4))
+    lo = np.min(edges_source, axis=1)
+    hi = np.max(edges_source, axis=1)
+    new_edges_data = np.zeros((len(edges), edges_data.shape[1]))
+    if len(edges0) > 0:
+        keys0 = np.min(edges0, axis=1)*n_verts0 + np.max(edges0, axis=1)
+        order = np.argsort(keys0)
+        keys0 = keys0[order]
+        key = lo*n_verts0 + hi
+        pos = np.clip(np.searchsorted(keys0, key), 0, len(keys0)-1)
+        on_edge = (lo != hi) & (keys0[pos] == key)
+        on_edge &= np.all((edges_source == lo[:,None]) | (edges_source == hi[:,None]), axis=1)
+        new_edges_data[on_edge] = edges_data[order[pos[on_edge]]]
+    me.edges.foreach_set('use_seam', new_edges_data[:,0].astype('bool'))
+    me.edges.foreach_set('use_edge_sharp', new_edges_data[:,1].astype('bool'))
+    set_attributes_numpy(me, 'EDGE', edge_names, edge_types, new_edges_data[:,2:])
+
+    for attr in ('active_color_name', 'default_color_name'):
+        try: setattr(me.attributes, attr, getattr(me0.attributes, attr))
+        except: pass
+    me.update()
+    return me, weights, members
 
 
 class tissue_weight_streamlines(Operator):
@@ -2518,105 +2273,23 @@ class tissue_weight_streamlines(Operator):
 
         #weight = np.array(get_weight(ob.vertex_groups.active, n_verts))
 
-        curves_pts = []
-        curves_weight = []
-
-        neigh = [[] for i in range(n_verts)]
+        # store neighbors
         if self.mode == 'EDGES':
-            # store neighbors
-            for e in me.edges:
-                ev = e.vertices
-                neigh[ev[0]].append(ev[1])
-                neigh[ev[1]].append(ev[0])
-
+            edges = get_edges_numpy(me)
+            pairs = np.unique(np.concatenate((edges, np.flip(edges, axis=1))), axis=0)
+            adj_offset = np.zeros(n_verts+1, dtype='int')
+            np.cumsum(np.bincount(pairs[:,0], minlength=n_verts), out=adj_offset[1:])
+            adj_verts = pairs[:,1]
         elif self.mode == 'VERTS':
-            # store neighbors
-            for p in me.polygons:
-                face_verts = [v for v in p.vertices]
-                n_face_verts = len(face_verts)
-                for i in range(n_face_verts):
-                    fv = face_verts.copy()
-                    neigh[fv.pop(i)] += fv
-
-        neigh_weight = [weight[n].tolist() for n in neigh]
-
-        # evaluate direction
-        next_vert = [-1]*n_verts
-
-        if self.rand_dir > 0:
-            for i in range(n_verts):
-                n = neigh[i]
-                nw = neigh_weight[i]
-                sorted_nw = neigh_weight[i].copy()
-                sorted_nw.sort()
-                for w in sorted_nw:
-                    neigh[i] = [n[nw.index(w)] for w in sorted_nw]
-        else:
-            if self.pos_steps > 0:
-                for i in range(n_verts):
-                    n = neigh[i]
-                    if len(n) == 0: continue
-                    nw = neigh_weight[i]
-                    max_w = max(nw)
-                    if self.same_weight:
-                        if max_w >= weight[i]:
-                            next_vert[i] = n[nw.index(max(nw))]
-                    else:
-                        if max_w > weight[i]:
-                            next_vert[i] = n[nw.index(max(nw))]
-
-            if self.neg_steps > 0:
-                prev_vert = [-1]*n_verts
-                for i in range(n_verts):
-                    n = neigh[i]
-                    if len(n) == 0: continue
-                    nw = neigh_weight[i]
-                    min_w = min(nw)
-                    if self.same_weight:
-                        if min_w <= weight[i]:
-                            prev_vert[i] = n[nw.index(min(nw))]
-                    else:
-                        if min_w < weight[i]:
-                            prev_vert[i] = n[nw.index(min(nw))]
-
-        co = [0]*3*n_verts
-        me.vertices.foreach_get('co', co)
-        co = np.array(co).reshape((-1,3))
+            adj_offset, adj_verts = get_polygons_graph_numpy(me)
+
+        co = get_vertices_numpy(me)
 
         # create streamlines
-        curves = []
-        for i in seeds:
-            next_pts = [i]
-            for j in range(self.pos_steps):
-                if self.rand_dir > 0:
-                    n = neigh[next_pts[-1]]
-                    if len(n) == 0: break
-                    next = n[int((len(n)-1) * (1-random.random() * self.rand_dir))]
-                else:
-                    next = next_vert[next_pts[-1]]
-                if next > 0:
-                    if next not in next_pts: next_pts.append(next)
-                else: break
-
-            prev_pts = [i]
-            for j in range(self.neg_steps):
-                if self.rand_dir > 0:
-                    n = neigh[prev_pts[-1]]
-                    if len(n) == 0: break
-                    prev = n[int(len(n) * random.random() * self.rand_dir)]
-                else:
-                    prev = prev_vert[prev_pts[-1]]
-                if prev > 0:
-                    if prev not in prev_pts:
-                        prev_pts.append(prev)
-                else: break
-
-            next_pts = np.array(next_pts).astype('int')
-            prev_pts = np.flip(prev_pts[1:]).astype('int')
-            all_pts = np.concatenate((prev_pts, next_pts))
-            if len(all_pts) > 1:
-                curves.append(all_pts)
-        crv = nurbs_from_vertices(curves, co, bevel_weight, ob.name + '_Streamlines', True, self.interpolation)
+        curves, curve_start = find_streamlines(weight, adj_offset, adj_verts,
+            seeds, self.pos_steps, self.neg_steps, self.same_weight, self.rand_dir)
+        crv = nurbs_from_vertices(curves, co, bevel_weight, ob.name + '_Streamlines',
+            True, self.interpolation, lengths=np.diff(curve_start))
         crv.data.bevel_depth = bevel_depth
         crv.matrix_world = ob.matrix_world
         bpy.data.objects.remove(ob)